@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive bitrate theo session: đi lên/xuống một ladder (JPEG quality, scale)
+dựa trên loss và jitter mà client báo về.
+
+Các bậc của ladder là encode settings của VideoStream, nên frame đã encode cho
+một bậc nằm trong FrameCache dùng chung và được mọi session cùng bậc dùng lại.
+"""
+from time import monotonic
+
+# (JPEG quality, scale) từ tốt nhất tới nhẹ nhất. Bậc 0 = chất lượng nguồn
+# (với file encode sẵn: gửi nguyên, không encode lại).
+DEFAULT_LADDER = (
+    (98, 1.0),
+    (85, 1.0),
+    (75, 1.0),
+    (65, 0.75),
+    (50, 0.5),
+)
+
+LOSS_HIGH = 0.02          # > 2% loss -> giảm bậc
+LOSS_LOW = 0.005          # < 0.5% loss (và jitter thấp) mới tính là ổn định
+JITTER_HIGH = 0.5         # jitter > 0.5 khoảng cách frame -> giảm bậc
+JITTER_LOW = 0.2
+STABLE_REPORTS_TO_UP = 5  # số báo cáo ổn định liên tiếp trước khi tăng bậc
+DOWN_HOLD = 2.0           # giây tối thiểu giữa 2 lần giảm (chờ tác dụng của lần trước)
+UP_HOLD = 5.0             # giây tối thiểu sau một lần đổi bậc mới được tăng
+
+
+class AbrController:
+    def __init__(self, fps, ladder=DEFAULT_LADDER, startRung=0):
+        self.ladder = ladder
+        self.rung = startRung
+        self.frameIntervalMs = 1000.0 / fps
+        self.stableReports = 0
+        self.lastSwitch = monotonic() - max(DOWN_HOLD, UP_HOLD)
+
+        # Stats
+        self.reports = 0
+        self.switchesUp = 0
+        self.switchesDown = 0
+        self.lastLoss = 0.0
+        self.lastJitterMs = 0.0
+
+    def current(self):
+        """Current (quality, scale)."""
+        return self.ladder[self.rung]
+
+    def onFeedback(self, lossFraction, jitterMs):
+        """
+        Feed one receiver report (loss fraction 0..1 and jitter in ms since the last report).
+        Returns the new (quality, scale) if the rung changed, else None.
+        """
+        self.reports += 1
+        self.lastLoss = lossFraction
+        self.lastJitterMs = jitterMs
+        now = monotonic()
+        jitterRatio = jitterMs / self.frameIntervalMs
+
+        if lossFraction > LOSS_HIGH or jitterRatio > JITTER_HIGH:
+            self.stableReports = 0
+            if self.rung < len(self.ladder) - 1 and now - self.lastSwitch >= DOWN_HOLD:
+                self.rung += 1
+                self.switchesDown += 1
+                self.lastSwitch = now
+                return self.current()
+            return None
+
+        if lossFraction < LOSS_LOW and jitterRatio < JITTER_LOW:
+            self.stableReports += 1
+        else:
+            self.stableReports = 0
+
+        if (self.rung > 0 and self.stableReports >= STABLE_REPORTS_TO_UP
+                and now - self.lastSwitch >= UP_HOLD):
+            self.rung -= 1
+            self.switchesUp += 1
+            self.stableReports = 0
+            self.lastSwitch = now
+            return self.current()
+        return None
+
+    def printStats(self):
+        quality, scale = self.current()
+        print(f"  ABR rung            : {self.rung}/{len(self.ladder) - 1} (quality {quality}, scale {scale})")
+        print(f"  ABR switches        : {self.switchesDown} down / {self.switchesUp} up ({self.reports} reports)")
+        print(f"  Last feedback       : loss {self.lastLoss * 100:.2f}% / jitter {self.lastJitterMs:.1f} ms")
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Event-loop server mode: một thread, một asyncio loop cho mọi session.
+RTSP được xử lý trong Protocol.data_received, RTP được pace bằng một task/session
+thay vì 2 thread/client như ServerWorker.
+"""
+import asyncio
+import traceback
+
+from ServerWorker import ServerWorker
+from Interleaved import framedBatch, framePacket, RTCP_CHANNEL
+from RtspParser import RtspParser, RtspParseError
+
+
+class AsyncServerWorker(ServerWorker):
+    """ServerWorker whose RTSP replies and RTP pacing run on an asyncio loop."""
+
+    def __init__(self, clientInfo, loop, transport):
+        super().__init__(clientInfo)
+        self.loop = loop
+        self.transport = transport
+        self.task = None
+        # Interleaved: transport báo buffer ghi đầy (pause_writing) -> task gửi chờ tới resume_writing
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    def run(self):
+        # Không có thread nhận RTSP: loop gọi data_received
+        pass
+
+    def sendRtspReply(self, reply):
+        self.transport.write(reply)
+
+    def dropConnection(self):
+        # connection_lost -> closeSession (đã đóng thì bỏ qua)
+        self.transport.close()
+
+    def processRtspRequest(self, message):
+        super().processRtspRequest(message)
+
+        # UDP socket không được block loop
+        for name in ('rtpSocket', 'rtcpSocket'):
+            sock = self.clientInfo.get(name)
+            if sock is not None and sock.fileno() != -1 and sock.getblocking():
+                sock.setblocking(False)
+
+    def transmit(self, batch, start, end):
+        if not self.interleaved:
+            return super().transmit(batch, start, end)
+        # Transport giữ dữ liệu sau write() -> copy ra khỏi buffer header dùng lại của batch
+        self.transport.write(framedBatch(batch, start, end))
+        return end - start
+
+    def sendInterleaved(self, channel, data):
+        self.transport.write(framePacket(channel, data))
+
+    def startRtcp(self):
+        # Receiver report đọc ngay trên loop, không cần thread
+        self.loop.add_reader(self.clientInfo['rtcpSocket'].fileno(), self.readRtcp)
+
+    def readRtcp(self):
+        try:
+            data = self.clientInfo['rtcpSocket'].recv(1500)
+        except OSError:
+            return  # BlockingIOError hoặc socket đã đóng
+        self.processRtcp(data)
+
+    def closeSession(self):
+        rtcpSocket = self.clientInfo.get('rtcpSocket')
+        if not self.closed and rtcpSocket is not None and rtcpSocket.fileno() != -1:
+            self.loop.remove_reader(rtcpSocket.fileno())
+        super().closeSession()
+
+    def startStreaming(self):
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self.paceRtp())
+
+    def stopStreaming(self):
+        super().stopStreaming()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def paceRtp(self):
+        pacer = self.pacer
+        try:
+            # PAUSE kết thúc task; PLAY tạo task mới và đọc tiếp từ frame hiện tại
+            while not self.stopEvent.is_set() and not self.pauseEvent.is_set():
+                behind = pacer.framesToDrop()
+                if behind:
+                    pacer.skip(behind)
+
+                # Frame phải decode + encode (hoặc chờ pipeline) -> chạy trong executor để không chặn loop
+                if self.clientInfo['videoStream'].needsEncoding():
+                    generation, data, frameIndex = await self.loop.run_in_executor(None, self.readFrame, behind)
+                else:
+                    generation, data, frameIndex = self.readFrame(behind)
+                if not data:
+                    print("[SERVER] End of video")
+                    break
+
+                delay = pacer.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.stopEvent.is_set() or self.pauseEvent.is_set():
+                    self.heldFrame = (generation, data, frameIndex)  # gửi khi PLAY lại (nếu không seek)
+                    break
+                if generation != self.seekCount:
+                    continue  # PAUSE + seek + PLAY trong lúc chờ frame
+                pacer.advance()
+
+                await self.sendFrameAsync(data, frameIndex)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[SERVER] Send error: {e}")
+            traceback.print_exc()
+        finally:
+            # Như sendRtp khi thoát (hết video / TEARDOWN); PAUSE thì handler PAUSE đã in
+            if self.stopEvent.is_set() or not self.pauseEvent.is_set():
+                self.printServerStats()
+
+    async def sendFrameAsync(self, data, frameIndex):
+        """sendFrame() without blocking the loop while fragments are spread over the frame interval."""
+        batch = self.packetizeFrame(data, frameIndex)
+        perBurst, gap = self.pacer.spreadPlan(batch.count)
+        if gap == 0:
+            sent = self.sendPackets(batch)
+            self.sendParity(batch)
+            self.finishFrame(sent)
+            await self.writable.wait()  # backpressure (chỉ chặn ở chế độ interleaved)
+            return
+
+        sent = 0
+        burstStart = self.loop.time()
+        for i, start in enumerate(range(0, batch.count, perBurst)):
+            remaining = burstStart + i * gap - self.loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            sent += self.sendPackets(batch, start, start + perBurst)
+            await self.writable.wait()
+        self.sendParity(batch)
+        self.finishFrame(sent)
+
+
+class RtspProtocol(asyncio.Protocol):
+    def __init__(self, loop, frameCache):
+        self.loop = loop
+        self.frameCache = frameCache
+        self.worker = None
+        self.parser = RtspParser()
+
+    def connection_made(self, transport):
+        clientInfo = {}
+        clientInfo['rtspSocket'] = (transport.get_extra_info('socket'),
+                                    transport.get_extra_info('peername'))
+        clientInfo['frameCache'] = self.frameCache
+        self.worker = AsyncServerWorker(clientInfo, self.loop, transport)
+
+    def data_received(self, data):
+        try:
+            for channel, item in self.parser.feed(data):
+                if channel is None:
+                    self.worker.processRtspRequest(item)
+                elif channel == RTCP_CHANNEL:
+                    self.worker.processRtcp(item)
+        except RtspParseError as e:
+            # Không tìm lại được ranh giới message: trả 400 rồi đóng kết nối
+            print(f"[SERVER] Bad RTSP request: {e}")
+            self.worker.replyRtsp(AsyncServerWorker.BAD_REQUEST_400, 0)
+            self.worker.dropConnection()
+        except Exception as e:
+            print(f"[SERVER] Error handling RTSP request: {e}")
+            traceback.print_exc()
+
+    def pause_writing(self):
+        self.worker.writable.clear()
+
+    def resume_writing(self):
+        self.worker.writable.set()
+
+    def connection_lost(self, exc):
+        self.worker.writable.set()
+        self.worker.closeSession()
+
+
+async def reapIdleSessions():
+    """Session timeout on the loop (the threaded server uses ServerWorker.reapIdleSessions)."""
+    while True:
+        await asyncio.sleep(max(ServerWorker.sessionTimeout / 4, 1.0))
+        ServerWorker.expireIdleSessions()
+
+
+async def serve(port, frameCache=None, reusePort=False):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: RtspProtocol(loop, frameCache), '', port,
+                                      reuse_port=reusePort or None)
+    print(f"[SERVER] Event-loop mode listening on port {port}")
+    reaper = loop.create_task(reapIdleSessions()) if ServerWorker.sessionTimeout else None
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if reaper is not None:
+            reaper.cancel()
+
+
+def runAsyncServer(port, frameCache=None, reusePort=False):
+    try:
+        asyncio.run(serve(port, frameCache, reusePort))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Broadcast (live) mode: một channel cho mỗi file nguồn, dùng chung cho mọi session xem file đó.
+
+Một producer thread/channel đọc, encode và packetize mỗi frame đúng một lần rồi gửi:
+  - multicast: một lần gửi tới group của channel, mọi client đã join đều nhận;
+  - unicast fan-out: FanoutSender gửi cùng header + payload tới từng subscriber
+    (một sendmmsg/subscriber, không copy, không xử lý từng packet trong Python).
+Channel phát liên tục (hết video thì quay lại đầu); session chỉ vào/ra khỏi danh sách nhận.
+"""
+import ipaddress
+import socket
+import threading
+from random import randint
+from time import monotonic, perf_counter, time
+
+from VideoStream import VideoStream
+from FramePipeline import FramePipeline, DEFAULT_DEPTH
+from Pacer import FramePacer
+from RtpPacket import HEADER_SIZE, RTP_CLOCK_RATE, DEFAULT_MTU
+from RtpJpeg import makePacketizer, PAYLOAD_RAW
+from Rtcp import ReceiverReport, bindPortPair, buildSenderReport, parseRtcp, RTCP_INTERVAL
+from UdpBatch import BatchSender, FanoutSender
+from Fec import FecEncoder, FEC_HEADER_SIZE
+import Metrics
+import StageTimer
+
+DEFAULT_MULTICAST_PORT = 5004
+DEFAULT_MULTICAST_TTL = 1
+
+
+class BroadcastChannel:
+    """One live stream of a source, shared by every session that SETUPs that source."""
+
+    # Registry: filename -> channel (của process này)
+    channels = {}
+    channelsLock = threading.Lock()
+
+    # Multicast (Server.py --multicast-group); None = chỉ unicast fan-out
+    multicastGroup = None
+    multicastPort = DEFAULT_MULTICAST_PORT
+    multicastTtl = DEFAULT_MULTICAST_TTL
+    nextGroupIndex = 0
+
+    # FEC (Server.py --fec): parity dùng chung cho mọi người xem, 'auto' giữ tối thiểu 1 packet/frame
+    fecSetting = 0
+
+    # Payload format và MTU (Server.py --payload-format / --mtu); 'auto' không dùng được khi gửi
+    # cho nhiều người -> MTU mặc định
+    payloadFormat = PAYLOAD_RAW
+    mtu = DEFAULT_MTU
+
+    @classmethod
+    def join(cls, filename, worker, frameCache=None, batchSend=True, pipelineDepth=DEFAULT_DEPTH):
+        """Channel of filename (created on first join) with worker added as a member. Raises IOError."""
+        with cls.channelsLock:
+            channel = cls.channels.get(filename)
+            if channel is None:
+                channel = cls(filename, frameCache, batchSend, pipelineDepth)
+                cls.channels[filename] = channel
+            channel.members.add(worker)
+        return channel
+
+    def __init__(self, filename, frameCache, batchSend, pipelineDepth):
+        self.filename = filename
+        self.videoStream = VideoStream(filename, cache=frameCache)
+        self.pacer = FramePacer(self.videoStream.fps())
+        if pipelineDepth > 0 and self.videoStream.needsEncoding():
+            self.frameSource = FramePipeline(self.videoStream, pipelineDepth)
+        else:
+            self.frameSource = self.videoStream
+
+        mtu = self.mtu if self.mtu != 'auto' else DEFAULT_MTU
+        self.packetizer = makePacketizer(self.payloadFormat, randint(1, 0xFFFFFFFF), mtu,
+                                         FEC_HEADER_SIZE if self.fecSetting else 0)
+        self.rtpSeqNum = randint(0, 0xFFFF)
+        self.timestampBase = randint(0, 0xFFFFFFFF)
+        self.mediaFrames = 0  # số frame đã qua (kể cả bị pacer bỏ) -> RTP timestamp
+        self.fec = FecEncoder((self.packetizer.ssrc + 1) & 0xFFFFFFFF, self.fecSetting) if self.fecSetting else None
+
+        self.rtpSocket, self.rtcpSocket = bindPortPair()
+        self.fanout = FanoutSender(self.rtpSocket, useSendmmsg=batchSend)
+        self.group = None
+        if self.multicastGroup is not None:
+            # Mỗi channel một group (join() đang giữ channelsLock)
+            index = BroadcastChannel.nextGroupIndex
+            BroadcastChannel.nextGroupIndex += 1
+            self.group = str(ipaddress.IPv4Address(self.multicastGroup) + index)
+            for sock in (self.rtpSocket, self.rtcpSocket):
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicastTtl)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.multicastSender = BatchSender(self.rtpSocket, useSendmmsg=batchSend)
+
+        self.lock = threading.Lock()
+        self.members = set()         # session đã SETUP
+        self.targets = {}            # session unicast đang PLAY -> FanoutTarget
+        self.listeners = set()       # session multicast đang PLAY
+        self.snapshots = {}          # session đang PLAY -> counters lúc bắt đầu/lần gom stats trước
+        self.wakeEvent = threading.Event()
+        self.closed = False
+
+        # Counters của stream (một bản sao)
+        self.framesSent = 0
+        self.packetsSent = 0
+        self.bytesSent = 0
+        self.packetsDropped = 0
+        self.maxFragmentsPerFrame = 0
+        self.lastSrTime = None
+
+        threading.Thread(target=self.produce, daemon=True).start()
+        threading.Thread(target=self.recvRtcp, daemon=True).start()
+        print(f"[BROADCAST] channel {filename} on port {self.rtpSocket.getsockname()[1]}"
+              + (f", multicast {self.group}:{self.multicastPort}" if self.group else ""))
+
+    def transport(self, worker, multicast):
+        """Transport header for the SETUP reply of worker."""
+        serverPort = self.rtpSocket.getsockname()[1]
+        if multicast and self.group is not None:
+            return (f"Transport: RTP/UDP;multicast;destination={self.group};"
+                    f"port={self.multicastPort}-{self.multicastPort + 1};ttl={self.multicastTtl};"
+                    f"server_port={serverPort}-{serverPort + 1}")
+        rtpPort = int(worker.clientInfo['rtpPort'])
+        return (f"Transport: RTP/UDP;client_port={rtpPort}-{rtpPort + 1};"
+                f"server_port={serverPort}-{serverPort + 1}")
+
+    def isMulticast(self, multicastRequested):
+        return multicastRequested and self.group is not None
+
+    def play(self, worker, multicast):
+        with self.lock:
+            if worker in self.snapshots:
+                return
+            self.snapshots[worker] = self.counters()
+            if multicast:
+                self.listeners.add(worker)
+            else:
+                address = (worker.clientInfo['rtspSocket'][1][0], int(worker.clientInfo['rtpPort']))
+                self.targets[worker] = self.fanout.add(address)
+        self.wakeEvent.set()
+
+    def pause(self, worker):
+        self.collect(worker)
+        with self.lock:
+            self.snapshots.pop(worker, None)
+            self.listeners.discard(worker)
+            target = self.targets.pop(worker, None)
+        if target is not None:
+            self.fanout.remove(target)
+
+    def leave(self, worker):
+        """Remove worker; the last member to leave closes the channel."""
+        self.pause(worker)
+        with self.channelsLock:
+            self.members.discard(worker)
+            if self.members:
+                return
+            if self.channels.get(self.filename) is self:
+                del self.channels[self.filename]
+        self.close()
+
+    def close(self):
+        self.closed = True
+        self.wakeEvent.set()
+        if isinstance(self.frameSource, FramePipeline):
+            self.frameSource.stop()
+        for sock in (self.rtpSocket, self.rtcpSocket):
+            try:
+                sock.close()
+            except OSError:
+                pass
+        print(f"[BROADCAST] channel {self.filename} closed")
+
+    def counters(self):
+        return (self.framesSent, self.packetsSent, self.bytesSent)
+
+    def collect(self, worker):
+        """Credit worker with what the channel sent since its last collect (O(1) per session)."""
+        with self.lock:
+            snapshot = self.snapshots.get(worker)
+            if snapshot is None:
+                return
+            current = self.counters()
+            self.snapshots[worker] = current
+        frames, packets, octets = (c - s for c, s in zip(current, snapshot))
+        worker.addSentStats(frames, packets, octets, self.maxFragmentsPerFrame)
+
+    def produce(self):
+        pacer = self.pacer
+        source = self.frameSource
+        while not self.closed:
+            if not self.targets and not self.listeners:
+                # Không ai xem: dừng đọc/encode, đồng hồ chạy lại khi có người PLAY
+                self.wakeEvent.clear()
+                self.wakeEvent.wait(0.5)
+                pacer.reset()
+                continue
+
+            behind = pacer.framesToDrop()
+            if behind:
+                source.skipFrames(behind)
+                pacer.skip(behind)
+                self.mediaFrames += behind
+
+            data = source.nextFrame()
+            if not data:
+                # Live: hết video thì phát lại từ đầu, timestamp vẫn tăng liên tục
+                if not source.seek(0):
+                    print(f"[BROADCAST] cannot loop {self.filename}")
+                    break
+                continue
+
+            pacer.wait()
+            pacer.advance()
+            try:
+                self.sendFrame(data)
+            except OSError as e:
+                if self.closed:
+                    break
+                print(f"[BROADCAST] Send error: {e}")
+            self.mediaFrames += 1
+
+    def sendFrame(self, data):
+        start = perf_counter()
+        timestamp = self.timestampBase + round(self.mediaFrames * RTP_CLOCK_RATE / self.pacer.fps)
+        batch = self.packetizer.packetize(data, self.rtpSeqNum + 1, timestamp)
+        self.rtpSeqNum = (self.rtpSeqNum + batch.count) % 65536
+        if StageTimer.enabled:
+            StageTimer.record('packetize', start)
+            packetized = StageTimer.now()
+
+        self.sendBatch(batch)
+        if self.fec is not None:
+            parityBatch = self.fec.protect(batch)
+            if parityBatch is not None:
+                self.sendBatch(parityBatch)
+        if StageTimer.enabled:
+            StageTimer.record('send', packetized)
+
+        self.framesSent += 1
+        self.packetsSent += batch.count
+        self.bytesSent += batch.totalBytes()
+        if batch.count > self.maxFragmentsPerFrame:
+            self.maxFragmentsPerFrame = batch.count
+
+        # Counter tính theo session nhận (như unicast), histogram theo frame đã gửi
+        sessions = len(self.targets) + len(self.listeners)
+        Metrics.SEND_SECONDS.observe(perf_counter() - start)
+        Metrics.FRAMES_SENT.inc(sessions)
+        Metrics.PACKETS_SENT.inc(batch.count * sessions)
+        Metrics.BYTES_SENT.inc(batch.totalBytes() * sessions)
+        Metrics.FRAGMENTS_PER_FRAME.observe(batch.count)
+        Metrics.FRAME_BYTES.observe(batch.totalBytes())
+
+        now = monotonic()
+        if self.lastSrTime is None or now - self.lastSrTime >= RTCP_INTERVAL:
+            self.lastSrTime = now
+            self.sendSenderReports(timestamp)
+
+    def sendBatch(self, batch):
+        if self.group is not None and self.listeners:
+            sent = self.multicastSender.sendBatch(batch, (self.group, self.multicastPort))
+            self.packetsDropped += batch.count - sent
+            Metrics.PACKETS_DROPPED.inc(batch.count - sent)
+        _, dropped = self.fanout.sendBatch(batch)
+        self.packetsDropped += dropped
+        Metrics.PACKETS_DROPPED.inc(dropped)
+
+    def sendSenderReports(self, timestamp):
+        """SR to the multicast group and to every unicast subscriber (once per RTCP interval)."""
+        report = buildSenderReport(self.packetizer.ssrc, timestamp, self.packetsSent,
+                                   self.bytesSent - self.packetsSent * HEADER_SIZE)
+        with self.lock:
+            unicast = list(self.targets)
+            multicast = list(self.listeners)
+        addresses = {(w.clientInfo['rtspSocket'][1][0], w.clientInfo['rtcpPort']) for w in unicast}
+        if multicast:
+            addresses.add((self.group, self.multicastPort + 1))
+        for address in addresses:
+            try:
+                self.rtcpSocket.sendto(report, address)
+            except OSError:
+                pass
+        for worker in unicast + multicast:
+            worker.rtcpStats.srSent += 1
+
+    def recvRtcp(self):
+        self.rtcpSocket.settimeout(0.5)
+        while not self.closed:
+            try:
+                data, address = self.rtcpSocket.recvfrom(1500)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.processRtcp(data, address)
+
+    def processRtcp(self, data, address):
+        """Route receiver reports to the session they come from (by address, else by host)."""
+        worker = self.memberAt(address)
+        if worker is None:
+            return
+        arrival = time()
+        worker.lastActivity = monotonic()  # RTCP giữ session sống như request RTSP
+        for report in parseRtcp(data):
+            if not isinstance(report, ReceiverReport):
+                continue
+            for block in report.blocks:
+                if block.sourceSsrc == self.packetizer.ssrc:
+                    worker.rtcpStats.onReportBlock(block, arrival)
+
+    def memberAt(self, address):
+        with self.lock:
+            members = list(self.targets) + list(self.listeners)
+        sameHost = None
+        for worker in members:
+            host = worker.clientInfo['rtspSocket'][1][0]
+            if (host, worker.clientInfo['rtcpPort']) == address:
+                return worker
+            if host == address[0] and sameHost is None:
+                sameHost = worker
+        return sameHost
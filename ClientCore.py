@@ -0,0 +1,658 @@
+# -*- coding: utf-8 -*-
+"""
+Client RTSP/RTP không có UI: trạng thái RTSP, nhận RTP/RTCP, ghép frame, FEC/NACK và stats.
+Chạy trên một asyncio event loop (không thread riêng cho mỗi session), nên một process có
+thể giả lập hàng trăm người xem:
+
+    async def watch():
+        core = ClientCore('127.0.0.1', 8554, 0, 'movie.Mjpeg', verbose=False)
+        await core.connect()
+        await core.setup()
+        await core.play()
+        async for frame in core.frames():   # hoặc ClientCore(..., onFrame=callback)
+            ...
+        await core.teardown()
+
+Client.py (Tkinter) bọc lớp này và chạy loop trong một thread nền (BackgroundLoop).
+"""
+import asyncio
+import socket
+import struct
+import threading
+import time
+from random import randint
+
+from RtpPacket import RtpPacket
+from FrameAssembler import FrameAssembler, jpegStart
+from RtpJpeg import JpegAssembler, PAYLOAD_RFC2435
+from Rtcp import ReceptionStats, SenderReport, bindPortPair, buildNack, buildReceiverReport, parseRtcp, RTCP_INTERVAL
+from Fec import FecDecoder, FEC_PT
+from Nack import NackTracker
+from Interleaved import framePacket, INTERLEAVED_TRANSPORT, RTP_CHANNEL, RTCP_CHANNEL
+from RtspParser import RtspParser, RtspParseError, formatRequest
+import Metrics
+import StageTimer
+
+# Chờ reply RTSP tối đa chừng này giây (server bận / kết nối treo)
+DEFAULT_REPLY_TIMEOUT = 5.0
+# Session timeout giả định khi server không báo trong 'Session: <id>;timeout=<s>'
+DEFAULT_SESSION_TIMEOUT = 60
+DEFAULT_RECV_BUFFER = 1024 * 1024
+# Số frame chờ trong frames() khi bên đọc chậm; đầy thì bỏ frame cũ nhất
+DEFAULT_FRAME_QUEUE = 8
+
+
+class ClientError(RuntimeError):
+    """The RTSP connection could not be opened or was lost."""
+
+
+class _RtpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, core):
+        self.core = core
+
+    def datagram_received(self, data, address):
+        start = StageTimer.now() if StageTimer.enabled else None
+        self.core.processRtpPacket(data, time.time())
+        if start is not None:
+            StageTimer.record('reassemble', start)
+
+
+class _RtcpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, core):
+        self.core = core
+
+    def datagram_received(self, data, address):
+        self.core.processRtcp(data, address)
+
+
+class ClientCore:
+    """
+    One RTSP session. Coroutines (connect/setup/play/pause/seek/teardown) must run on the
+    loop that owns the session; complete frames go to onFrame(frame, now), to jitterBuffer
+    (if given) and to the frames() iterator.
+    rtpPort = 0 picks a free even/odd port pair (many sessions in one process).
+    """
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+
+    def __init__(self, serverAddr, serverPort, rtpPort, fileName, multicast=False, interleaved=False,
+                 fec=None, nack=False, rfc2435=False, onFrame=None, jitterBuffer=None, verbose=True,
+                 replyTimeout=DEFAULT_REPLY_TIMEOUT, recvBuffer=DEFAULT_RECV_BUFFER):
+        self.serverAddr = serverAddr
+        self.serverPort = int(serverPort)
+        self.rtpPort = int(rtpPort)
+        self.fileName = fileName
+        # Multicast: xin trong SETUP; server trả group + port trong Transport (None nếu unicast)
+        self.multicast = multicast
+        self.multicastGroup = None
+        # RTP/RTCP trong kết nối RTSP ($-framed) thay vì UDP: qua được NAT, không mất packet
+        self.interleaved = interleaved
+        # FEC xin trong SETUP ('FEC: <k>|auto'); None = theo mặc định của server
+        self.fecSetting = fec
+        # NACK: xin server gửi lại packet mất (RTCP-FB: nack trong SETUP)
+        self.nack = nack
+        # Xin payload RFC 2435 (Payload-Format: rfc2435); server xác nhận trong SETUP reply
+        self.rfc2435 = rfc2435
+        self.onFrame = onFrame
+        self.jitterBuffer = jitterBuffer
+        self.verbose = verbose
+        self.replyTimeout = replyTimeout
+        self.recvBuffer = recvBuffer
+
+        self.state = self.INIT
+        self.rtspSeq = 0
+        self.sessionId = None
+        self.pendingReplies = {}  # CSeq -> future của reply
+        self.rtspParser = RtspParser()
+        self.lastRequestTime = time.monotonic()
+        self.sessionTimeout = DEFAULT_SESSION_TIMEOUT
+        self.reader = None
+        self.writer = None
+        self.readerTask = None
+        self.rtpSocket = None
+        self.rtcpSocket = None
+        self.transports = []
+        self.rtcpTransport = None
+        self.reportTimer = None
+        self.frameQueue = None  # tạo khi frames() được dùng
+        self.closed = False
+
+        # Seek: vị trí (npt) đầu PLAY segment hiện tại
+        self.segmentStartNpt = 0.0
+
+        # Frame assembly (theo timestamp + seq, chịu được đảo thứ tự và quay vòng seq)
+        self.assembler = FrameAssembler(isFrameStart=jpegStart)
+        # Dựng lại fragment mất từ parity XOR trước khi assembler bỏ cuộc với frame
+        self.fecDecoder = FecDecoder()
+        self.nackTracker = NackTracker()
+
+        # Stats
+        self.receivedPackets = 0
+        self.receivedFrames = 0
+        self.partialFrames = 0
+        self.framesDropped = 0  # bỏ khỏi hàng đợi frames() vì bên đọc chậm
+        self.totalBytesReceived = 0
+        self.firstPacketTime = None
+        self.lastPacketTime = None
+        self.lastFrameTime = None
+        self.frameIntervals = []
+
+        # RTCP (cổng RTP + 1): receiver report về loss/jitter cho server (RTT, ABR)
+        self.serverRtcpAddr = None
+        self.ssrc = randint(1, 0xFFFFFFFF)
+        self.reception = ReceptionStats()
+
+    def log(self, text):
+        if self.verbose:
+            print(text)
+
+    @property
+    def lostPackets(self):
+        # Extended seq: đúng cả khi seq quay vòng 65535 -> 0
+        return max(0, self.reception.cumulativeLost())
+
+    # ===== RTSP =====
+
+    async def connect(self):
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.serverAddr, self.serverPort)
+        except OSError as e:
+            raise ClientError(f"connection to {self.serverAddr}:{self.serverPort} failed: {e}") from e
+        self.readerTask = asyncio.get_running_loop().create_task(self.readRtsp())
+        self.log(f"[CLIENT] Connected to {self.serverAddr}:{self.serverPort}")
+
+    async def request(self, method, extraHeaders='', body=''):
+        """Send one RTSP request; (status code, reply RtspMessage), or (None, None) if no reply came in time."""
+        if self.writer is None or self.writer.is_closing():
+            raise ClientError("RTSP connection is closed")
+        self.rtspSeq += 1
+        seq = self.rtspSeq
+        headers = [f"Session: {self.sessionId}"] if self.sessionId is not None else []
+        headers.extend(extraHeaders.split('\n'))
+        request = formatRequest(method, self.fileName, seq, headers, body)
+        future = asyncio.get_running_loop().create_future()
+        self.pendingReplies[seq] = future
+        self.writer.write(request)
+        self.lastRequestTime = time.monotonic()
+        self.log(f"\n[CLIENT] Sent:\n{request.decode(errors='replace')}")
+        try:
+            return await asyncio.wait_for(future, self.replyTimeout)
+        except asyncio.TimeoutError:
+            self.log(f"[CLIENT] No reply to {method}")
+            return None, None
+        finally:
+            self.pendingReplies.pop(seq, None)
+
+    async def readRtsp(self):
+        """Reply RTSP và (ở chế độ interleaved) packet RTP/RTCP $-framed trên cùng kết nối."""
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                now = time.time()
+                for channel, item in self.rtspParser.feed(data):
+                    if channel is None:
+                        self.onReply(item)
+                    elif channel == RTP_CHANNEL:
+                        start = StageTimer.now() if StageTimer.enabled else None
+                        self.processRtpPacket(item, now)
+                        if start is not None:
+                            StageTimer.record('reassemble', start)
+                    elif channel == RTCP_CHANNEL:
+                        self.processRtcp(item)
+        except RtspParseError as e:
+            print(f"[CLIENT] Bad RTSP reply: {e}")
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        for future in self.pendingReplies.values():
+            if not future.done():
+                future.set_result((None, None))
+
+    def onReply(self, message):
+        self.log(f"[CLIENT] Received:\n{message.text()}")
+        if not message.isReply:
+            return  # server không gửi request cho client
+        try:
+            future = self.pendingReplies.get(int(message.cseq))
+        except ValueError:
+            return
+        if future is not None and not future.done():
+            future.set_result((message.status, message))
+
+    async def setup(self):
+        if self.state != self.INIT:
+            return False
+        if self.interleaved:
+            transport = INTERLEAVED_TRANSPORT
+        else:
+            if not self.multicast:
+                # Unicast: bind trước SETUP (biết cổng khi rtpPort = 0, không lỡ packet đầu)
+                self.bindMedia()
+            elif self.rtpPort == 0:
+                # Multicast bind sau reply (group:port của server); vẫn cần cổng thật cho client_port
+                rtpSocket, rtcpSocket = bindPortPair()
+                self.rtpPort = rtpSocket.getsockname()[1]
+                rtpSocket.close()
+                rtcpSocket.close()
+            mode = "multicast; " if self.multicast else ""
+            transport = f"RTP/UDP; {mode}client_port={self.rtpPort}"
+        headers = f"Transport: {transport}\n"
+        if self.fecSetting is not None and not self.interleaved:
+            headers += f"FEC: {self.fecSetting}\n"
+        if self.nack and not self.interleaved:
+            headers += "RTCP-FB: nack\n"
+        if self.rfc2435:
+            headers += f"Payload-Format: {PAYLOAD_RFC2435}\n"
+
+        status, reply = await self.request('SETUP', headers)
+        if status == 461:
+            print("[CLIENT] Server does not support this transport (try without --tcp)")
+            return False
+        if status != 200:
+            return False
+        self.sessionId = reply.session
+        if reply.sessionTimeout:
+            self.sessionTimeout = reply.sessionTimeout
+        lines = reply.lines
+
+        self.state = self.READY
+        self.parsePayloadFormat(lines)
+        if self.interleaved:
+            self.log("[CLIENT] RTP/RTCP interleaved on the RTSP connection")
+        else:
+            self.parseServerPorts(lines)
+            self.parseMulticast(lines)
+            self.parseFec(lines)
+            if self.rtpSocket is None:
+                self.bindMedia()
+            await self.startMedia()
+        self.startReports()
+        self.log("[CLIENT] State -> READY")
+        return True
+
+    async def play(self, npt=None):
+        """PLAY (from npt seconds if given); True once the server has started streaming."""
+        if self.state != self.READY:
+            return False
+        # Reset trước khi gửi PLAY: packet đầu tiên có thể đến trước reply
+        self.assembler.reset()
+        self.fecDecoder.reset()
+        self.nackTracker.reset()
+        if self.jitterBuffer is not None:
+            self.jitterBuffer.reset()
+        status, reply = await self.request('PLAY', f"Range: npt={npt:.3f}-\n" if npt is not None else '')
+        if status == 457:
+            # Tua quá cuối video: server không đổi vị trí -> phát tiếp từ chỗ cũ
+            self.log("[CLIENT] Seek out of range, resuming")
+            return await self.play()
+        if status != 200:
+            return False
+        self.state = self.PLAYING
+        self.parseRange(reply.lines)
+        self.lastFrameTime = None
+        self.frameIntervals.clear()
+        self.log("[CLIENT] State -> PLAYING")
+        return True
+
+    async def pause(self):
+        if self.state != self.PLAYING:
+            return False
+        status, _ = await self.request('PAUSE')
+        if status != 200:
+            return False
+        self.lastFrameTime = None
+        self.state = self.READY
+        self.log("[CLIENT] State -> READY")
+        return True
+
+    async def seek(self, npt):
+        """Jump to npt seconds: PAUSE if playing, then PLAY with 'Range: npt=<target>-'."""
+        if self.state not in (self.READY, self.PLAYING):
+            return False
+        npt = max(0.0, npt)
+        self.log(f"[CLIENT] Seek to {npt:.3f}s")
+        if self.state == self.PLAYING and not await self.pause():
+            return False
+        return await self.play(npt)
+
+    async def teardown(self):
+        """TEARDOWN the session (if any) and close every socket."""
+        if self.state != self.INIT and self.writer is not None and not self.writer.is_closing():
+            status, _ = await self.request('TEARDOWN')
+            if status == 200:
+                self.log("[CLIENT] State -> INIT")
+        self.state = self.INIT
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.reportTimer is not None:
+            self.reportTimer.cancel()
+        for transport in self.transports:
+            transport.close()
+        if not self.transports:
+            for sock in (self.rtpSocket, self.rtcpSocket):
+                if sock is not None:
+                    sock.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.readerTask is not None:
+            self.readerTask.cancel()
+        if self.frameQueue is not None:
+            self.enqueue(None)
+
+    def parseRange(self, lines):
+        """Start of the PLAY segment from 'Range: npt=<start>-' (where the server actually seeked to)."""
+        for line in lines:
+            if line.startswith('Range') and 'npt=' in line:
+                try:
+                    self.segmentStartNpt = float(line.split('npt=')[1].split('-')[0])
+                except ValueError:
+                    pass
+
+    def parseServerPorts(self, lines):
+        """RTCP address of the server from 'Transport: ...;server_port=rtp-rtcp'."""
+        for line in lines:
+            if line.startswith('Transport') and 'server_port=' in line:
+                ports = line.split('server_port=')[1].split(';')[0].strip().split('-')
+                try:
+                    rtcpPort = int(ports[1]) if len(ports) > 1 else int(ports[0]) + 1
+                except ValueError:
+                    return
+                self.serverRtcpAddr = (self.serverAddr, rtcpPort)
+
+    def parseMulticast(self, lines):
+        """Group and port from 'Transport: ...;multicast;destination=G;port=p-q' (RTP/RTCP then go to G:p, G:p+1)."""
+        for line in lines:
+            if line.startswith('Transport') and 'multicast' in line and 'destination=' in line:
+                try:
+                    self.multicastGroup = line.split('destination=')[1].split(';')[0].strip()
+                    self.rtpPort = int(line.split(';port=')[1].split('-')[0].split(';')[0])
+                except (IndexError, ValueError):
+                    self.multicastGroup = None
+                    return
+                self.log(f"[CLIENT] Multicast group {self.multicastGroup}:{self.rtpPort}")
+
+    def parsePayloadFormat(self, lines):
+        """RFC 2435 payload (confirmed by the server, or forced by a live channel): assemble by fragment offset."""
+        for line in lines:
+            if line.lower().startswith('payload-format:') and line.split(':', 1)[1].strip().lower() == PAYLOAD_RFC2435:
+                self.assembler = JpegAssembler()
+                self.log("[CLIENT] RTP/JPEG payload (RFC 2435)")
+
+    def parseFec(self, lines):
+        for line in lines:
+            if line.lower().startswith('fec:'):
+                self.fecDecoder.active = True
+                self.log(f"[CLIENT] FEC {line.split(':', 1)[1].strip()}")
+            elif line.lower().startswith('rtcp-fb:') and 'nack' in line.lower():
+                self.nackTracker.active = True
+                self.log("[CLIENT] NACK retransmission enabled")
+
+    # ===== RTP / RTCP sockets =====
+
+    def bindMedia(self):
+        """RTP socket on rtpPort and RTCP on rtpPort + 1 (a free pair if rtpPort is 0)."""
+        if self.rtpPort == 0 and self.multicastGroup is None:
+            self.rtpSocket, self.rtcpSocket = bindPortPair()
+            self.rtpPort = self.rtpSocket.getsockname()[1]
+        else:
+            self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.bindMediaSocket(self.rtpSocket, self.rtpPort)
+            try:
+                self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.bindMediaSocket(self.rtcpSocket, self.rtpPort + 1)
+            except OSError as e:
+                # Không có RTCP vẫn xem được, chỉ server không nhận được feedback
+                print(f"[WARN] Failed to open RTCP port {self.rtpPort + 1}: {e}")
+                self.rtcpSocket.close()
+                self.rtcpSocket = None
+        self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recvBuffer)
+        self.log(f"[CLIENT] RTP socket on port {self.rtpPort}")
+
+    def bindMediaSocket(self, sock, port):
+        if self.multicastGroup is None:
+            sock.bind(('', port))
+            return
+        # Nhiều client trên cùng máy cùng nghe group:port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', port))
+        membership = struct.pack('4s4s', socket.inet_aton(self.multicastGroup), socket.inet_aton('0.0.0.0'))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+    async def startMedia(self):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _RtpProtocol(self), sock=self.rtpSocket)
+        self.transports.append(transport)
+        if self.rtcpSocket is not None:
+            transport, _ = await loop.create_datagram_endpoint(lambda: _RtcpProtocol(self), sock=self.rtcpSocket)
+            self.transports.append(transport)
+            self.rtcpTransport = transport
+
+    def startReports(self):
+        self.reportTimer = asyncio.get_running_loop().call_later(RTCP_INTERVAL, self.onReportTimer)
+
+    def onReportTimer(self):
+        if self.closed:
+            return
+        if self.state == self.PLAYING:
+            self.sendReceiverReport()
+        if self.state != self.INIT and time.monotonic() - self.lastRequestTime > self.sessionTimeout / 2:
+            # Keep-alive: server đóng session không có request trong sessionTimeout giây
+            asyncio.get_running_loop().create_task(self.keepAlive())
+        self.startReports()
+
+    async def keepAlive(self):
+        try:
+            await self.request('GET_PARAMETER')
+        except ClientError:
+            pass
+
+    def processRtcp(self, data, address=None):
+        for report in parseRtcp(data):
+            if isinstance(report, SenderReport):
+                self.reception.onSenderReport(report)
+                if self.serverRtcpAddr is None and address is not None:
+                    self.serverRtcpAddr = address
+
+    def sendRtcp(self, data):
+        if self.interleaved:
+            self.writer.write(framePacket(RTCP_CHANNEL, data))
+        elif self.serverRtcpAddr is not None and self.rtcpTransport is not None:
+            self.rtcpTransport.sendto(data, self.serverRtcpAddr)
+
+    def sendReceiverReport(self):
+        block = self.reception.makeBlock()
+        if block is None:
+            return
+        self.sendRtcp(buildReceiverReport(self.ssrc, block))
+
+    def sendNack(self, mediaSsrc, seqs):
+        self.sendRtcp(buildNack(self.ssrc, mediaSsrc, seqs))
+
+    # ===== Nhận frame =====
+
+    def processRtpPacket(self, data, now):
+        """One RTP packet (from the UDP socket or channel 0 of the RTSP connection)."""
+        self.totalBytesReceived += len(data)
+        Metrics.BYTES_RECEIVED.inc(len(data))
+
+        if self.firstPacketTime is None:
+            self.firstPacketTime = now
+        self.lastPacketTime = now
+
+        rtpPacket = RtpPacket()
+        rtpPacket.decode(data)
+
+        if rtpPacket.payloadType() == FEC_PT:
+            # Stream parity: seq/SSRC riêng, không tính vào loss của stream media
+            for fragment in self.fecDecoder.onParity(rtpPacket.timestamp(), rtpPacket.getPayload()):
+                self.nackTracker.discard(fragment[0])
+                self.pushFragment(*fragment, now)
+            return
+
+        receivedSeqNum = rtpPacket.seqNum()
+        marker = rtpPacket.getMarker()
+        payload = rtpPacket.getPayload()
+
+        self.receivedPackets += 1
+        Metrics.PACKETS_RECEIVED.inc()
+        self.reception.onPacket(rtpPacket.ssrc(), receivedSeqNum, rtpPacket.timestamp(), now)
+
+        if self.verbose:
+            if receivedSeqNum % 2000 == 0:
+                print(f"[RTP] Seq={receivedSeqNum}, marker={marker}")
+            if marker == 1 and (self.receivedFrames % 20 == 0):
+                print(f"[RTP] EndFrame at seq={receivedSeqNum} (marker=1)")
+
+        if self.nackTracker.active:
+            nacks = self.nackTracker.onPacket(receivedSeqNum, now)
+            if nacks:
+                self.sendNack(rtpPacket.ssrc(), nacks)
+
+        recovered = self.fecDecoder.onMedia(receivedSeqNum, rtpPacket.timestamp(), payload)
+        self.pushFragment(receivedSeqNum, rtpPacket.timestamp(), marker, payload, now)
+        for fragment in recovered:
+            self.nackTracker.discard(fragment[0])
+            self.pushFragment(*fragment, now)
+
+    def pushFragment(self, seq, timestamp, marker, payload, now):
+        for frame in self.assembler.push(seq, timestamp, marker, payload):
+            self.onAssembled(frame, now)
+
+    def onAssembled(self, frame, now):
+        """A frame handed out by the assembler (in timestamp order)."""
+        if not frame.complete:
+            # Thiếu fragment: JPEG không giải mã được, chỉ đếm
+            self.partialFrames += 1
+            Metrics.FRAMES_PARTIAL.inc()
+            if self.verbose and self.partialFrames % 20 == 1:
+                print(f"[RTP] Partial frame ts={frame.timestamp}: {frame.packets} fragments, {frame.missing} missing")
+            return
+
+        self.receivedFrames += 1
+        Metrics.FRAMES_COMPLETE.inc()
+
+        # Track frame intervals for jitter
+        if self.lastFrameTime is not None:
+            self.frameIntervals.append(now - self.lastFrameTime)
+            Metrics.FRAME_INTERVAL.observe(now - self.lastFrameTime)
+        self.lastFrameTime = now
+
+        if self.jitterBuffer is not None:
+            self.jitterBuffer.put(frame.timestamp, frame.data)
+        if self.onFrame is not None:
+            self.onFrame(frame, now)
+        if self.frameQueue is not None:
+            self.enqueue(frame)
+
+    def enqueue(self, frame):
+        if self.frameQueue.full():
+            self.frameQueue.get_nowait()
+            self.framesDropped += 1
+        self.frameQueue.put_nowait(frame)
+
+    async def frames(self, queueSize=DEFAULT_FRAME_QUEUE):
+        """Complete frames (AssembledFrame) as they arrive, until the session is closed."""
+        if self.frameQueue is None:
+            self.frameQueue = asyncio.Queue(queueSize)
+        while True:
+            frame = await self.frameQueue.get()
+            if frame is None:
+                return
+            yield frame
+
+    def latency(self, timestamp, now=None):
+        """Seconds since the frame's send deadline (server clock from RTCP SR); None before the first SR."""
+        sentAt = self.reception.wallClock(timestamp)
+        if sentAt is None:
+            return None
+        return max(0.0, (time.time() if now is None else now) - sentAt)
+
+    # ===== Stats =====
+
+    def stats(self):
+        if self.firstPacketTime and self.lastPacketTime:
+            duration = max(self.lastPacketTime - self.firstPacketTime, 1e-6)
+        else:
+            duration = 0.0
+        lost = self.lostPackets
+        total = self.receivedPackets + lost
+        if len(self.frameIntervals) > 1:
+            mean = sum(self.frameIntervals) / len(self.frameIntervals)
+            variance = sum((x - mean) ** 2 for x in self.frameIntervals) / len(self.frameIntervals)
+            frameJitterMs = (variance ** 0.5) * 1000
+        else:
+            frameJitterMs = 0.0
+        return {
+            'receivedPackets': self.receivedPackets,
+            'lostPackets': lost,
+            'lossRate': (lost * 100.0 / total) if total > 0 else 0.0,
+            'duration': duration,
+            'throughputMbps': (self.totalBytesReceived * 8) / duration / 1_000_000 if duration else 0.0,
+            'bytesReceived': self.totalBytesReceived,
+            'framesReceived': self.receivedFrames,
+            'framesPartial': self.partialFrames,
+            'framesDropped': self.framesDropped,
+            'fps': self.receivedFrames / duration if duration else 0.0,
+            'frameJitterMs': frameJitterMs,
+            'rtpJitterMs': self.reception.jitterMs(),
+            'assembler': self.assembler.stats(),
+            'nack': self.nackTracker.stats(),
+            'fec': self.fecDecoder.stats(),
+        }
+
+    def printStats(self):
+        s = self.stats()
+        print("\n========== CLIENT STATS ==========")
+        print(f"Received packets     : {s['receivedPackets']}")
+        print(f"Lost packets         : {s['lostPackets']}")
+        print(f"Loss rate            : {s['lossRate']:.2f}%")
+        print(f"Duration             : {s['duration']:.2f}s")
+        print(f"Throughput           : {s['throughputMbps']:.2f} Mbps")
+        print(f"Total bytes received : {s['bytesReceived']}")
+        print(f"Received frames      : {s['framesReceived']}")
+        a = s['assembler']
+        print(f"Partial frames       : {s['framesPartial']} ({a['packetsMissing']} fragments missing)")
+        print(f"Reordered / late     : {a['packetsReordered']} / {a['packetsLate']} packets")
+        nack = s['nack']
+        if self.nackTracker.active:
+            print(f"NACK                 : {nack['requested']} requested, {nack['recovered']} recovered, "
+                  f"{nack['unrecovered']} unrecovered")
+        fec = s['fec']
+        if fec['parityReceived']:
+            print(f"FEC recovered        : {fec['packetsRecovered']} packets, {fec['framesRepaired']} frames "
+                  f"({fec['parityReceived']} parity packets)")
+        if self.jitterBuffer is not None:
+            jb = self.jitterBuffer.stats()
+            print(f"Jitter buffer        : {jb['mode']}, playout delay {jb['playoutDelayMs']:.1f} ms "
+                  f"(target {jb['targetDelayMs']:.1f} ms)")
+            print(f"Late drops           : {jb['lateDrops']}")
+            print(f"Underruns            : {jb['underruns']}")
+            print(f"Playout resyncs      : {jb['resyncs']}")
+        if s['framesDropped']:
+            print(f"Dropped (slow reader): {s['framesDropped']}")
+        print(f"Playback FPS         : {s['fps']:.2f}")
+        print(f"Jitter (frame)       : {s['frameJitterMs']:.2f} ms")
+        print(f"Jitter (RTP, RFC3550): {s['rtpJitterMs']:.2f} ms")
+        print(f"Lost (RTCP)          : {self.reception.cumulativeLost()}")
+
+
+class BackgroundLoop:
+    """An asyncio loop on a daemon thread, for callers that are not async (the Tk client)."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='client-loop', daemon=True)
+        self.thread.start()
+
+    def call(self, coro, timeout=None):
+        """Run coro on the loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
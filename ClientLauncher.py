@@ -1,21 +1,129 @@
-import sys
-from tkinter import Tk
-from Client import Client
-
-if __name__ == "__main__":
-    try:
-        serverAddr = sys.argv[1]
-        serverPort = sys.argv[2]
-        rtpPort    = sys.argv[3]
-        fileName   = sys.argv[4]
-    except:
-        print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file]\n")
-        sys.exit(0)
-
-    root = Tk()
-    root.title("RTPClient")
-
-    # Truyền root trực tiếp vào Client
-    app = Client(root, serverAddr, serverPort, rtpPort, fileName)
-
+import sys
+import asyncio
+import time
+from ClientCore import ClientCore
+import Metrics
+import StageTimer
+
+# Số viewer được connect + SETUP cùng lúc (server listen với backlog nhỏ)
+SETUP_CONCURRENCY = 4
+
+
+async def watch(core, duration, setupSlots):
+    """One headless viewer: SETUP, PLAY, count frames for duration seconds, TEARDOWN."""
+    try:
+        async with setupSlots:
+            await core.connect()
+            ready = await core.setup()
+        if not ready or not await core.play():
+            print(f"[CLIENT] Viewer on port {core.rtpPort}: {'PLAY' if core.state else 'SETUP'} failed")
+            core.close()
+            return False
+
+        async def consume():
+            async for frame in core.frames():
+                latency = core.latency(frame.timestamp)
+                if latency is not None:
+                    Metrics.LATENCY.observe(latency)
+
+        try:
+            await asyncio.wait_for(consume(), duration)
+        except asyncio.TimeoutError:
+            pass
+        await core.teardown()
+        return True
+    except Exception as e:
+        print(f"[CLIENT] Viewer failed: {e}")
+        core.close()
+        return False
+
+
+async def runHeadless(cores, duration):
+    started = time.time()
+    setupSlots = asyncio.Semaphore(SETUP_CONCURRENCY)
+    results = await asyncio.gather(*(watch(core, duration, setupSlots) for core in cores))
+    elapsed = time.time() - started
+
+    if len(cores) == 1:
+        cores[0].printStats()
+    else:
+        stats = [core.stats() for core in cores]
+        received = sum(s['receivedPackets'] for s in stats)
+        lost = sum(s['lostPackets'] for s in stats)
+        fps = [s['fps'] for s in stats]
+        print(f"\n========== {len(cores)} HEADLESS VIEWERS ==========")
+        print(f"Sessions played      : {sum(results)}/{len(cores)} in {elapsed:.1f}s")
+        print(f"Received packets     : {received}")
+        print(f"Loss rate            : {(lost * 100.0 / (received + lost)) if received + lost else 0.0:.2f}%")
+        print(f"Received frames      : {sum(s['framesReceived'] for s in stats)} "
+              f"({sum(s['framesPartial'] for s in stats)} partial)")
+        print(f"Throughput (total)   : {sum(s['throughputMbps'] for s in stats):.2f} Mbps")
+        print(f"FPS per viewer       : {min(fps):.1f} min, {sum(fps) / len(fps):.1f} mean, {max(fps):.1f} max")
+    latency = Metrics.LATENCY.summary()
+    if latency['count']:
+        print(f"End-to-end latency   : {latency['meanMs']:.1f} ms mean, {latency['p99Ms']:.1f} ms p99")
+    StageTimer.printStats()
+    print("=================================\n")
+
+if __name__ == "__main__":
+    try:
+        serverAddr = sys.argv[1]
+        serverPort = sys.argv[2]
+        rtpPort    = sys.argv[3]
+        fileName   = sys.argv[4]
+    except:
+        print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file [--cache-frames] [--low-latency] [--multicast] [--tcp] [--fec K|auto] [--nack] [--rfc2435] [--metrics-port N] [--profile-stages] [--headless [--viewers N] [--duration S]]]\n")
+        sys.exit(0)
+
+    # Mặc định frame chỉ nằm trong RAM; --cache-frames ghi thêm cache-*.jpg ra đĩa
+    cacheFrames = '--cache-frames' in sys.argv[5:]
+    # Jitter buffer vài chục ms thay vì ~100 ms trở lên
+    lowLatency = '--low-latency' in sys.argv[5:]
+    # Server chạy --broadcast --multicast-group: nhận stream qua multicast group thay vì unicast
+    multicast = '--multicast' in sys.argv[5:]
+    # RTP/RTCP interleaved trên kết nối RTSP (khi UDP bị chặn/rớt nhiều)
+    interleaved = '--tcp' in sys.argv[5:]
+    # Xin server gửi lại packet mất (hợp với link RTT thấp)
+    nack = '--nack' in sys.argv[5:]
+    # Payload RTP/JPEG chuẩn (RFC 2435) thay vì JPEG nguyên file cắt nhỏ
+    rfc2435 = '--rfc2435' in sys.argv[5:]
+    # Số packet parity XOR mỗi frame (hoặc auto theo loss); mặc định theo server
+    fec = None
+    if '--fec' in sys.argv[5:-1]:
+        fec = sys.argv[sys.argv.index('--fec') + 1]
+    # Đo thời gian reassemble / decode / display (in ra khi TEARDOWN, xuất qua --metrics-port)
+    if '--profile-stages' in sys.argv[5:]:
+        StageTimer.enable(StageTimer.CLIENT_STAGES, Metrics.CLIENT_REGISTRY)
+    # Prometheus metrics của client (packet/frame nhận, khoảng cách giữa các frame)
+    if '--metrics-port' in sys.argv[5:-1]:
+        try:
+            Metrics.startMetricsServer(int(sys.argv[sys.argv.index('--metrics-port') + 1]), registry=Metrics.CLIENT_REGISTRY)
+        except (ValueError, OSError) as e:
+            print(f"[CLIENT] Metrics endpoint not started: {e}")
+
+    # Không có Tk: N người xem trên một asyncio loop (tạo tải, tự động hoá)
+    if '--headless' in sys.argv[5:]:
+        viewers = 1
+        if '--viewers' in sys.argv[5:-1]:
+            viewers = int(sys.argv[sys.argv.index('--viewers') + 1])
+        duration = 10.0
+        if '--duration' in sys.argv[5:-1]:
+            duration = float(sys.argv[sys.argv.index('--duration') + 1])
+        # Nhiều viewer unicast: mỗi viewer một cặp cổng trống (multicast dùng chung group:port)
+        port = 0 if viewers > 1 and not multicast and not interleaved else rtpPort
+        cores = [ClientCore(serverAddr, serverPort, port, fileName, multicast=multicast, interleaved=interleaved,
+                            fec=fec, nack=nack, rfc2435=rfc2435, verbose=viewers == 1)
+                 for _ in range(viewers)]
+        asyncio.run(runHeadless(cores, duration))
+        sys.exit(0)
+
+    from tkinter import Tk
+    from Client import Client
+
+    root = Tk()
+    root.title("RTPClient")
+
+    # Truyền root trực tiếp vào Client
+    app = Client(root, serverAddr, serverPort, rtpPort, fileName, cacheFrames, lowLatency, multicast, interleaved, fec, nack, rfc2435)
+
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Backend encode JPEG cho VideoStream (chọn bằng Server.py --encoder).
+
+- opencv: cv2.imencode (mặc định, như trước).
+- turbojpeg: libjpeg-turbo qua API TurboJPEG (ctypes, không cần package Python): SIMD,
+  tùy chọn fast DCT và chroma subsampling, mỗi thread encode một handle + một output
+  buffer cấp sẵn theo tjBufSize (TJFLAG_NOREALLOC) -> không malloc/free mỗi frame.
+- passthrough: nguồn đã là MJPEG (.mjpx / movie.Mjpeg / video codec MJPG) -> gửi nguyên
+  frame JPEG của nguồn, không decode/encode (bỏ qua các bậc ABR).
+"""
+import ctypes
+import ctypes.util
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+from RtpJpeg import STANDARD_DHT
+
+ENCODER_NAMES = ('opencv', 'turbojpeg', 'passthrough', 'auto')
+SUBSAMPLINGS = ('444', '422', '420')
+
+# TurboJPEG (turbojpeg.h)
+_TJPF_BGR = 1
+_TJSAMP = {'444': 0, '422': 1, '420': 2}
+_TJFLAG_NOREALLOC = 1024
+_TJFLAG_FASTDCT = 2048
+
+_CV_SAMPLING = {
+    '444': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+    '422': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+    '420': 'IMWRITE_JPEG_SAMPLING_FACTOR_420',
+}
+
+
+class EncoderError(RuntimeError):
+    """An encoder backend is not available here (library missing, unsupported option)."""
+
+
+class JpegEncoder:
+    """encode(image, quality) -> JPEG bytes (or None) for a BGR uint8 image; thread-safe."""
+    name = None
+    # True: VideoStream gửi nguyên frame JPEG của nguồn MJPEG, không gọi encode()
+    passthrough = False
+
+    def encode(self, image, quality):
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+
+class OpenCvEncoder(JpegEncoder):
+    name = 'opencv'
+
+    def __init__(self, subsampling=None):
+        self.subsampling = subsampling
+        self.extraParams = []
+        if subsampling is not None:
+            flag = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR', None)
+            value = getattr(cv2, _CV_SAMPLING[subsampling], None)
+            if flag is None or value is None:
+                raise EncoderError("this OpenCV build cannot choose the JPEG chroma subsampling")
+            self.extraParams = [int(flag), int(value)]
+
+    def encode(self, image, quality):
+        # cv2.imencode nhả GIL -> encode song song được trên thread pool
+        success, jpeg = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), quality] + self.extraParams)
+        if not success:
+            return None
+        return jpeg.tobytes()
+
+    def describe(self):
+        return f"opencv ({self.subsampling or 'default'} subsampling)"
+
+
+def loadTurboJpeg(path=None):
+    """ctypes handle on libturbojpeg (path, or found on the library path); None if unavailable."""
+    candidates = [path] if path else [ctypes.util.find_library('turbojpeg'), 'libturbojpeg.so.0',
+                                      'libturbojpeg.dylib', 'turbojpeg.dll']
+    for name in candidates:
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+            lib.tjInitCompress
+        except (OSError, AttributeError):
+            continue
+        lib.tjInitCompress.argtypes = []
+        lib.tjInitCompress.restype = ctypes.c_void_p
+        lib.tjCompress2.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                    ctypes.c_int, ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_ulong),
+                                    ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.tjCompress2.restype = ctypes.c_int
+        lib.tjBufSize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.tjBufSize.restype = ctypes.c_ulong
+        lib.tjDestroy.argtypes = [ctypes.c_void_p]
+        lib.tjDestroy.restype = ctypes.c_int
+        lib.tjGetErrorStr.argtypes = []
+        lib.tjGetErrorStr.restype = ctypes.c_char_p
+        return lib
+    return None
+
+
+class _TurboState:
+    """Per-thread TurboJPEG handle and output buffer (a handle must not be shared across threads)."""
+    __slots__ = ('handle', 'buf', 'size', 'bufPtr', 'jpegSize')
+
+    def __init__(self, lib):
+        self.handle = lib.tjInitCompress()
+        if not self.handle:
+            raise EncoderError("tjInitCompress failed")
+        self.buf = None
+        self.size = 0
+        self.bufPtr = ctypes.c_void_p()
+        self.jpegSize = ctypes.c_ulong()
+
+
+class TurboJpegEncoder(JpegEncoder):
+    name = 'turbojpeg'
+
+    def __init__(self, subsampling='420', fastDct=True, libraryPath=None):
+        self.lib = loadTurboJpeg(libraryPath)
+        if self.lib is None:
+            raise EncoderError("libturbojpeg not found (install libjpeg-turbo or pass --turbojpeg-lib)")
+        self.subsampling = subsampling or '420'
+        self.sampling = _TJSAMP[self.subsampling]
+        self.flags = _TJFLAG_NOREALLOC | (_TJFLAG_FASTDCT if fastDct else 0)
+        self.fastDct = fastDct
+        self.local = threading.local()
+        self.states = []  # để close() giải phóng handle của mọi thread
+        self.statesLock = threading.Lock()
+
+    def state(self):
+        state = getattr(self.local, 'state', None)
+        if state is None:
+            state = self.local.state = _TurboState(self.lib)
+            with self.statesLock:
+                self.states.append(state)
+        return state
+
+    def encode(self, image, quality):
+        if not image.flags['C_CONTIGUOUS']:
+            image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        state = self.state()
+        needed = self.lib.tjBufSize(width, height, self.sampling)
+        if needed > state.size:
+            # Buffer chỉ lớn lên: các frame cùng kích thước dùng lại đúng một buffer
+            state.buf = ctypes.create_string_buffer(needed)
+            state.size = needed
+            state.bufPtr.value = ctypes.addressof(state.buf)
+        state.jpegSize.value = state.size
+        # ctypes nhả GIL trong lúc gọi -> encode song song được như cv2.imencode
+        result = self.lib.tjCompress2(state.handle, image.ctypes.data, width, image.strides[0], height,
+                                      _TJPF_BGR, ctypes.byref(state.bufPtr), ctypes.byref(state.jpegSize),
+                                      self.sampling, quality, self.flags)
+        if result != 0:
+            print(f"[ENCODER] tjCompress2: {self.lib.tjGetErrorStr().decode(errors='replace')}")
+            return None
+        return ctypes.string_at(state.bufPtr.value, state.jpegSize.value)
+
+    def close(self):
+        with self.statesLock:
+            for state in self.states:
+                self.lib.tjDestroy(state.handle)
+            self.states = []
+        self.local = threading.local()
+
+    def describe(self):
+        return f"turbojpeg ({self.subsampling} subsampling, {'fast' if self.fastDct else 'accurate'} DCT)"
+
+
+class PassthroughEncoder(JpegEncoder):
+    """
+    Sources that are already MJPEG are sent as stored. encode() is only used for frames that
+    still need it (a non-MJPEG source), through the fallback encoder.
+    """
+    name = 'passthrough'
+    passthrough = True
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or OpenCvEncoder()
+
+    def encode(self, image, quality):
+        return self.fallback.encode(image, quality)
+
+    def describe(self):
+        return f"passthrough (fallback {self.fallback.describe()})"
+
+
+def makeEncoder(name='opencv', subsampling=None, fastDct=True, libraryPath=None):
+    """Encoder backend by name; 'auto' = turbojpeg when libturbojpeg loads, else opencv. Raises EncoderError."""
+    if name == 'auto':
+        try:
+            return TurboJpegEncoder(subsampling, fastDct, libraryPath)
+        except EncoderError:
+            return OpenCvEncoder(subsampling)
+    if name == 'turbojpeg':
+        return TurboJpegEncoder(subsampling, fastDct, libraryPath)
+    if name == 'passthrough':
+        return PassthroughEncoder(OpenCvEncoder(subsampling))
+    if name == 'opencv':
+        return OpenCvEncoder(subsampling)
+    raise EncoderError(f"unknown encoder {name!r}")
+
+
+def ensureHuffmanTables(data):
+    """JPEG with the standard Huffman tables inserted before SOS if it has no DHT (else data unchanged)."""
+    # MJPEG từ camera/AVI (AVI1) hay bỏ DHT và dựa vào bảng chuẩn -> decoder thường không đọc được
+    view = memoryview(data)
+    at = 2
+    size = len(view)
+    while at + 4 <= size and view[at] == 0xFF:
+        marker = view[at + 1]
+        if marker == 0xC4:
+            return data
+        if marker == 0xDA:
+            return bytes(view[:at]) + STANDARD_DHT + bytes(view[at:])
+        at += 2 + struct.unpack_from('!H', view, at + 2)[0]
+    return data
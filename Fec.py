@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+FEC XOR (kiểu RFC 5109) trên các fragment của một frame.
+
+Frame có N packet media được bảo vệ bằng k packet parity, xen kẽ theo cột: parity j là XOR
+payload của các packet i với i % k == j. Mỗi nhóm khôi phục được 1 packet mất, nên mất
+liên tiếp tối đa k packet (burst) vẫn dựng lại được cả frame.
+
+Parity đi trong stream RTP riêng (PT 127, SSRC riêng, sequence number riêng) nên thống kê
+loss/RTCP của stream media không đổi. Header FEC ở đầu payload cho biết bố cục frame
+(seq đầu, N, k, maxPayload, kích thước frame), đủ để dựng lại cả header của packet mất:
+seq = base + i, timestamp = timestamp của packet FEC, marker = (i == N - 1).
+"""
+import math
+import struct
+from collections import OrderedDict
+from random import randint
+
+from RtpPacket import RtpPacketizer, HEADER_SIZE
+
+FEC_PT = 127
+# seq media đầu frame, N, index nhóm j, k, maxPayload, kích thước frame
+FEC_HEADER = struct.Struct('!HHBBHI')
+FEC_HEADER_SIZE = FEC_HEADER.size
+MAX_FEC_PACKETS = 16
+AUTO = 'auto'
+# auto: số parity ~ AUTO_MARGIN lần số packet dự kiến mất (theo loss trong RTCP RR), tối thiểu 1
+AUTO_MARGIN = 2.0
+DEFAULT_DECODER_FRAMES = 8
+
+
+def parseFecSetting(value):
+    """'auto' or a parity count >= 0 (from --fec or the FEC: RTSP header). Raises ValueError."""
+    value = str(value).strip().lower()
+    if value == AUTO:
+        return AUTO
+    packets = int(value)
+    if packets < 0:
+        raise ValueError(f"negative FEC packet count: {packets}")
+    return packets
+
+
+def xorPayloads(payloads):
+    """XOR of byte strings as an int (little endian: shorter ones are zero-padded at the end)."""
+    value = 0
+    for payload in payloads:
+        value ^= int.from_bytes(payload, 'little')
+    return value
+
+
+class FecEncoder:
+    """Server side: k XOR parity packets per frame, as an RtpPacketBatch of the FEC stream."""
+
+    def __init__(self, ssrc, setting=1, maxPackets=MAX_FEC_PACKETS):
+        self.ssrc = ssrc
+        self.adaptive = setting == AUTO
+        self.packets = 0 if self.adaptive else setting
+        self.maxPackets = maxPackets
+        self.lossFraction = 0.0
+        self.seqNum = randint(0, 0xFFFF)
+        self.packetizer = None  # tạo theo maxPayload của frame đầu tiên
+
+        # Stats
+        self.framesProtected = 0
+        self.packetsSent = 0
+        self.bytesSent = 0
+
+    def describe(self):
+        """Value of the FEC: header in the SETUP reply."""
+        return f"{AUTO if self.adaptive else self.packets};pt={FEC_PT}"
+
+    def onLoss(self, fraction):
+        """Loss fraction (0..1) reported by the receiver; drives k in auto mode."""
+        self.lossFraction = fraction
+
+    def parityCount(self, mediaPackets):
+        if self.adaptive:
+            k = max(1, math.ceil(mediaPackets * self.lossFraction * AUTO_MARGIN))
+        else:
+            k = self.packets
+        return min(k, mediaPackets, self.maxPackets)
+
+    def protect(self, batch):
+        """Parity packets for the frame in batch (None if k = 0). Valid until the next protect()."""
+        n = batch.count
+        k = self.parityCount(n)
+        if k == 0:
+            return None
+        firstSeq, timestamp = struct.unpack_from('!HI', batch.headers, 2)
+        # Đơn vị bảo vệ = toàn bộ payload RTP: header payload format (RFC 2435) + phần frame
+        extra = batch.headerSize - HEADER_SIZE
+        maxPayload = extra + batch.maxPayload
+        frameSize = n * extra + len(batch.payload)
+        if extra:
+            units = [bytes(batch.header(i)[HEADER_SIZE:]) + bytes(batch.payloadOf(i)) for i in range(n)]
+        else:
+            units = [batch.payloadOf(i) for i in range(n)]
+
+        # Nhóm j chỉ chứa fragment cuối (ngắn hơn) khi k == N -> chỉ packet parity cuối ngắn hơn
+        lastSize = frameSize - (n - 1) * maxPayload
+        out = bytearray()
+        for j in range(k):
+            parity = xorPayloads(units[i] for i in range(j, n, k))
+            out += FEC_HEADER.pack(firstSeq, n, j, k, maxPayload, frameSize)
+            out += parity.to_bytes(lastSize if j == n - 1 else maxPayload, 'little')
+
+        packetSize = FEC_HEADER_SIZE + maxPayload
+        if self.packetizer is None or self.packetizer.maxPayload != packetSize:
+            self.packetizer = RtpPacketizer(ssrc=self.ssrc, pt=FEC_PT, maxPayload=packetSize)
+        parityBatch = self.packetizer.packetize(out, self.seqNum + 1, timestamp)
+        self.seqNum = (self.seqNum + k) % 65536
+
+        self.framesProtected += 1
+        self.packetsSent += k
+        self.bytesSent += parityBatch.totalBytes()
+        return parityBatch
+
+    def printStats(self, mediaPackets):
+        overhead = self.packetsSent * 100.0 / mediaPackets if mediaPackets else 0.0
+        mode = f"auto (loss {self.lossFraction * 100:.2f}%)" if self.adaptive else f"k={self.packets}"
+        print(f"  FEC                 : {mode}, {self.packetsSent} parity packets ({overhead:.1f}% overhead)")
+
+
+class _FecFrame:
+    __slots__ = ('media', 'parity', 'base', 'count', 'groups', 'maxPayload', 'frameSize', 'repaired')
+
+    def __init__(self):
+        self.media = {}      # seq 16-bit -> payload
+        self.parity = {}     # nhóm j -> parity (int)
+        self.base = None     # bố cục frame, biết khi packet FEC đầu tiên tới
+        self.count = 0
+        self.groups = 0
+        self.maxPayload = 0
+        self.frameSize = 0
+        self.repaired = False
+
+
+class FecDecoder:
+    """
+    Client side: keeps the payloads of the last few frames and rebuilds a missing fragment
+    as soon as its group has the parity and all other members. onMedia()/onParity() return
+    recovered fragments as (seq, timestamp, marker, payload) to push into the FrameAssembler.
+    """
+
+    def __init__(self, maxFrames=DEFAULT_DECODER_FRAMES):
+        self.maxFrames = maxFrames
+        self.frames = OrderedDict()  # timestamp -> _FecFrame
+        # Chỉ giữ payload khi stream có FEC (SETUP reply có FEC: hoặc đã nhận packet parity)
+        self.active = False
+
+        # Stats
+        self.parityReceived = 0
+        self.packetsRecovered = 0
+        self.framesRepaired = 0
+
+    def reset(self):
+        self.frames.clear()
+
+    def frameFor(self, timestamp):
+        frame = self.frames.get(timestamp)
+        if frame is None:
+            frame = self.frames[timestamp] = _FecFrame()
+            if len(self.frames) > self.maxFrames:
+                self.frames.popitem(last=False)
+        return frame
+
+    def onMedia(self, seq, timestamp, payload):
+        if not self.active:
+            return []
+        frame = self.frameFor(timestamp)
+        frame.media[seq] = payload
+        if frame.base is None or not frame.parity:
+            return []
+        index = (seq - frame.base) & 0xFFFF
+        if index >= frame.count:
+            return []
+        return self.recover(frame, timestamp, index % frame.groups)
+
+    def onParity(self, timestamp, payload):
+        self.active = True
+        self.parityReceived += 1
+        if len(payload) < FEC_HEADER_SIZE:
+            return []
+        base, count, group, groups, maxPayload, frameSize = FEC_HEADER.unpack_from(payload, 0)
+        if groups == 0 or group >= groups:
+            return []
+        frame = self.frameFor(timestamp)
+        frame.base, frame.count, frame.groups = base, count, groups
+        frame.maxPayload, frame.frameSize = maxPayload, frameSize
+        frame.parity[group] = int.from_bytes(payload[FEC_HEADER_SIZE:], 'little')
+        return self.recover(frame, timestamp, group)
+
+    def recover(self, frame, timestamp, group):
+        """Rebuild the one missing fragment of group, if exactly one is missing."""
+        parity = frame.parity.get(group)
+        if parity is None:
+            return []
+        missing = None
+        value = parity
+        for i in range(group, frame.count, frame.groups):
+            payload = frame.media.get((frame.base + i) & 0xFFFF)
+            if payload is None:
+                if missing is not None:
+                    return []  # mất từ 2 packet trong nhóm: XOR không đủ
+                missing = i
+            else:
+                value ^= int.from_bytes(payload, 'little')
+        if missing is None:
+            return []
+
+        last = missing == frame.count - 1
+        size = frame.frameSize - missing * frame.maxPayload if last else frame.maxPayload
+        if size < 0 or value.bit_length() > size * 8:
+            return []  # parity không khớp với các packet đã nhận (hỏng/lẫn frame)
+        seq = (frame.base + missing) & 0xFFFF
+        payload = value.to_bytes(size, 'little')
+        frame.media[seq] = payload
+        self.packetsRecovered += 1
+        if not frame.repaired:
+            frame.repaired = True
+            self.framesRepaired += 1
+        return [(seq, timestamp, 1 if last else 0, payload)]
+
+    def stats(self):
+        return {
+            'parityReceived': self.parityReceived,
+            'packetsRecovered': self.packetsRecovered,
+            'framesRepaired': self.framesRepaired,
+        }
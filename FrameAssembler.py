@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Ghép fragment RTP thành frame, theo RTP timestamp (frame) và sequence number (thứ tự).
+
+- Fragment đến đúng thứ tự được chép thẳng vào bytearray cấp phát trước của frame
+  (tăng gấp đôi khi thiếu chỗ) -> mỗi byte chép một lần, không nối bytes O(n²).
+- Fragment đến sớm được giữ lại tới khi lỗ phía trước được lấp, trong một cửa sổ
+  reorderWindow packet; quá cửa sổ thì frame được trả ra dưới dạng partial.
+- Sequence number được mở rộng lên 32 bit nên quay vòng 65535 -> 0 không bị tính là mất.
+- Frame luôn được trả ra theo thứ tự timestamp.
+"""
+from collections import deque
+
+from RtpPacket import timestampDiff
+
+DEFAULT_REORDER_WINDOW = 32
+# Số frame tối đa đang chờ; nhiều hơn thì frame đầu hàng đợi bị trả ra (partial) để không trễ
+DEFAULT_MAX_PENDING_FRAMES = 3
+DEFAULT_FRAME_CAPACITY = 64 * 1024
+
+
+def jpegStart(payload):
+    """isFrameStart check for raw JPEG fragments: the first one begins with SOI."""
+    return payload[:2] == b'\xff\xd8'
+
+
+class AssembledFrame:
+    """A frame handed out by FrameAssembler (complete or partial)."""
+    __slots__ = ('timestamp', 'data', 'complete', 'packets', 'missing', 'lastSeq')
+
+    def __init__(self, timestamp, data, complete, packets, missing, lastSeq):
+        self.timestamp = timestamp
+        self.data = data          # complete: cả frame; partial: phần liên tục từ đầu frame
+        self.complete = complete
+        self.packets = packets    # số fragment đã nhận
+        self.missing = missing    # số fragment thiếu (ước lượng, >= 1 nếu partial)
+        self.lastSeq = lastSeq    # seq 16-bit của fragment cuối đã nhận
+
+
+class _PendingFrame:
+    __slots__ = ('timestamp', 'buf', 'filled', 'startSeq', 'nextSeq', 'highSeq',
+                 'markerSeq', 'stash', 'packets', 'startProven')
+
+    def __init__(self, timestamp, capacity):
+        self.timestamp = timestamp
+        self.buf = bytearray(capacity)
+        self.filled = 0
+        self.startSeq = None
+        self.nextSeq = None
+        self.highSeq = None
+        self.markerSeq = None
+        self.stash = {}          # seq -> (payload, số packet) của các đoạn đến sớm
+        self.packets = 0
+        self.startProven = False
+
+    def append(self, payload, count=1):
+        end = self.filled + len(payload)
+        if end > len(self.buf):
+            self.buf.extend(bytes(max(len(self.buf), end - len(self.buf))))
+        self.buf[self.filled:end] = payload
+        self.filled = end
+        self.nextSeq += count
+
+    def drainStash(self):
+        while self.nextSeq in self.stash:
+            payload, count = self.stash.pop(self.nextSeq)
+            self.append(payload, count)
+
+    def isComplete(self):
+        return (self.startProven and self.markerSeq is not None
+                and self.nextSeq == self.markerSeq + 1)
+
+
+class FrameAssembler:
+    """
+    push(seq, timestamp, marker, payload) -> list of AssembledFrame ready to play, in timestamp order.
+    isFrameStart(payload) tells whether a fragment is the first of its frame (None: rely on the
+    previous frame's marker only).
+    """
+
+    def __init__(self, reorderWindow=DEFAULT_REORDER_WINDOW, isFrameStart=None,
+                 initialCapacity=DEFAULT_FRAME_CAPACITY, maxPendingFrames=DEFAULT_MAX_PENDING_FRAMES):
+        self.reorderWindow = reorderWindow
+        self.maxPendingFrames = maxPendingFrames
+        self.isFrameStart = isFrameStart
+        self.initialCapacity = initialCapacity
+        self.reset()
+
+    def reset(self):
+        """Forget all state (new PLAY segment)."""
+        self.pending = []         # _PendingFrame theo thứ tự timestamp
+        self.highSeq = None       # seq mở rộng lớn nhất đã thấy
+        self.lastEmittedTs = None
+        self.lastEmittedEnd = None  # seq cuối của frame vừa trả ra
+        self.recentMarkers = deque(maxlen=8)
+        self.capacity = self.initialCapacity
+
+        # Stats
+        self.framesComplete = 0
+        self.framesPartial = 0
+        self.packetsMissing = 0
+        self.packetsLate = 0
+        self.packetsDuplicate = 0
+        self.packetsReordered = 0
+
+    def extend(self, seq):
+        """16-bit seq -> extended seq near the highest one seen (wrap-aware)."""
+        if self.highSeq is None:
+            return seq
+        delta = (seq - self.highSeq) & 0xFFFF
+        if delta >= 0x8000:
+            delta -= 0x10000
+        return self.highSeq + delta
+
+    def push(self, seq, timestamp, marker, payload):
+        seq = self.extend(seq)
+        if self.highSeq is None or seq > self.highSeq:
+            self.highSeq = seq
+        elif seq < self.highSeq:
+            self.packetsReordered += 1
+
+        if self.lastEmittedTs is not None and timestampDiff(timestamp, self.lastEmittedTs) <= 0:
+            self.packetsLate += 1  # frame đã trả ra rồi
+            return self.drain()
+
+        frame = self.frameFor(timestamp)
+        self.addFragment(frame, seq, marker, payload)
+        return self.drain()
+
+    def frameFor(self, timestamp):
+        pending = self.pending
+        for i in range(len(pending) - 1, -1, -1):
+            diff = timestampDiff(timestamp, pending[i].timestamp)
+            if diff == 0:
+                return pending[i]
+            if diff > 0:
+                frame = _PendingFrame(timestamp, self.capacity)
+                pending.insert(i + 1, frame)
+                return frame
+        frame = _PendingFrame(timestamp, self.capacity)
+        pending.insert(0, frame)
+        return frame
+
+    def addFragment(self, frame, seq, marker, payload):
+        if frame.startSeq is None:
+            frame.startSeq = frame.nextSeq = frame.highSeq = seq
+            frame.append(payload)
+            frame.startProven = self.provesStart(seq, payload)
+        elif frame.startSeq <= seq < frame.nextSeq or seq in frame.stash:
+            self.packetsDuplicate += 1
+            return
+        elif seq == frame.nextSeq:
+            frame.append(payload)
+            frame.drainStash()
+        elif seq > frame.nextSeq:
+            frame.stash[seq] = (bytes(payload), 1)
+        else:
+            # Fragment đứng trước mọi thứ đã nhận: phần đã ghép thành một đoạn chờ trong stash
+            frame.stash[frame.startSeq] = (bytes(frame.buf[:frame.filled]), frame.nextSeq - frame.startSeq)
+            frame.filled = 0
+            frame.startSeq = frame.nextSeq = seq
+            frame.append(payload)
+            frame.drainStash()
+            frame.startProven = self.provesStart(seq, payload)
+
+        frame.packets += 1
+        if seq > frame.highSeq:
+            frame.highSeq = seq
+        if marker:
+            frame.markerSeq = seq
+            self.recentMarkers.append(seq)
+            # Frame kế tiếp có thể đã đến trước marker này
+            for other in self.pending:
+                if other.startSeq == seq + 1:
+                    other.startProven = True
+
+    def provesStart(self, seq, payload):
+        if (seq - 1) in self.recentMarkers:
+            return True
+        return self.isFrameStart is not None and self.isFrameStart(payload)
+
+    def drain(self):
+        """
+        Pop frames from the front that are ready. A complete frame goes out at once if it is the
+        first one or directly follows the last one handed out; if there is a seq gap before it (an
+        earlier frame may still be on its way) it waits for the reorder window. Incomplete frames go out as partial once
+        the window is exceeded or too many frames are queued behind them.
+        """
+        ready = []
+        while self.pending:
+            frame = self.pending[0]
+            overdue = len(self.pending) > self.maxPendingFrames
+            if frame.isComplete():
+                inOrder = self.lastEmittedEnd is None or frame.startSeq == self.lastEmittedEnd + 1
+                if not (inOrder or overdue or self.highSeq - frame.startSeq >= self.reorderWindow):
+                    break
+                ready.append(self.finish(frame, True))
+            elif overdue or self.highSeq - frame.highSeq > self.reorderWindow:
+                ready.append(self.finish(frame, False))
+            else:
+                break
+            self.pending.pop(0)
+        return ready
+
+    def flush(self):
+        """Hand out everything still pending (as partial frames unless complete)."""
+        ready = [self.finish(frame, frame.isComplete()) for frame in self.pending]
+        self.pending = []
+        return ready
+
+    def finish(self, frame, complete):
+        self.lastEmittedTs = frame.timestamp
+        self.lastEmittedEnd = frame.markerSeq if frame.markerSeq is not None else frame.highSeq
+        buf = frame.buf
+        del buf[frame.filled:]
+        if complete:
+            self.framesComplete += 1
+            missing = 0
+            # Cấp phát trước cho frame sau theo kích thước frame vừa xong
+            self.capacity = max(self.initialCapacity, frame.filled + frame.filled // 4)
+        else:
+            self.framesPartial += 1
+            end = frame.markerSeq if frame.markerSeq is not None else frame.highSeq
+            missing = max(1, end - frame.startSeq + 1 - frame.packets)
+            self.packetsMissing += missing
+        return AssembledFrame(frame.timestamp, buf, complete, frame.packets, missing, frame.highSeq & 0xFFFF)
+
+    def stats(self):
+        return {
+            'framesComplete': self.framesComplete,
+            'framesPartial': self.framesPartial,
+            'packetsMissing': self.packetsMissing,
+            'packetsLate': self.packetsLate,
+            'packetsDuplicate': self.packetsDuplicate,
+            'packetsReordered': self.packetsReordered,
+        }
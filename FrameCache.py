@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+
+# 256 MB mặc định cho toàn server
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class FrameCache:
+    """
+    Cache dùng chung cho toàn server: lưu các frame JPEG đã encode,
+    key = (filename, frame index, encode settings).
+    Giới hạn theo tổng số byte, loại bỏ theo LRU.
+    """
+
+    def __init__(self, maxBytes=DEFAULT_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def makeKey(filename, frameIndex, settings):
+        return (filename, frameIndex, settings)
+
+    def get(self, key):
+        """Return cached bytes for key, or None on miss."""
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Insert data, evicting least recently used entries if over budget."""
+        size = len(data)
+        if size > self.maxBytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.currentBytes -= len(old)
+
+            self.entries[key] = data
+            self.currentBytes += size
+
+            while self.currentBytes > self.maxBytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.currentBytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.currentBytes,
+                'maxBytes': self.maxBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': (self.hits / lookups) if lookups > 0 else 0.0,
+            }
+
+    def printStats(self):
+        s = self.stats()
+        print("\n[FRAME CACHE]")
+        print(f"  Entries             : {s['entries']}")
+        print(f"  Size                : {s['bytes'] / 1_000_000:.2f} / {s['maxBytes'] / 1_000_000:.2f} MB")
+        print(f"  Hits / Misses       : {s['hits']} / {s['misses']}")
+        print(f"  Hit rate            : {s['hitRate'] * 100:.1f}%")
+        print(f"  Evictions           : {s['evictions']}\n")
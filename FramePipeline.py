@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline decode/encode chạy trước sender.
+
+Một reader thread/session đọc + decode frame tuần tự (cap.read phải theo thứ tự),
+encode JPEG trên thread pool dùng chung (cv2.imencode nhả GIL), và xếp kết quả vào
+hàng đợi có giới hạn `depth` frame. Sender chỉ còn pace + gửi.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from VideoStream import RawFrame
+import StageTimer
+
+DEFAULT_DEPTH = 4
+DEFAULT_ENCODE_THREADS = 4
+
+# timedEncode trả về cái này khi encode một frame lỗi (khác None = hết video)
+ENCODE_FAILED = object()
+
+_executor = None
+_executorLock = threading.Lock()
+encodeThreads = DEFAULT_ENCODE_THREADS
+
+
+def sharedExecutor():
+    """Server-wide encode pool (created on first use with `encodeThreads` workers)."""
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=encodeThreads, thread_name_prefix='encode')
+        return _executor
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class FramePipeline:
+    """Bounded producer/consumer wrapper with the VideoStream frame API (nextFrame/skipFrames/frameNbr)."""
+
+    def __init__(self, videoStream, depth=DEFAULT_DEPTH, executor=None):
+        self.videoStream = videoStream
+        self.depth = depth
+        self.executor = executor or sharedExecutor()
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopEvent = threading.Event()
+        self.frameNum = 0
+
+        # Metrics
+        self.producerBlocked = 0   # hàng đợi đầy: encoder đi trước, network/pacing là nút cổ chai
+        self.consumerStarved = 0   # hàng đợi rỗng: sender phải chờ decode/encode
+        self.depthSum = 0
+        self.depthSamples = 0
+        self.encodeTime = 0.0
+        self.encodedFrames = 0
+        self.encodeLock = threading.Lock()  # timedEncode chạy trên nhiều thread của pool
+
+        self.reader = threading.Thread(target=self.produce, daemon=True)
+        self.reader.start()
+
+    def produce(self):
+        while not self.stopEvent.is_set():
+            start = StageTimer.now() if StageTimer.enabled else None
+            item = self.videoStream.readNext()
+            if start is not None:
+                StageTimer.record('read', start)
+            if isinstance(item, RawFrame):
+                future = self.executor.submit(self.timedEncode, item)
+            else:
+                future = _done(item)
+
+            if self.queue.full():
+                self.producerBlocked += 1
+            while not self.stopEvent.is_set():
+                try:
+                    self.queue.put(future, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+            if item is None:
+                return  # Hết video
+
+    def timedEncode(self, raw):
+        start = time.perf_counter()
+        data = self.videoStream.encode(raw)
+        elapsed = time.perf_counter() - start
+        with self.encodeLock:
+            self.encodeTime += elapsed
+            self.encodedFrames += 1
+        return ENCODE_FAILED if data is None else data
+
+    def nextFrame(self):
+        self.depthSum += self.queue.qsize()
+        self.depthSamples += 1
+        if self.queue.empty():
+            self.consumerStarved += 1
+
+        while True:
+            try:
+                data = self.queue.get().result()
+            except Exception as e:
+                print(f"[SERVER] Encode error: {e}")
+                data = ENCODE_FAILED
+            if data is None:
+                # Giữ sentinel để các lần gọi sau cũng trả về None
+                self.queue.put(_done(None))
+                return None
+            self.frameNum += 1
+            if data is ENCODE_FAILED:
+                continue  # Bỏ frame lỗi, frameNum vẫn tăng để timestamp khớp vị trí trong video
+            return data
+
+    def skipFrames(self, count):
+        """Drop the next count frames (already decoding in the pipeline)."""
+        for _ in range(count):
+            if self.nextFrame() is None:
+                return
+
+    def fps(self):
+        return self.videoStream.fps()
+
+    def frameNbr(self):
+        return self.frameNum
+
+    def seek(self, frameIndex):
+        """Restart the reader at frameIndex, dropping what was decoded ahead. False if out of range."""
+        self.stopEvent.set()
+        self.reader.join()
+        ok = self.videoStream.seek(frameIndex)
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.frameNum = self.videoStream.frameNbr()
+
+        self.stopEvent = threading.Event()
+        self.reader = threading.Thread(target=self.produce, daemon=True)
+        self.reader.start()
+        return ok
+
+    def stop(self):
+        """Stop the reader and wake a sender blocked in nextFrame() (it then gets None)."""
+        self.stopEvent.set()
+        # Reader không put nữa: đặt sentinel (bỏ frame cũ nếu hàng đợi đầy) để queue.get() trả về
+        while True:
+            try:
+                self.queue.put_nowait(_done(None))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def stats(self):
+        samples = max(self.depthSamples, 1)
+        return {
+            'depth': self.depth,
+            'avgQueueDepth': self.depthSum / samples,
+            'queueDepth': self.queue.qsize(),
+            'producerBlocked': self.producerBlocked,
+            'consumerStarved': self.consumerStarved,
+            'avgEncodeMs': self.encodeTime * 1000 / self.encodedFrames if self.encodedFrames else 0.0,
+        }
+
+    def printStats(self):
+        s = self.stats()
+        print(f"  Pipeline depth      : {s['depth']} (avg queued {s['avgQueueDepth']:.2f})")
+        print(f"  Encoder starved     : {s['consumerStarved']} frames (sender waited for encode)")
+        print(f"  Sender bound        : {s['producerBlocked']} frames (queue full, waiting on pacing/network)")
+        print(f"  Avg encode time     : {s['avgEncodeMs']:.2f} ms")
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+File chứa các frame JPEG đã encode sẵn, đọc bằng mmap (không decode, không encode, không copy).
+
+Hai định dạng được hỗ trợ:
+  - Packed (.mjpx): header + các frame JPEG liền nhau + index cố định độ rộng
+    (offset, length, timestamp) ở cuối file. Mở file là O(1): chỉ đọc header.
+  - Mjpeg cổ điển (movie.Mjpeg): mỗi frame = 5 byte độ dài dạng ASCII + dữ liệu JPEG.
+    Đọc tuần tự không cần index; truy cập ngẫu nhiên (seek) dùng index (offset, length)
+    dựng một lần, lưu cạnh file (movie.Mjpeg.idx) và dùng chung cho mọi session.
+"""
+import mmap
+import os
+import struct
+import threading
+
+PACKED_MAGIC = b'MJPX'
+PACKED_VERSION = 1
+PACKED_EXT = '.mjpx'
+
+# magic, version, reserved, frameCount, fps, indexOffset
+HEADER_FORMAT = '<4sHHIdQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# offset, length, timestamp (ms)
+INDEX_FORMAT = '<QII'
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_FORMAT)
+
+MJPEG_LENGTH_SIZE = 5
+DEFAULT_FPS = 20.0
+
+# Sidecar index của file Mjpeg: header + các entry (offset dữ liệu JPEG, length)
+MJPEG_INDEX_EXT = '.idx'
+MJPEG_INDEX_MAGIC = b'MJIX'
+MJPEG_INDEX_VERSION = 1
+# magic, version, reserved, frameCount, kích thước file nguồn, mtime (ns) của file nguồn
+MJPEG_INDEX_HEADER = '<4sHHIQQ'
+MJPEG_INDEX_HEADER_SIZE = struct.calcsize(MJPEG_INDEX_HEADER)
+MJPEG_INDEX_ENTRY = '<QI'
+MJPEG_INDEX_ENTRY_SIZE = struct.calcsize(MJPEG_INDEX_ENTRY)
+
+# Index đã nạp trong process: (path, size, mtime_ns) -> bytes các entry
+_mjpegIndexes = {}
+_mjpegIndexLock = threading.Lock()
+
+
+class PackedFrameFile:
+    """Reader for the packed .mjpx format."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise IOError(f"Empty frame file: {filename}")
+        self.view = memoryview(self.map)
+
+        magic, version, _, self.frameCount, self.fps, self.indexOffset = \
+            struct.unpack_from(HEADER_FORMAT, self.map, 0)
+        if magic != PACKED_MAGIC or version != PACKED_VERSION:
+            self.close()
+            raise IOError(f"Not a packed frame file: {filename}")
+        if self.indexOffset + self.frameCount * INDEX_ENTRY_SIZE > len(self.map):
+            self.close()
+            raise IOError(f"Truncated frame index: {filename}")
+
+    def entry(self, index):
+        """Return (offset, length, timestamp_ms) of frame `index`."""
+        return struct.unpack_from(INDEX_FORMAT, self.map,
+                                  self.indexOffset + index * INDEX_ENTRY_SIZE)
+
+    def frame(self, index):
+        """Return frame `index` as a memoryview into the mapped file, or None past the end."""
+        if index < 0 or index >= self.frameCount:
+            return None
+        offset, length, _ = self.entry(index)
+        return self.view[offset: offset + length]
+
+    def countFrames(self):
+        return self.frameCount
+
+    def timestamp(self, index):
+        return self.entry(index)[2]
+
+    def close(self):
+        try:
+            self.view.release()
+            self.map.close()
+        except (AttributeError, BufferError):
+            # Vẫn còn memoryview của frame đang được dùng -> để GC đóng sau
+            pass
+        self.file.close()
+
+
+class MjpegFile:
+    """
+    Reader for the classic length-prefixed movie.Mjpeg layout.
+    frame(i) theo thứ tự tăng dần đọc tuần tự; đọc nhảy cóc thì nạp index (mjpegIndex).
+    """
+
+    def __init__(self, filename, fps=DEFAULT_FPS):
+        self.filename = filename
+        self.fps = fps
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise IOError(f"Empty frame file: {filename}")
+        self.view = memoryview(self.map)
+        self.frameCount = None  # chưa biết nếu chưa đọc hết file
+        self.index = None
+
+        # Vị trí đọc tuần tự
+        self.pos = 0
+        self.nextIndex = 0
+
+    def loadIndex(self):
+        if self.index is None:
+            self.index = mjpegIndex(self.filename, self.map)
+            self.frameCount = len(self.index) // MJPEG_INDEX_ENTRY_SIZE
+        return self.index
+
+    def countFrames(self):
+        return self.frameCount if self.frameCount is not None else len(self.loadIndex()) // MJPEG_INDEX_ENTRY_SIZE
+
+    def frame(self, index):
+        if index != self.nextIndex:
+            return self.frameAt(index)
+
+        header = self.map[self.pos: self.pos + MJPEG_LENGTH_SIZE]
+        if len(header) < MJPEG_LENGTH_SIZE:
+            self.frameCount = self.nextIndex
+            return None
+        try:
+            length = int(header)
+        except ValueError:
+            raise IOError(f"Corrupt Mjpeg frame header at byte {self.pos}: {self.filename}")
+
+        start = self.pos + MJPEG_LENGTH_SIZE
+        if start + length > len(self.map):
+            self.frameCount = self.nextIndex
+            return None
+
+        self.pos = start + length
+        self.nextIndex += 1
+        return self.view[start: start + length]
+
+    def frameAt(self, index):
+        """Random access through the index; sequential reading continues after this frame."""
+        entries = self.loadIndex()
+        if index < 0 or index >= self.frameCount:
+            return None
+        start, length = struct.unpack_from(MJPEG_INDEX_ENTRY, entries, index * MJPEG_INDEX_ENTRY_SIZE)
+        self.pos = start + length
+        self.nextIndex = index + 1
+        return self.view[start: start + length]
+
+    def timestamp(self, index):
+        return int(index * 1000 / self.fps)
+
+    def close(self):
+        try:
+            self.view.release()
+            self.map.close()
+        except (AttributeError, BufferError):
+            pass
+        self.file.close()
+
+
+def buildMjpegIndex(data):
+    """Scan the 5-byte length headers of a Mjpeg file (no JPEG data is touched)."""
+    entries = bytearray()
+    pos = 0
+    size = len(data)
+    while pos + MJPEG_LENGTH_SIZE <= size:
+        try:
+            length = int(data[pos: pos + MJPEG_LENGTH_SIZE])
+        except ValueError:
+            break
+        start = pos + MJPEG_LENGTH_SIZE
+        if start + length > size:
+            break
+        entries += struct.pack(MJPEG_INDEX_ENTRY, start, length)
+        pos = start + length
+    return bytes(entries)
+
+
+def readMjpegIndex(indexPath, st):
+    """Entries from a sidecar index, or None if missing or stale (source changed)."""
+    try:
+        with open(indexPath, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if len(raw) < MJPEG_INDEX_HEADER_SIZE:
+        return None
+    magic, version, _, count, size, mtime = struct.unpack_from(MJPEG_INDEX_HEADER, raw, 0)
+    entries = raw[MJPEG_INDEX_HEADER_SIZE:]
+    if (magic != MJPEG_INDEX_MAGIC or version != MJPEG_INDEX_VERSION or size != st.st_size
+            or mtime != st.st_mtime_ns or len(entries) != count * MJPEG_INDEX_ENTRY_SIZE):
+        return None
+    return entries
+
+
+def writeMjpegIndex(indexPath, entries, st):
+    header = struct.pack(MJPEG_INDEX_HEADER, MJPEG_INDEX_MAGIC, MJPEG_INDEX_VERSION, 0,
+                         len(entries) // MJPEG_INDEX_ENTRY_SIZE, st.st_size, st.st_mtime_ns)
+    tmpPath = f"{indexPath}.{os.getpid()}.tmp"
+    try:
+        with open(tmpPath, 'wb') as f:
+            f.write(header)
+            f.write(entries)
+        os.replace(tmpPath, indexPath)
+    except OSError:
+        # Thư mục chỉ đọc: vẫn dùng index trong RAM
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+
+
+def mjpegIndex(filename, data):
+    """
+    Frame index of a Mjpeg file: loaded from filename + '.idx' if it is up to date,
+    otherwise built once and saved. Shared by every session of this process.
+    """
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    with _mjpegIndexLock:
+        entries = _mjpegIndexes.get(key)
+        if entries is None:
+            indexPath = filename + MJPEG_INDEX_EXT
+            entries = readMjpegIndex(indexPath, st)
+            if entries is None:
+                entries = buildMjpegIndex(data)
+                writeMjpegIndex(indexPath, entries, st)
+            _mjpegIndexes[key] = entries
+        return entries
+
+
+def isPackedFile(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+    except OSError:
+        return False
+
+
+def isMjpegFile(filename):
+    """Classic layout: 5 chữ số ASCII độ dài, sau đó là JPEG SOI (FF D8)."""
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(MJPEG_LENGTH_SIZE + 2)
+    except OSError:
+        return False
+    return (len(head) == MJPEG_LENGTH_SIZE + 2
+            and head[:MJPEG_LENGTH_SIZE].strip().isdigit()
+            and head[MJPEG_LENGTH_SIZE:] == b'\xff\xd8')
+
+
+def openFrameFile(filename):
+    """Return a pre-encoded frame reader for filename, or None if it is a regular video."""
+    if not os.path.isfile(filename):
+        return None
+    if isPackedFile(filename):
+        return PackedFrameFile(filename)
+    if isMjpegFile(filename):
+        return MjpegFile(filename)
+    return None
+
+
+class PackedFrameWriter:
+    """Writes frames into the packed .mjpx format."""
+
+    def __init__(self, filename, fps):
+        self.filename = filename
+        self.fps = fps
+        self.file = open(filename, 'wb')
+        self.file.write(bytes(HEADER_SIZE))
+        self.offset = HEADER_SIZE
+        self.index = bytearray()
+        self.frameCount = 0
+
+    def addFrame(self, data, timestampMs=None):
+        if timestampMs is None:
+            timestampMs = int(self.frameCount * 1000 / self.fps)
+        self.file.write(data)
+        self.index += struct.pack(INDEX_FORMAT, self.offset, len(data), timestampMs)
+        self.offset += len(data)
+        self.frameCount += 1
+
+    def close(self):
+        indexOffset = self.offset
+        self.file.write(self.index)
+        self.file.seek(0)
+        self.file.write(struct.pack(HEADER_FORMAT, PACKED_MAGIC, PACKED_VERSION, 0,
+                                    self.frameCount, float(self.fps), indexOffset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Offline ingest: chuyển video nguồn thành file frame JPEG encode sẵn.
+
+    python3 Ingest.py input.mp4 movie.mjpx [--quality 98] [--encoder turbojpeg]
+    python3 Ingest.py input.mp4 movie.Mjpeg --format mjpeg
+    python3 Ingest.py movie.Mjpeg movie.mjpx     (không encode lại)
+"""
+import argparse
+import os
+import sys
+import time
+
+from FrameStore import PackedFrameWriter, MjpegFile, isMjpegFile, MJPEG_LENGTH_SIZE, DEFAULT_FPS
+from VideoStream import JPEG_QUALITY
+from Encoders import makeEncoder, EncoderError, SUBSAMPLINGS
+
+
+def iterSourceFrames(source, quality, encoder=None):
+    """Yield the source fps first, then (jpegBytes, timestampMs) per frame."""
+    if isMjpegFile(source):
+        frames = MjpegFile(source)
+        yield frames.fps
+        index = 0
+        while True:
+            data = frames.frame(index)
+            if data is None:
+                break
+            yield bytes(data), frames.timestamp(index)
+            index += 1
+        frames.close()
+        return
+
+    import cv2
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file: {source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    yield fps
+
+    encoder = encoder or makeEncoder()
+    index = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        jpeg = encoder.encode(frame, quality)
+        if jpeg is None:
+            raise IOError(f"JPEG encode failed at frame {index}")
+        yield jpeg, int(index * 1000 / fps)
+        index += 1
+    cap.release()
+
+
+def ingest(source, output, quality=JPEG_QUALITY, fmt='mjpx', encoder=None):
+    frames = iterSourceFrames(source, quality, encoder)
+    fps = next(frames)
+    count = 0
+    start = time.time()
+
+    # Ghi ra file tạm rồi đổi tên: lỗi giữa chừng không để lại file output cụt
+    tmpPath = f"{output}.{os.getpid()}.tmp"
+    try:
+        if fmt == 'mjpeg':
+            with open(tmpPath, 'wb') as f:
+                for data, _ in frames:
+                    if len(data) >= 10 ** MJPEG_LENGTH_SIZE:
+                        raise ValueError(f"Frame {count} too large for the Mjpeg layout ({len(data)} bytes)")
+                    f.write(b'%05d' % len(data))
+                    f.write(data)
+                    count += 1
+        else:
+            with PackedFrameWriter(tmpPath, fps) as writer:
+                for data, ts in frames:
+                    writer.addFrame(data, ts)
+                    count += 1
+        os.replace(tmpPath, output)
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+    print(f"[INGEST] {count} frames @ {fps:.2f} fps -> {output} ({time.time() - start:.1f}s)")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="Ingest.py Source_video Output_file [options]")
+    parser.add_argument('source')
+    parser.add_argument('output')
+    parser.add_argument('--quality', type=int, default=JPEG_QUALITY)
+    parser.add_argument('--format', choices=['mjpx', 'mjpeg'], default='mjpx')
+    parser.add_argument('--encoder', choices=['opencv', 'turbojpeg', 'auto'], default='opencv')
+    parser.add_argument('--subsampling', choices=SUBSAMPLINGS, default=None)
+    parser.add_argument('--turbojpeg-lib', default=None)
+    args = parser.parse_args()
+
+    try:
+        encoder = makeEncoder(args.encoder, args.subsampling, libraryPath=args.turbojpeg_lib)
+        ingest(args.source, args.output, args.quality, args.format, encoder)
+    except (IOError, ValueError, EncoderError) as e:
+        print(f"[INGEST ERROR] {e}")
+        sys.exit(1)
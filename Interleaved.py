@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+RTP/RTCP interleaved trên kết nối RTSP (RFC 2326 mục 10.12): mỗi packet được gửi dạng
+'$' + channel (1 byte) + độ dài (2 byte, big endian) + packet. Channel 0 = RTP, 1 = RTCP.
+
+Dùng khi client không nhận được UDP (NAT/firewall chặt) hoặc UDP bị rớt ở bitrate cao:
+TCP không mất packet, và khi bên nhận chậm thì socket đầy làm sender chậm lại (backpressure).
+"""
+import struct
+import threading
+
+INTERLEAVED_MAGIC = 0x24  # '$'
+RTP_CHANNEL = 0
+RTCP_CHANNEL = 1
+INTERLEAVED_TRANSPORT = "RTP/AVP/TCP;interleaved=0-1"
+
+_PREFIX = struct.Struct('!BBH')
+PREFIX_SIZE = _PREFIX.size
+# Số buffer tối đa mỗi sendmsg (IOV_MAX = 1024 trên Linux); mỗi packet dùng 3 (prefix, header, payload)
+MAX_IOVECS = 1023
+
+
+def isInterleavedTransport(transport):
+    """True if a Transport header asks for RTP over the RTSP connection."""
+    upper = transport.upper()
+    return 'RTP/AVP/TCP' in upper or 'INTERLEAVED=' in upper
+
+
+def framePacket(channel, data):
+    """One $-framed packet as bytes."""
+    return _PREFIX.pack(INTERLEAVED_MAGIC, channel, len(data)) + bytes(data)
+
+
+def framedBatch(batch, start=0, end=None):
+    """
+    Packets [start, end) of an RtpPacketBatch $-framed into one bytearray (one copy of the frame).
+    For writers that keep the data after returning (asyncio transports): the batch's header
+    buffer is reused by the next packetize().
+    """
+    end = batch.count if end is None else min(end, batch.count)
+    out = bytearray()
+    for i in range(start, end):
+        payload = batch.payloadOf(i)
+        out += _PREFIX.pack(INTERLEAVED_MAGIC, RTP_CHANNEL, batch.headerSize + len(payload))
+        out += batch.header(i)
+        out += payload
+    return out
+
+
+class InterleavedWriter:
+    """
+    Writes RTP batches as $-framed packets on a blocking RTSP socket: one frame = one sendmsg
+    gathering prefix, RTP header and payload slice of every packet (no concatenation).
+    A full TCP window blocks the call, so a slow receiver slows the sender instead of losing
+    packets. `lock` is shared with RTSP replies so a reply never lands inside a packet.
+    """
+
+    def __init__(self, sock, lock=None):
+        self.sock = sock
+        self.lock = lock or threading.Lock()
+        self.prefixBuf = bytearray(PREFIX_SIZE * 64)
+
+        # Stats
+        self.syscalls = 0
+        self.bytesWritten = 0
+
+    def sendBatch(self, batch, start=0, end=None):
+        """Send packets [start, end) of an RtpPacketBatch on channel 0. Returns packets sent."""
+        end = batch.count if end is None else min(end, batch.count)
+        count = end - start
+        if count * PREFIX_SIZE > len(self.prefixBuf):
+            self.prefixBuf = bytearray(count * PREFIX_SIZE * 2)
+        prefixes = memoryview(self.prefixBuf)
+
+        buffers = []
+        for n, i in enumerate(range(start, end)):
+            payload = batch.payloadOf(i)
+            at = n * PREFIX_SIZE
+            _PREFIX.pack_into(self.prefixBuf, at, INTERLEAVED_MAGIC, RTP_CHANNEL, batch.headerSize + len(payload))
+            buffers.append(prefixes[at: at + PREFIX_SIZE])
+            buffers.append(batch.header(i))
+            buffers.append(payload)
+
+        with self.lock:
+            self.sendAll(buffers)
+        return count
+
+    def sendPacket(self, channel, data):
+        """Send one packet (e.g. an RTCP report on channel 1)."""
+        with self.lock:
+            self.sendAll([_PREFIX.pack(INTERLEAVED_MAGIC, channel, len(data)), data])
+
+    def sendAll(self, buffers):
+        """sendmsg until every byte of buffers is written (handles partial writes)."""
+        index = 0
+        while index < len(buffers):
+            chunk = buffers[index: index + MAX_IOVECS]
+            sent = self.sock.sendmsg(chunk)
+            self.syscalls += 1
+            self.bytesWritten += sent
+            # Bỏ các buffer đã gửi hết; buffer gửi dở thì cắt phần đã gửi
+            for buf in chunk:
+                size = len(buf)
+                if sent < size:
+                    break
+                sent -= size
+                index += 1
+            if sent:
+                buffers[index] = memoryview(buffers[index])[sent:]
+
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Jitter buffer phía client, điều khiển bởi RTP timestamp.
+
+Frame có timestamp ts được hiện lúc  ts / clockRate + transitRef + playoutDelay, trong đó
+transitRef là transit nhỏ nhất đã thấy (đường nhanh nhất) và playoutDelay bám theo jitter
+đo được (kiểu RFC 3550): jitter tăng thì buffer sâu hơn, mạng êm thì buffer nông lại.
+Frame tới sau giờ hiện của nó bị bỏ; khi nhiều frame cùng tới hạn thì chỉ hiện frame mới nhất.
+"""
+import threading
+from collections import deque
+from time import monotonic
+
+from RtpPacket import RTP_CLOCK_RATE, timestampDiff
+
+# (minDelay, maxDelay, jitterMultiplier) theo mode
+NORMAL_MODE = (0.100, 1.000, 4.0)
+LOW_LATENCY_MODE = (0.020, 0.200, 2.0)
+
+# Mỗi frame chỉ chỉnh playout delay tối đa chừng này (giây), tránh giật khi delay đổi
+MAX_DELAY_STEP = 0.005
+# Số frame tối đa giữ trong buffer
+MAX_FRAMES = 100
+
+
+class JitterBuffer:
+    """Thread-safe: put() from the RTP thread, get()/nextDue() from the display loop."""
+
+    def __init__(self, lowLatency=False, clockRate=RTP_CLOCK_RATE, maxFrames=MAX_FRAMES):
+        self.minDelay, self.maxDelay, self.multiplier = LOW_LATENCY_MODE if lowLatency else NORMAL_MODE
+        self.lowLatency = lowLatency
+        self.clockRate = clockRate
+        self.maxFrames = maxFrames
+        self.lock = threading.Lock()
+        self.reset()
+
+        # Counters (giữ qua các PLAY segment)
+        self.framesIn = 0
+        self.framesPlayed = 0
+        self.lateDrops = 0
+        self.overflowDrops = 0
+        self.underruns = 0
+        self.resyncs = 0
+
+    def reset(self):
+        """New PLAY segment: forget the timing reference and any queued frames."""
+        with self.lock:
+            self.frames = deque()      # (timestamp, data) theo thứ tự timestamp
+            self.baseTs = None         # timestamp mốc để đổi ts ra giây (không quay vòng)
+            self.transitRef = None
+            self.lastTransit = None
+            self.jitter = 0.0          # giây
+            self.delay = self.minDelay
+            self.lastPlayedTs = None
+            self.frameStep = None      # khoảng timestamp giữa 2 frame liên tiếp
+            self.starving = False
+
+    def mediaTime(self, timestamp):
+        return timestampDiff(timestamp, self.baseTs) / self.clockRate
+
+    def playoutTime(self, timestamp):
+        return self.mediaTime(timestamp) + self.transitRef + self.delay
+
+    def targetDelay(self):
+        return min(self.maxDelay, max(self.minDelay, self.minDelay + self.multiplier * self.jitter))
+
+    def put(self, timestamp, data, now=None):
+        """Add a complete frame. Returns False if it was dropped (late, duplicate or buffer full)."""
+        now = monotonic() if now is None else now
+        with self.lock:
+            self.framesIn += 1
+            if self.baseTs is None:
+                self.baseTs = timestamp
+
+            transit = now - self.mediaTime(timestamp)
+            if self.lastTransit is not None:
+                self.jitter += (abs(transit - self.lastTransit) - self.jitter) / 16.0
+            self.lastTransit = transit
+            if self.transitRef is None or transit < self.transitRef:
+                self.transitRef = transit
+
+            # Bám target delay từng bước nhỏ
+            target = self.targetDelay()
+            step = max(-MAX_DELAY_STEP, min(MAX_DELAY_STEP, target - self.delay))
+            self.delay += step
+
+            if self.lastPlayedTs is not None and timestampDiff(timestamp, self.lastPlayedTs) <= 0:
+                self.lateDrops += 1
+                return False
+            if self.playoutTime(timestamp) < now:
+                if self.frames or self.lastPlayedTs is None:
+                    # Tới sau giờ hiện của nó
+                    self.lateDrops += 1
+                    return False
+                # Buffer đã cạn: sender bị chậm (vd. TCP backpressure), mọi frame sau cũng sẽ trễ
+                # như vậy -> dời mốc transit để phát tiếp sau playout delay thay vì bỏ hết
+                self.transitRef = transit
+                self.resyncs += 1
+            if len(self.frames) >= self.maxFrames:
+                self.frames.popleft()
+                self.overflowDrops += 1
+
+            # Frame tới theo thứ tự timestamp (FrameAssembler đảm bảo), nhưng vẫn chèn đúng chỗ
+            if self.frames and timestampDiff(timestamp, self.frames[-1][0]) < 0:
+                index = len(self.frames)
+                while index > 0 and timestampDiff(timestamp, self.frames[index - 1][0]) < 0:
+                    index -= 1
+                self.frames.insert(index, (timestamp, data))
+            else:
+                self.frames.append((timestamp, data))
+            self.starving = False
+            return True
+
+    def get(self, now=None):
+        """The frame to show now as (timestamp, data), or None. Older due frames are dropped."""
+        now = monotonic() if now is None else now
+        with self.lock:
+            if not self.frames:
+                # Underrun: frame kế tiếp đã quá giờ hiện mà chưa tới
+                if (self.frameStep and not self.starving
+                        and now > self.playoutTime((self.lastPlayedTs + self.frameStep) & 0xFFFFFFFF)):
+                    self.underruns += 1
+                    self.starving = True
+                return None
+            if self.playoutTime(self.frames[0][0]) > now:
+                return None
+
+            frame = self.frames.popleft()
+            # Trễ hơn một frame: bỏ các frame cũ, hiện frame mới nhất đã tới hạn
+            while self.frames and self.playoutTime(self.frames[0][0]) <= now:
+                frame = self.frames.popleft()
+                self.lateDrops += 1
+            if self.lastPlayedTs is not None:
+                self.frameStep = timestampDiff(frame[0], self.lastPlayedTs)
+            self.lastPlayedTs = frame[0]
+            self.framesPlayed += 1
+            return frame
+
+    def position(self):
+        """Media time (seconds) of the last frame shown, relative to the first frame of the segment."""
+        with self.lock:
+            if self.lastPlayedTs is None:
+                return 0.0
+            return self.mediaTime(self.lastPlayedTs)
+
+    def nextDue(self, now=None):
+        """Seconds until the next queued frame is due (0 if due now), or None if empty."""
+        now = monotonic() if now is None else now
+        with self.lock:
+            if not self.frames:
+                return None
+            return max(0.0, self.playoutTime(self.frames[0][0]) - now)
+
+    def depth(self):
+        return len(self.frames)
+
+    def stats(self):
+        return {
+            'mode': 'low-latency' if self.lowLatency else 'normal',
+            'playoutDelayMs': self.delay * 1000,
+            'targetDelayMs': self.targetDelay() * 1000,
+            'jitterMs': self.jitter * 1000,
+            'depth': len(self.frames),
+            'framesPlayed': self.framesPlayed,
+            'lateDrops': self.lateDrops,
+            'overflowDrops': self.overflowDrops,
+            'underruns': self.underruns,
+            'resyncs': self.resyncs,
+        }
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics sống (Prometheus text format) cho server và client.
+
+Đường nóng chỉ cộng vào shard của thread hiện tại (không lock: mỗi shard chỉ một thread
+ghi); lúc scrape mới cộng các shard lại. Số liệu theo session không đếm riêng mà đọc thẳng
+từ các counter session đã có (collector chạy lúc scrape).
+
+    python3 Server.py 8554 --metrics-port 9100
+    curl localhost:9100/metrics
+"""
+import threading
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket (giây) cho thời gian encode / gửi / trễ pacing
+TIME_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+SIZE_BUCKETS = (1000, 4000, 16000, 32000, 64000, 128000, 256000, 512000, 1024000)
+
+
+def _formatLabels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _ThreadMarker:
+    """Kept in a thread's local storage only; freed (and finalized) when the thread ends."""
+    __slots__ = ('__weakref__',)
+
+
+class _Sharded:
+    """
+    Base of per-thread sharded metrics: shard() is this thread's own cell list.
+    When the thread ends its shard is added into `retired` and dropped, so short-lived
+    threads (one sendRtp thread per session) do not pile up shards.
+    """
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.local = threading.local()
+        self.shards = []
+        self.retired = self.newShard()
+        self.shardsLock = threading.Lock()  # chỉ khi thread tạo / trả shard và lúc scrape
+
+    def newShard(self):
+        raise NotImplementedError
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = self.newShard()
+            marker = self.local.marker = _ThreadMarker()
+            weakref.finalize(marker, self.retire, shard)
+            with self.shardsLock:
+                self.shards.append(shard)
+            return shard
+
+    def retire(self, shard):
+        """Fold the shard of a finished thread into the retired totals."""
+        with self.shardsLock:
+            for i, value in enumerate(shard):
+                self.retired[i] += value
+            self.shards = [s for s in self.shards if s is not shard]
+
+    def snapshot(self):
+        with self.shardsLock:
+            return [list(self.retired)] + [list(shard) for shard in self.shards]
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def newShard(self):
+        return [0]
+
+    def inc(self, amount=1):
+        self.shard()[0] += amount
+
+    def value(self):
+        return sum(shard[0] for shard in self.snapshot())
+
+    def samples(self):
+        yield self.name, None, self.value()
+
+
+class Histogram(_Sharded):
+    """Shard = counts per bucket (+ overflow), then sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.sumIndex = len(self.buckets) + 1
+        super().__init__(name, help)
+
+    def newShard(self):
+        return [0] * (len(self.buckets) + 3)
+
+    def observe(self, value):
+        shard = self.shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[self.sumIndex] += value
+        shard[self.sumIndex + 1] += 1
+
+    def totals(self):
+        totals = [0] * (len(self.buckets) + 3)
+        for shard in self.snapshot():
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+    def samples(self):
+        totals = self.totals()
+        cumulative = 0
+        for i, bound in enumerate(self.buckets + (float('inf'),)):
+            cumulative += totals[i]
+            yield self.name + '_bucket', {'le': _formatValue(float(bound))}, cumulative
+        yield self.name + '_sum', None, totals[self.sumIndex]
+        yield self.name + '_count', None, totals[self.sumIndex + 1]
+
+    def summary(self):
+        """count / meanMs / p50Ms / p99Ms (for histograms in seconds)."""
+        totals = self.totals()
+        return histogramSummary(self.buckets, totals[:self.sumIndex], totals[self.sumIndex], totals[self.sumIndex + 1])
+
+
+def bucketQuantile(bounds, counts, q):
+    """Quantile q estimated from per-bucket counts (last one = overflow), interpolated inside the bucket."""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if i == len(bounds):
+                return float(bounds[-1])  # vượt bucket cuối: chỉ biết là >= bound cuối
+            lower = bounds[i - 1] if i > 0 else 0.0
+            return lower + (bounds[i] - lower) * (rank - seen) / count
+        seen += count
+    return float(bounds[-1])
+
+
+def histogramSummary(bounds, counts, total, count):
+    """count / mean / p50 / p99 (ms) of a seconds histogram given its per-bucket counts."""
+    return {
+        'count': count,
+        'meanMs': total * 1000 / count if count else 0.0,
+        'p50Ms': bucketQuantile(bounds, counts, 0.5) * 1000,
+        'p99Ms': bucketQuantile(bounds, counts, 0.99) * 1000,
+    }
+
+
+class Gauge:
+    """Value read at scrape time from fn()."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        yield self.name, None, self.fn()
+
+
+class Registry:
+    """Metrics of this process. collector(fn): fn() yields (name, kind, help, [(labels, value)])."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.constLabels = {}  # vd. worker="2" với --workers
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def gauge(self, name, help, fn):
+        return self.register(Gauge(name, help, fn))
+
+    def collector(self, fn):
+        with self.lock:
+            self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors)
+        const = self.constLabels
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_formatLabels({**const, **(labels or {})})} {_formatValue(value)}')
+        for fn in collectors:
+            for name, kind, help, samples in fn():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_formatLabels({**const, **labels})} {_formatValue(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+# Server: cập nhật trên đường gửi (mỗi frame một lần, không theo packet)
+FRAMES_SENT = REGISTRY.counter('rtp_server_frames_sent_total', "Video frames sent to sessions")
+PACKETS_SENT = REGISTRY.counter('rtp_server_packets_sent_total', "RTP media packets sent to sessions")
+BYTES_SENT = REGISTRY.counter('rtp_server_bytes_sent_total', "RTP media bytes sent to sessions (headers included)")
+PACKETS_DROPPED = REGISTRY.counter('rtp_server_packets_dropped_total', "RTP packets dropped on a full socket buffer")
+FRAGMENTS_PER_FRAME = REGISTRY.histogram('rtp_server_fragments_per_frame', "RTP packets per frame", COUNT_BUCKETS)
+FRAME_BYTES = REGISTRY.histogram('rtp_server_frame_bytes', "Encoded frame size in bytes", SIZE_BUCKETS)
+ENCODE_SECONDS = REGISTRY.histogram('rtp_server_encode_seconds', "JPEG encode time per frame")
+SEND_SECONDS = REGISTRY.histogram('rtp_server_send_seconds', "Packetize + transmit time per frame")
+PACING_LATENESS = REGISTRY.histogram('rtp_server_pacing_lateness_seconds',
+                                     "How late frames were against their deadline (0 = on time)")
+
+# Client: registry riêng (ClientLauncher --metrics-port), cập nhật theo packet / frame nhận được
+CLIENT_REGISTRY = Registry()
+PACKETS_RECEIVED = CLIENT_REGISTRY.counter('rtp_client_packets_received_total', "RTP media packets received")
+BYTES_RECEIVED = CLIENT_REGISTRY.counter('rtp_client_bytes_received_total', "RTP bytes received")
+FRAMES_COMPLETE = CLIENT_REGISTRY.counter('rtp_client_frames_complete_total', "Frames reassembled completely")
+FRAMES_PARTIAL = CLIENT_REGISTRY.counter('rtp_client_frames_partial_total', "Frames missing fragments (not displayed)")
+FRAME_INTERVAL = CLIENT_REGISTRY.histogram('rtp_client_frame_interval_seconds', "Time between complete frames")
+LATENCY = CLIENT_REGISTRY.histogram('rtp_client_latency_seconds',
+                                    "Frame display time minus its send deadline (sender clock from RTCP SR)")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # không in mỗi lần scrape
+
+
+def startMetricsServer(port, host='127.0.0.1', registry=REGISTRY):
+    """Serve GET /metrics on host:port from a daemon thread. Raises OSError if the port is taken."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"[METRICS] http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Gửi lại có chọn lọc theo NACK (RTCP generic NACK, RFC 4585) - thay cho FEC trên link RTT thấp.
+
+- Server: PacketHistory giữ các packet vừa gửi trong một ring cấp phát sẵn (một bytearray
+  + các array theo slot, slot = seq % capacity), không cấp phát gì theo packet. NACK tới thì
+  gửi lại đúng packet cũ (cùng seq), có giới hạn tốc độ (token bucket) và mỗi seq không gửi
+  lại quá dày.
+- Client: NackTracker phát hiện lỗ trong sequence number, NACK ngay, NACK lại sau mỗi
+  retryInterval, bỏ cuộc khi hết lượt hoặc packet quá cũ (frame đã qua).
+"""
+import threading
+from array import array
+
+from RtpPacket import HEADER_SIZE
+
+DEFAULT_HISTORY_PACKETS = 512
+# Trần bộ nhớ của ring: packet lớn (MTU loopback/jumbo) thì giữ ít slot hơn
+MAX_HISTORY_BYTES = 8 * 1024 * 1024
+# Packet cũ hơn thế này không gửi lại nữa (client đã phát qua frame đó)
+MAX_RETRANSMIT_AGE = 0.5
+# Khoảng tối thiểu giữa 2 lần gửi lại cùng một seq
+MIN_RESEND_INTERVAL = 0.02
+# Token bucket: số packet gửi lại tối đa mỗi giây và số packet dồn tối đa
+RETRANSMIT_RATE = 1000
+RETRANSMIT_BURST = 100
+
+NACK_RETRY_INTERVAL = 0.05
+NACK_MAX_RETRIES = 3
+NACK_MAX_AGE = 0.3
+# Lỗ lớn hơn thế (seek, server khởi động lại) không NACK
+NACK_MAX_GAP = 256
+
+
+class PacketHistory:
+    """
+    Ring of the last `capacity` RTP packets sent (capacity rounded up to a power of two, then
+    halved while the ring would exceed MAX_HISTORY_BYTES).
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_PACKETS, slotSize=HEADER_SIZE + 1400,
+                 rate=RETRANSMIT_RATE, burst=RETRANSMIT_BURST):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        while size > 16 and size * slotSize > MAX_HISTORY_BYTES:
+            size >>= 1
+        self.capacity = size
+        self.mask = size - 1
+        self.slotSize = slotSize
+        self.buf = bytearray(size * slotSize)
+        self.view = memoryview(self.buf)
+        self.seqs = array('l', [-1]) * size
+        self.lengths = array('H', [0]) * size
+        self.sentAt = array('d', [0.0]) * size
+        self.resentAt = array('d', [0.0]) * size
+        self.lock = threading.Lock()  # sender thread ghi, thread RTCP đọc
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.tokensAt = None
+
+        # Stats
+        self.requested = 0
+        self.retransmitted = 0
+        self.retransmittedBytes = 0
+        self.unavailable = 0  # đã bị ghi đè / quá cũ
+        self.limited = 0      # bị giới hạn tốc độ
+
+    def store(self, batch, start, end, now):
+        """Copy packets [start, end) of an RtpPacketBatch into their slots."""
+        buf = self.buf
+        slotSize = self.slotSize
+        with self.lock:
+            for i in range(start, end):
+                header = batch.header(i)
+                payload = batch.payloadOf(i)
+                seq = (header[2] << 8) | header[3]
+                slot = seq & self.mask
+                at = slot * slotSize
+                headerSize = len(header)
+                length = min(headerSize + len(payload), slotSize)
+                buf[at: at + headerSize] = header
+                buf[at + headerSize: at + length] = payload[:length - headerSize]
+                self.seqs[slot] = seq
+                self.lengths[slot] = length
+                self.sentAt[slot] = now
+                self.resentAt[slot] = 0.0
+
+    def retransmit(self, seqs, send, now):
+        """Call send(packet) for every requested seq still available; returns packets resent."""
+        resent = 0
+        with self.lock:
+            self.refill(now)
+            for seq in seqs:
+                self.requested += 1
+                slot = seq & self.mask
+                if self.seqs[slot] != seq or now - self.sentAt[slot] > MAX_RETRANSMIT_AGE:
+                    self.unavailable += 1
+                    continue
+                if now - self.resentAt[slot] < MIN_RESEND_INTERVAL or self.tokens < 1:
+                    self.limited += 1
+                    continue
+                at = slot * self.slotSize
+                length = self.lengths[slot]
+                try:
+                    send(self.view[at: at + length])
+                except OSError:
+                    break  # buffer gửi đầy: NACK lần sau xin lại
+                self.tokens -= 1
+                self.resentAt[slot] = now
+                self.retransmitted += 1
+                self.retransmittedBytes += length
+                resent += 1
+        return resent
+
+    def refill(self, now):
+        if self.tokensAt is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.tokensAt) * self.rate)
+        self.tokensAt = now
+
+    def printStats(self):
+        print(f"  NACK retransmits    : {self.retransmitted} of {self.requested} requested "
+              f"({self.unavailable} unavailable, {self.limited} rate limited, {self.retransmittedBytes} bytes)")
+
+
+class NackTracker:
+    """
+    Receiver side: onPacket(seq, now) -> 16-bit seqs to NACK now (new gaps and due retries).
+    Entries leave when the packet arrives (recovered), is repaired otherwise (discard) or
+    expires (unrecovered).
+    """
+
+    def __init__(self, retryInterval=NACK_RETRY_INTERVAL, maxRetries=NACK_MAX_RETRIES,
+                 maxAge=NACK_MAX_AGE):
+        self.retryInterval = retryInterval
+        self.maxRetries = maxRetries
+        self.maxAge = maxAge
+        self.active = False  # bật khi SETUP reply xác nhận RTCP-FB: nack
+
+        # Stats
+        self.requested = 0
+        self.recovered = 0
+        self.unrecovered = 0
+        self.reset()
+
+    def reset(self):
+        """New PLAY segment: forget the sequence state (stats are kept)."""
+        self.highSeq = None
+        self.missing = {}  # seq mở rộng -> [lần đầu thấy thiếu, lần NACK gần nhất, số lần NACK]
+
+    def extend(self, seq):
+        if self.highSeq is None:
+            return seq
+        delta = (seq - self.highSeq) & 0xFFFF
+        if delta >= 0x8000:
+            delta -= 0x10000
+        return self.highSeq + delta
+
+    def onPacket(self, seq, now):
+        ext = self.extend(seq)
+        if self.highSeq is None:
+            self.highSeq = ext
+            return []
+        if ext > self.highSeq:
+            gap = ext - self.highSeq - 1
+            if gap > NACK_MAX_GAP:
+                self.missing.clear()
+            else:
+                for missingSeq in range(self.highSeq + 1, ext):
+                    self.missing[missingSeq] = [now, 0.0, 0]
+            self.highSeq = ext
+        else:
+            entry = self.missing.pop(ext, None)
+            if entry is not None and entry[2] > 0:
+                self.recovered += 1
+        if not self.missing:
+            return []
+        return self.due(now)
+
+    def discard(self, seq):
+        """A missing packet was rebuilt another way (FEC): stop asking for it."""
+        if self.highSeq is not None:
+            self.missing.pop(self.extend(seq), None)
+
+    def due(self, now):
+        nacks = []
+        for seq in list(self.missing):
+            firstSeen, lastNack, tries = entry = self.missing[seq]
+            if now - lastNack < self.retryInterval:
+                continue
+            if tries >= self.maxRetries or now - firstSeen > self.maxAge:
+                del self.missing[seq]
+                self.unrecovered += 1
+                continue
+            entry[1] = now
+            entry[2] = tries + 1
+            nacks.append(seq & 0xFFFF)
+        self.requested += len(nacks)
+        return nacks
+
+    def stats(self):
+        return {
+            'requested': self.requested,
+            'recovered': self.recovered,
+            'unrecovered': self.unrecovered,
+        }
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Pacing theo deadline: frame thứ i được gửi tại start + i / fps (đồng hồ monotonic),
+nên thời gian đọc + encode + gửi không làm lệch tốc độ khung hình.
+"""
+import math
+from time import monotonic, sleep
+
+import Metrics
+
+# Trễ hơn chừng này frame thì bỏ frame để bắt kịp thay vì gửi dồn
+DEFAULT_MAX_LAG_FRAMES = 2
+# Khoảng nghỉ nhỏ nhất giữa các đợt gửi khi dàn đều fragment (sleep ngắn hơn không chính xác)
+MIN_SPREAD_GAP = 0.001
+
+
+class FramePacer:
+    """Per-session frame clock with drift-free deadlines, catch-up and frame dropping."""
+
+    def __init__(self, fps, maxLagFrames=DEFAULT_MAX_LAG_FRAMES, spreadFraction=0.0, dropLateFrames=True):
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self.maxLag = maxLagFrames * self.interval
+        self.spreadFraction = spreadFraction
+        # False (TCP interleaved): trễ vì bên nhận chậm thì dời đồng hồ thay vì bỏ frame
+        self.dropLateFrames = dropLateFrames
+
+        # Stats
+        self.framesDropped = 0
+        self.stalls = 0
+        self.stallTime = 0.0
+        self.lateFrames = 0
+        self.maxLateness = 0.0
+        self.reset()
+
+    def reset(self):
+        """Restart the clock (PLAY / resume after PAUSE): next frame is due now."""
+        self.startTime = monotonic()
+        self.frameIndex = 0
+
+    def deadline(self):
+        """Deadline of the next frame."""
+        return self.startTime + self.frameIndex * self.interval
+
+    def framesToDrop(self):
+        """How many frames to skip because we are more than maxLag behind the clock."""
+        lag = monotonic() - self.deadline()
+        if lag <= self.maxLag:
+            return 0
+        if not self.dropLateFrames:
+            # Sender bị chặn (backpressure): phát chậm lại, không bắn dồn để bắt kịp
+            self.startTime += lag
+            self.stalls += 1
+            self.stallTime += lag
+            return 0
+        return int(lag / self.interval)
+
+    def skip(self, count):
+        self.frameIndex += count
+        self.framesDropped += count
+
+    def delay(self):
+        """Seconds until the next frame is due (0 if it is late; lateness is recorded)."""
+        remaining = self.deadline() - monotonic()
+        if remaining >= 0:
+            Metrics.PACING_LATENESS.observe(0.0)
+            return remaining
+        Metrics.PACING_LATENESS.observe(-remaining)
+        self.lateFrames += 1
+        if -remaining > self.maxLateness:
+            self.maxLateness = -remaining
+        return 0.0
+
+    def wait(self):
+        """Block until the next frame is due."""
+        remaining = self.delay()
+        if remaining > 0:
+            sleep(remaining)
+
+    def advance(self):
+        self.frameIndex += 1
+
+    def spreadPlan(self, packetCount):
+        """
+        Split a frame's packets into bursts spread over spreadFraction of the frame interval.
+        Returns (packetsPerBurst, gapSeconds); (packetCount, 0) means one burst.
+        """
+        window = self.interval * self.spreadFraction
+        if window <= 0 or packetCount <= 1:
+            return packetCount, 0.0
+        bursts = min(packetCount, max(1, int(window / MIN_SPREAD_GAP)))
+        perBurst = math.ceil(packetCount / bursts)
+        bursts = math.ceil(packetCount / perBurst)
+        if bursts <= 1:
+            return packetCount, 0.0
+        return perBurst, window / bursts
+
+    def printStats(self):
+        print(f"  Pacing FPS          : {self.fps:.2f} fps")
+        print(f"  Late frames         : {self.lateFrames} (max {self.maxLateness * 1000:.1f} ms)")
+        print(f"  Frames dropped      : {self.framesDropped}")
+        if self.stalls:
+            print(f"  Sender stalls       : {self.stalls} ({self.stallTime * 1000:.0f} ms behind, clock shifted)")
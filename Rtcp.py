@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+RTCP Sender Report / Receiver Report (RFC 3550, mục 6.4) trên cổng RTP+1.
+
+- Server gửi SR (NTP time <-> RTP timestamp, số packet/octet đã gửi).
+- Client gửi RR: fraction lost, cumulative lost, highest seq, interarrival jitter,
+  LSR/DLSR -> server tính RTT = now - LSR - DLSR.
+- Client gửi generic NACK (RFC 4585, mục 6.2.1) xin gửi lại các sequence number bị mất.
+"""
+import socket
+import struct
+from time import time
+
+from RtpPacket import RTP_CLOCK_RATE
+
+RTCP_VERSION = 2
+PT_SR = 200
+PT_RR = 201
+PT_RTPFB = 205          # transport layer feedback (RFC 4585)
+FMT_GENERIC_NACK = 1
+
+# Chu kỳ gửi SR/RR (giây)
+RTCP_INTERVAL = 1.0
+
+# Giây giữa mốc NTP (1900) và mốc Unix (1970)
+NTP_EPOCH_OFFSET = 2208988800
+
+_HEADER = struct.Struct('!BBH')           # V/P/RC, PT, length (số word 32-bit - 1)
+_SENDER_INFO = struct.Struct('!IIIIII')   # SSRC, NTP msw, NTP lsw, RTP ts, packets, octets
+_REPORT_BLOCK = struct.Struct('!IIIIII')  # SSRC, fraction+cumulative, ext highest seq, jitter, LSR, DLSR
+_SSRC = struct.Struct('!I')
+_NACK_FCI = struct.Struct('!HH')          # PID (seq mất đầu tiên), BLP (bitmask 16 seq tiếp theo)
+
+
+def ntpTime(now=None):
+    """(seconds, fraction) NTP timestamp of a Unix time."""
+    now = time() if now is None else now
+    seconds = int(now)
+    return (seconds + NTP_EPOCH_OFFSET) & 0xFFFFFFFF, int((now - seconds) * (1 << 32)) & 0xFFFFFFFF
+
+
+def ntpMiddle(now=None):
+    """Middle 32 bits of the NTP timestamp (16.16 fixed point), as used by LSR/DLSR."""
+    msw, lsw = ntpTime(now)
+    return ((msw & 0xFFFF) << 16) | (lsw >> 16)
+
+
+def buildSenderReport(ssrc, rtpTimestamp, packetCount, octetCount, now=None):
+    """SR saying that media time rtpTimestamp corresponds to wall-clock time now."""
+    msw, lsw = ntpTime(now)
+    return (_HEADER.pack(RTCP_VERSION << 6, PT_SR, 6)
+            + _SENDER_INFO.pack(ssrc, msw, lsw, rtpTimestamp & 0xFFFFFFFF,
+                                packetCount & 0xFFFFFFFF, octetCount & 0xFFFFFFFF))
+
+
+def buildReceiverReport(ssrc, block=None):
+    """RR from `ssrc` with zero or one ReportBlock."""
+    if block is None:
+        return _HEADER.pack(RTCP_VERSION << 6, PT_RR, 1) + _SSRC.pack(ssrc)
+    return _HEADER.pack((RTCP_VERSION << 6) | 1, PT_RR, 7) + _SSRC.pack(ssrc) + block.pack()
+
+
+def buildNack(senderSsrc, mediaSsrc, seqs):
+    """Generic NACK for 16-bit sequence numbers (ascending): one PID/BLP entry per 17-seq span."""
+    fci = bytearray()
+    pid = None
+    blp = 0
+    for seq in seqs:
+        offset = (seq - pid) & 0xFFFF if pid is not None else 0
+        if pid is not None and 0 < offset <= 16:
+            blp |= 1 << (offset - 1)
+            continue
+        if pid is not None:
+            fci += _NACK_FCI.pack(pid, blp)
+        pid, blp = seq, 0
+    if pid is not None:
+        fci += _NACK_FCI.pack(pid, blp)
+    return (_HEADER.pack((RTCP_VERSION << 6) | FMT_GENERIC_NACK, PT_RTPFB, 2 + len(fci) // 4)
+            + _SSRC.pack(senderSsrc) + _SSRC.pack(mediaSsrc) + fci)
+
+
+class ReportBlock:
+    """One reception report block (about the stream of sourceSsrc)."""
+    __slots__ = ('sourceSsrc', 'fractionLost', 'cumulativeLost', 'highestSeq', 'jitter', 'lsr', 'dlsr')
+
+    def __init__(self, sourceSsrc, fractionLost, cumulativeLost, highestSeq, jitter, lsr, dlsr):
+        self.sourceSsrc = sourceSsrc
+        self.fractionLost = fractionLost      # 0..255 (loss / 256) trong khoảng vừa qua
+        self.cumulativeLost = cumulativeLost  # signed 24-bit
+        self.highestSeq = highestSeq          # extended highest sequence number
+        self.jitter = jitter                  # đơn vị timestamp RTP
+        self.lsr = lsr
+        self.dlsr = dlsr                      # đơn vị 1/65536 s
+
+    def pack(self):
+        lost = max(-0x800000, min(0x7FFFFF, self.cumulativeLost)) & 0xFFFFFF
+        return _REPORT_BLOCK.pack(self.sourceSsrc, (self.fractionLost << 24) | lost,
+                                  self.highestSeq & 0xFFFFFFFF, int(self.jitter) & 0xFFFFFFFF,
+                                  self.lsr, self.dlsr)
+
+    @classmethod
+    def unpack(cls, data, offset):
+        ssrc, lostWord, highest, jitter, lsr, dlsr = _REPORT_BLOCK.unpack_from(data, offset)
+        lost = lostWord & 0xFFFFFF
+        if lost & 0x800000:
+            lost -= 0x1000000
+        return cls(ssrc, lostWord >> 24, lost, highest, jitter, lsr, dlsr)
+
+
+class SenderReport:
+    __slots__ = ('ssrc', 'ntpMsw', 'ntpLsw', 'rtpTimestamp', 'packetCount', 'octetCount', 'blocks')
+
+    def __init__(self, ssrc, ntpMsw, ntpLsw, rtpTimestamp, packetCount, octetCount, blocks):
+        self.ssrc = ssrc
+        self.ntpMsw = ntpMsw
+        self.ntpLsw = ntpLsw
+        self.rtpTimestamp = rtpTimestamp
+        self.packetCount = packetCount
+        self.octetCount = octetCount
+        self.blocks = blocks
+
+    def ntpMiddle(self):
+        return ((self.ntpMsw & 0xFFFF) << 16) | (self.ntpLsw >> 16)
+
+    def wallTime(self):
+        """Sender's Unix time at which rtpTimestamp was due."""
+        return self.ntpMsw - NTP_EPOCH_OFFSET + self.ntpLsw / (1 << 32)
+
+
+class ReceiverReport:
+    __slots__ = ('ssrc', 'blocks')
+
+    def __init__(self, ssrc, blocks):
+        self.ssrc = ssrc
+        self.blocks = blocks
+
+
+class Nack:
+    __slots__ = ('ssrc', 'mediaSsrc', 'seqs')
+
+    def __init__(self, ssrc, mediaSsrc, seqs):
+        self.ssrc = ssrc
+        self.mediaSsrc = mediaSsrc
+        self.seqs = seqs  # seq 16-bit client xin gửi lại
+
+
+def parseRtcp(data):
+    """Parse a (compound) RTCP packet into SenderReport / ReceiverReport / Nack objects; other types are skipped."""
+    reports = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        first, pt, length = _HEADER.unpack_from(data, offset)
+        end = offset + (length + 1) * 4
+        if first >> 6 != RTCP_VERSION or end > len(data):
+            break
+        count = first & 0x1F
+        body = offset + _HEADER.size
+        if pt == PT_SR and body + _SENDER_INFO.size <= end:
+            info = _SENDER_INFO.unpack_from(data, body)
+            blocksAt = body + _SENDER_INFO.size
+            reports.append(SenderReport(*info, blocks=_parseBlocks(data, blocksAt, count, end)))
+        elif pt == PT_RR and body + _SSRC.size <= end:
+            ssrc, = _SSRC.unpack_from(data, body)
+            reports.append(ReceiverReport(ssrc, _parseBlocks(data, body + _SSRC.size, count, end)))
+        elif pt == PT_RTPFB and count == FMT_GENERIC_NACK and body + 2 * _SSRC.size <= end:
+            ssrc, = _SSRC.unpack_from(data, body)
+            mediaSsrc, = _SSRC.unpack_from(data, body + _SSRC.size)
+            seqs = []
+            for at in range(body + 2 * _SSRC.size, end - _NACK_FCI.size + 1, _NACK_FCI.size):
+                pid, blp = _NACK_FCI.unpack_from(data, at)
+                seqs.append(pid)
+                seqs.extend((pid + bit + 1) & 0xFFFF for bit in range(16) if blp >> bit & 1)
+            reports.append(Nack(ssrc, mediaSsrc, seqs))
+        offset = end
+    return reports
+
+
+def _parseBlocks(data, offset, count, end):
+    blocks = []
+    for i in range(count):
+        at = offset + i * _REPORT_BLOCK.size
+        if at + _REPORT_BLOCK.size > end:
+            break
+        blocks.append(ReportBlock.unpack(data, at))
+    return blocks
+
+
+class ReceptionStats:
+    """
+    Receiver side of RFC 3550 (A.1, A.3, A.8): extended highest seq, expected/lost,
+    fraction lost per report interval and interarrival jitter. Not thread-safe: update
+    from the RTP thread, build reports from anywhere (reads are racy but harmless).
+    """
+
+    def __init__(self, clockRate=RTP_CLOCK_RATE):
+        self.clockRate = clockRate
+        self.sourceSsrc = None
+        self.baseSeq = None
+        self.maxSeq = 0
+        self.cycles = 0
+        self.received = 0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+        self.transit = None
+        self.jitter = 0.0  # đơn vị timestamp RTP
+
+        # SR gần nhất từ sender
+        self.lastSrMiddle = 0
+        self.lastSrArrival = None
+        self.srWallTime = None     # SR: media time srRtpTimestamp <-> Unix time của sender
+        self.srRtpTimestamp = 0
+
+    def onPacket(self, ssrc, seq, timestamp, arrival=None):
+        arrival = time() if arrival is None else arrival
+        if self.baseSeq is None or ssrc != self.sourceSsrc:
+            self.sourceSsrc = ssrc
+            self.baseSeq = seq
+            self.maxSeq = seq
+            self.cycles = 0
+            self.received = 0
+            self.expectedPrior = 0
+            self.receivedPrior = 0
+            self.transit = None
+            self.jitter = 0.0
+        else:
+            delta = (seq - self.maxSeq) & 0xFFFF
+            if 0 < delta < 0x8000:
+                if seq < self.maxSeq:
+                    self.cycles += 1 << 16  # seq quay vòng qua 65535
+                self.maxSeq = seq
+        self.received += 1
+
+        # J += (|D| - J) / 16, D = chênh lệch transit time giữa 2 packet liên tiếp
+        transit = int(arrival * self.clockRate) - timestamp
+        if self.transit is not None:
+            d = abs(transit - self.transit)
+            if d < 1 << 31:
+                self.jitter += (d - self.jitter) / 16.0
+        self.transit = transit
+
+    def onSenderReport(self, report, arrival=None):
+        self.lastSrMiddle = report.ntpMiddle()
+        self.lastSrArrival = time() if arrival is None else arrival
+        self.srWallTime = report.wallTime()
+        self.srRtpTimestamp = report.rtpTimestamp
+
+    def wallClock(self, timestamp):
+        """Sender's Unix time for an RTP timestamp (from the latest SR); None before the first SR."""
+        if self.srWallTime is None:
+            return None
+        diff = (timestamp - self.srRtpTimestamp) & 0xFFFFFFFF
+        if diff >= 0x80000000:
+            diff -= 0x100000000
+        return self.srWallTime + diff / self.clockRate
+
+    def extendedMax(self):
+        return self.cycles + self.maxSeq
+
+    def expected(self):
+        if self.baseSeq is None:
+            return 0
+        return self.extendedMax() - self.baseSeq + 1
+
+    def cumulativeLost(self):
+        return self.expected() - self.received
+
+    def jitterMs(self):
+        return self.jitter * 1000.0 / self.clockRate
+
+    def makeBlock(self, now=None):
+        """Report block for the interval since the last call (updates the interval counters)."""
+        if self.baseSeq is None:
+            return None
+        now = time() if now is None else now
+        expected = self.expected()
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        lostInterval = expectedInterval - receivedInterval
+        fraction = (lostInterval << 8) // expectedInterval if expectedInterval > 0 and lostInterval > 0 else 0
+
+        if self.lastSrArrival is None:
+            lsr, dlsr = 0, 0
+        else:
+            lsr = self.lastSrMiddle
+            dlsr = int((now - self.lastSrArrival) * 65536) & 0xFFFFFFFF
+        return ReportBlock(self.sourceSsrc, min(fraction, 255), self.cumulativeLost(),
+                           self.extendedMax(), self.jitter, lsr, dlsr)
+
+
+class SenderRtcpStats:
+    """Server side: what the latest receiver reports say about one session's stream."""
+
+    def __init__(self, clockRate=RTP_CLOCK_RATE):
+        self.clockRate = clockRate
+        self.reports = 0
+        self.fractionLost = 0.0
+        self.cumulativeLost = 0
+        self.highestSeq = 0
+        self.jitterMs = 0.0
+        self.rttMs = None
+        self.maxRttMs = 0.0
+        self.lastSrTime = None
+        self.srSent = 0
+
+    def srDue(self, now):
+        return self.lastSrTime is None or now - self.lastSrTime >= RTCP_INTERVAL
+
+    def onReportBlock(self, block, arrival=None):
+        self.reports += 1
+        self.fractionLost = block.fractionLost / 256.0
+        self.cumulativeLost = block.cumulativeLost
+        self.highestSeq = block.highestSeq
+        self.jitterMs = block.jitter * 1000.0 / self.clockRate
+        if block.lsr:
+            # RTT = A - LSR - DLSR (16.16 fixed point, RFC 3550 6.4.1)
+            rtt = (ntpMiddle(arrival) - block.lsr - block.dlsr) & 0xFFFFFFFF
+            if rtt < 0x80000000:
+                self.rttMs = rtt * 1000.0 / 65536
+                self.maxRttMs = max(self.maxRttMs, self.rttMs)
+
+    def printStats(self):
+        if self.reports == 0:
+            print(f"  RTCP                : {self.srSent} SR sent, no receiver reports")
+            return
+        rtt = f"{self.rttMs:.2f} ms (max {self.maxRttMs:.2f} ms)" if self.rttMs is not None else "n/a"
+        print(f"  RTCP reports        : {self.srSent} SR sent / {self.reports} RR received")
+        print(f"  Receiver loss       : {self.cumulativeLost} packets (last interval {self.fractionLost * 100:.2f}%)")
+        print(f"  Interarrival jitter : {self.jitterMs:.2f} ms")
+        print(f"  RTT                 : {rtt}")
+
+
+def bindPortPair(host=''):
+    """Bind two UDP sockets on an even port n (RTP) and n + 1 (RTCP)."""
+    for _ in range(50):
+        rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtpSocket.bind((host, 0))
+        port = rtpSocket.getsockname()[1]
+        if port % 2 == 0 and port < 65535:
+            rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                rtcpSocket.bind((host, port + 1))
+                return rtpSocket, rtcpSocket
+            except OSError:
+                rtcpSocket.close()
+        rtpSocket.close()
+    raise OSError("no free RTP/RTCP port pair")
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+RTP payload format cho JPEG (RFC 2435), để player chuẩn (ffplay, VLC, GStreamer) nhận được.
+
+Mỗi packet: header RTP + main JPEG header 8 byte (fragment offset 24 bit, type, Q, width/8,
+height/8) [+ restart marker header 4 byte nếu có DRI]. Packet đầu frame mang thêm bảng
+lượng tử (Q = 255, bảng đi kèm trong stream). Phần dữ liệu chỉ là entropy-coded scan; bên
+nhận dựng lại header JFIF (DQT, SOF0, DHT chuẩn, SOS) từ type/Q/kích thước/bảng lượng tử.
+
+Sender: chỉ JPEG baseline 8 bit, YUV 4:2:2 (type 0) hoặc 4:2:0 (type 1), bảng Huffman chuẩn
+(Annex K.3) và kích thước chia hết cho 8 mới gửi thẳng được; frame khác được encode lại.
+Receiver: JpegAssembler ghép fragment theo fragment offset thay vì theo thứ tự seq.
+"""
+import struct
+
+from RtpPacket import HEADER_SIZE, HEADER_FORMAT, RtpPacketBatch, RtpPacketizer, payloadSizeForMtu
+from FrameAssembler import FrameAssembler, AssembledFrame
+
+JPEG_PT = 26
+PAYLOAD_RAW = 'raw'          # JPEG nguyên file, cắt theo seq (định dạng cũ của project)
+PAYLOAD_RFC2435 = 'rfc2435'
+PAYLOAD_FORMATS = (PAYLOAD_RAW, PAYLOAD_RFC2435)
+
+MAIN_HEADER_SIZE = 8
+RESTART_HEADER_SIZE = 4
+QTABLE_HEADER_SIZE = 4
+# Header payload tối đa mỗi packet (main + restart): trừ ra khi tính payload theo MTU
+MAX_JPEG_HEADER_SIZE = MAIN_HEADER_SIZE + RESTART_HEADER_SIZE
+DYNAMIC_Q = 255              # Q 128..255: bảng lượng tử đi trong packet đầu frame
+MAX_DIMENSION = 2040         # width/height lưu theo đơn vị 8 pixel trong 1 byte
+RESTART_TYPE_FLAG = 64
+
+_MAIN_HEADER = struct.Struct('!IBBBB')    # type-specific(8) + offset(24), type, Q, width/8, height/8
+_RESTART_HEADER = struct.Struct('!HH')    # restart interval, F/L/restart count
+_QTABLE_HEADER = struct.Struct('!BBH')    # MBZ, precision, length
+_SEGMENT = struct.Struct('!BBH')          # 0xFF, marker, length
+
+# Thứ tự zigzag: ZIGZAG[k] = vị trí (hàng * 8 + cột) của hệ số thứ k
+ZIGZAG = tuple(sorted(range(64), key=lambda p: (p // 8 + p % 8,
+                                                 p // 8 if (p // 8 + p % 8) % 2 else p % 8)))
+
+# Bảng lượng tử chuẩn (Annex K.1), thứ tự tự nhiên; RFC 2435 scale theo Q khi Q < 128
+_LUMA_QUANTIZER = (
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+)
+_CHROMA_QUANTIZER = (
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+) + (99,) * 32
+
+# Bảng Huffman chuẩn (Annex K.3): (số code theo độ dài 1..16, các giá trị)
+_LUMA_DC = (bytes((0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0)), bytes(range(12)))
+_CHROMA_DC = (bytes((0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0)), bytes(range(12)))
+_LUMA_AC = (bytes((0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7d)), bytes((
+    0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+    0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xa1, 0x08, 0x23, 0x42, 0xb1, 0xc1, 0x15, 0x52, 0xd1, 0xf0,
+    0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0a, 0x16, 0x17, 0x18, 0x19, 0x1a, 0x25, 0x26, 0x27, 0x28,
+    0x29, 0x2a, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+    0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+    0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7a, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+    0x8a, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5, 0xa6, 0xa7,
+    0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4, 0xb5, 0xb6, 0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3, 0xc4, 0xc5,
+    0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda, 0xe1, 0xe2,
+    0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea, 0xf1, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+    0xf9, 0xfa)))
+_CHROMA_AC = (bytes((0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77)), bytes((
+    0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+    0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xa1, 0xb1, 0xc1, 0x09, 0x23, 0x33, 0x52, 0xf0,
+    0x15, 0x62, 0x72, 0xd1, 0x0a, 0x16, 0x24, 0x34, 0xe1, 0x25, 0xf1, 0x17, 0x18, 0x19, 0x1a, 0x26,
+    0x27, 0x28, 0x29, 0x2a, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+    0x49, 0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+    0x69, 0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7a, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+    0x88, 0x89, 0x8a, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5,
+    0xa6, 0xa7, 0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4, 0xb5, 0xb6, 0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3,
+    0xc4, 0xc5, 0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2, 0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda,
+    0xe2, 0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+    0xf9, 0xfa)))
+# (class, id) -> bảng; class 0 = DC, 1 = AC; id 0 = luma, 1 = chroma
+STANDARD_HUFFMAN = {(0, 0): _LUMA_DC, (1, 0): _LUMA_AC, (0, 1): _CHROMA_DC, (1, 1): _CHROMA_AC}
+
+EOI = b'\xff\xd9'
+# 4 segment DHT chuẩn (luma DC/AC, chroma DC/AC): cho header dựng lại và cho MJPEG bỏ DHT (AVI1)
+STANDARD_DHT = b''.join(
+    _SEGMENT.pack(0xFF, 0xC4, 19 + len(values)) + bytes(((tableClass << 4) | tableId,)) + bits + values
+    for (tableClass, tableId), (bits, values) in sorted(STANDARD_HUFFMAN.items(), key=lambda t: (t[0][1], t[0][0])))
+
+
+class JpegFormatError(ValueError):
+    """The JPEG cannot be carried as RFC 2435 as is (or an RFC 2435 payload is malformed)."""
+
+
+class JpegInfo:
+    __slots__ = ('type', 'width', 'height', 'qtables', 'restartInterval', 'scanStart', 'scanEnd')
+
+    def __init__(self, jpegType, width, height, qtables, restartInterval, scanStart, scanEnd):
+        self.type = jpegType                    # 0 = 4:2:2, 1 = 4:2:0
+        self.width = width
+        self.height = height
+        self.qtables = qtables                  # luma + chroma, 64 byte mỗi bảng, thứ tự zigzag
+        self.restartInterval = restartInterval  # 0 = không có DRI
+        self.scanStart = scanStart              # [scanStart, scanEnd) = entropy-coded data
+        self.scanEnd = scanEnd
+
+
+def parseJpeg(data):
+    """JpegInfo of a baseline JPEG RFC 2435 can carry. Raises JpegFormatError otherwise."""
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    size = len(view)
+    if size < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        raise JpegFormatError("not a JPEG (no SOI)")
+    tables = {}
+    components = None
+    width = height = 0
+    restartInterval = 0
+    at = 2
+    while at + 4 <= size:
+        ff, marker, length = _SEGMENT.unpack_from(view, at)
+        if ff != 0xFF:
+            raise JpegFormatError(f"bad marker at {at}")
+        body = at + 4
+        end = at + 2 + length
+        if end > size:
+            raise JpegFormatError("truncated segment")
+        if marker == 0xDB:  # DQT: có thể nhiều bảng trong một segment
+            while body < end:
+                precision, tableId = view[body] >> 4, view[body] & 0x0F
+                if precision != 0:
+                    raise JpegFormatError("16-bit quantization table")
+                tables[tableId] = bytes(view[body + 1: body + 65])
+                body += 65
+        elif marker == 0xC0:  # SOF0 baseline
+            if view[body] != 8 or view[body + 5] != 3:
+                raise JpegFormatError("only 8-bit, 3-component baseline JPEG")
+            height, width = struct.unpack_from('!HH', view, body + 1)
+            components = [tuple(view[body + 6 + 3 * c: body + 9 + 3 * c]) for c in range(3)]
+        elif 0xC1 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            raise JpegFormatError(f"unsupported SOF{marker - 0xC0} (progressive/lossless/arithmetic)")
+        elif marker == 0xC4:  # DHT: phải là bảng chuẩn
+            while body < end:
+                tableClass, tableId = view[body] >> 4, view[body] & 0x0F
+                bits = bytes(view[body + 1: body + 17])
+                values = bytes(view[body + 17: body + 17 + sum(bits)])
+                if STANDARD_HUFFMAN.get((tableClass, tableId)) != (bits, values):
+                    raise JpegFormatError("non-standard Huffman tables")
+                body += 17 + len(values)
+        elif marker == 0xDD:  # DRI
+            restartInterval, = struct.unpack_from('!H', view, body)
+        elif marker == 0xDA:  # SOS: phần còn lại là scan
+            if view[body] != 3 or (view[body + 2], view[body + 4], view[body + 6]) != (0x00, 0x11, 0x11):
+                raise JpegFormatError("scan does not use the standard table layout")
+            return _finishInfo(view, tables, components, width, height, restartInterval, end)
+        at = end
+    raise JpegFormatError("no SOS")
+
+
+def _finishInfo(view, tables, components, width, height, restartInterval, scanStart):
+    if components is None:
+        raise JpegFormatError("no SOF0")
+    (_, lumaSampling, lumaTable), (_, cbSampling, cbTable), (_, crSampling, crTable) = components
+    if cbSampling != 0x11 or crSampling != 0x11 or cbTable != crTable:
+        raise JpegFormatError("unsupported chroma layout")
+    if lumaSampling == 0x21:
+        jpegType = 0
+    elif lumaSampling == 0x22:
+        jpegType = 1
+    else:
+        raise JpegFormatError(f"unsupported sampling {lumaSampling:#x}")
+    if width % 8 or height % 8 or not 0 < width <= MAX_DIMENSION or not 0 < height <= MAX_DIMENSION:
+        raise JpegFormatError(f"size {width}x{height} not representable")
+    if lumaTable not in tables or cbTable not in tables:
+        raise JpegFormatError("missing quantization table")
+    scanEnd = len(view)
+    if bytes(view[-2:]) == EOI:
+        scanEnd -= 2
+    return JpegInfo(jpegType, width, height, tables[lumaTable] + tables[cbTable],
+                    restartInterval, scanStart, scanEnd)
+
+
+def toBaseline(data, quality=90):
+    """Re-encode a JPEG RFC 2435 cannot carry (OpenCV: baseline, 4:2:0, standard tables, size cropped to x8)."""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        raise JpegFormatError("OpenCV is needed to re-encode this JPEG")
+    image = cv2.imdecode(np.frombuffer(bytes(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise JpegFormatError("undecodable JPEG")
+    height = min(image.shape[0] - image.shape[0] % 8, MAX_DIMENSION)
+    width = min(image.shape[1] - image.shape[1] % 8, MAX_DIMENSION)
+    ok, encoded = cv2.imencode('.jpg', image[:height, :width], [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise JpegFormatError("re-encode failed")
+    return encoded.tobytes()
+
+
+def makeQuantTables(q):
+    """Luma + chroma tables (zigzag) for Q 1..99, scaled from Annex K.1 as in RFC 2435 appendix A."""
+    factor = max(1, min(99, q))
+    scale = 5000 // factor if factor < 50 else 200 - factor * 2
+    out = bytearray(128)
+    for k, position in enumerate(ZIGZAG):
+        out[k] = max(1, min(255, (_LUMA_QUANTIZER[position] * scale + 50) // 100))
+        out[64 + k] = max(1, min(255, (_CHROMA_QUANTIZER[position] * scale + 50) // 100))
+    return bytes(out)
+
+
+def makeHeaders(jpegType, width, height, qtables, restartInterval=0):
+    """JFIF headers (SOI .. SOS) for an RFC 2435 frame, as in RFC 2435 appendix B."""
+    out = bytearray(b'\xff\xd8')
+    chromaTable = 1 if len(qtables) >= 128 else 0
+    for tableId in range(chromaTable + 1):
+        out += _SEGMENT.pack(0xFF, 0xDB, 67) + bytes((tableId,)) + qtables[tableId * 64: tableId * 64 + 64]
+    if restartInterval:
+        out += _SEGMENT.pack(0xFF, 0xDD, 4) + struct.pack('!H', restartInterval)
+    sampling = 0x21 if jpegType & 0x3F == 0 else 0x22
+    out += _SEGMENT.pack(0xFF, 0xC0, 17) + struct.pack('!BHHB', 8, height, width, 3)
+    out += bytes((0, sampling, 0, 1, 0x11, chromaTable, 2, 0x11, chromaTable))
+    out += STANDARD_DHT
+    out += _SEGMENT.pack(0xFF, 0xDA, 12) + bytes((3, 0, 0x00, 1, 0x11, 2, 0x11, 0, 63, 0))
+    return out
+
+
+def makePacketizer(payloadFormat, ssrc, mtu, reserve=0):
+    """
+    Packetizer for a session/channel: payload size from the MTU, minus the payload headers and
+    `reserve` bytes (FEC header, so that parity packets fit the MTU as well).
+    """
+    if payloadFormat == PAYLOAD_RFC2435:
+        return JpegPacketizer(ssrc, payloadSizeForMtu(mtu, HEADER_SIZE + MAX_JPEG_HEADER_SIZE + reserve))
+    return RtpPacketizer(ssrc=ssrc, pt=JPEG_PT, maxPayload=payloadSizeForMtu(mtu, HEADER_SIZE + reserve))
+
+
+class JpegPacketizer:
+    """
+    RtpPacketizer for RFC 2435: same interface (packetize -> RtpPacketBatch), headers
+    (RTP + JPEG main [+ restart]) packed into one reusable buffer. The payload is the
+    quantization table header + tables followed by the scan: one copy of the scan per frame.
+    """
+
+    def __init__(self, ssrc, maxPayload, pt=JPEG_PT, version=2):
+        self.ssrc = ssrc
+        self.pt = pt
+        self.maxPayload = maxPayload
+        self.maxPacketSize = HEADER_SIZE + MAX_JPEG_HEADER_SIZE + maxPayload
+        self.byte0 = version << 6
+        self.headerBuf = bytearray((HEADER_SIZE + MAX_JPEG_HEADER_SIZE) * 64)
+        self.headerView = memoryview(self.headerBuf)
+
+        # Stats
+        self.framesReencoded = 0
+
+    def packetize(self, data, firstSeq, timestamp):
+        try:
+            info = parseJpeg(data)
+        except JpegFormatError as e:
+            if self.framesReencoded == 0:
+                print(f"[RTP/JPEG] re-encoding frames for RFC 2435: {e}")
+            data = toBaseline(data)
+            info = parseJpeg(data)
+            self.framesReencoded += 1
+        view = data if isinstance(data, memoryview) else memoryview(data)
+
+        qtables = info.qtables
+        payload = bytearray(_QTABLE_HEADER.pack(0, 0, len(qtables)))
+        payload += qtables
+        qtLength = len(payload)
+        payload += view[info.scanStart: info.scanEnd]
+
+        maxPayload = self.maxPayload
+        count = max(1, -(-len(payload) // maxPayload))
+        headerSize = HEADER_SIZE + MAIN_HEADER_SIZE + (RESTART_HEADER_SIZE if info.restartInterval else 0)
+        if count * headerSize > len(self.headerBuf):
+            self.headerView.release()
+            self.headerBuf = bytearray(count * headerSize * 2)
+            self.headerView = memoryview(self.headerBuf)
+
+        buf = self.headerBuf
+        pack = struct.pack_into
+        jpegType = info.type | (RESTART_TYPE_FLAG if info.restartInterval else 0)
+        widthBlocks = info.width // 8
+        heightBlocks = info.height // 8
+        timestamp &= 0xFFFFFFFF
+        last = count - 1
+        for i in range(count):
+            at = i * headerSize
+            # Fragment offset đếm trong dữ liệu scan (không tính bảng lượng tử ở packet đầu)
+            offset = i * maxPayload - qtLength if i else 0
+            pack(HEADER_FORMAT, buf, at, self.byte0, self.pt | 0x80 if i == last else self.pt,
+                 (firstSeq + i) & 0xFFFF, timestamp, self.ssrc)
+            pack('!IBBBB', buf, at + HEADER_SIZE, offset & 0xFFFFFF, jpegType, DYNAMIC_Q,
+                 widthBlocks, heightBlocks)
+            if info.restartInterval:
+                # F = L = 1, count 0x3FFF: packet không căn theo restart interval
+                _RESTART_HEADER.pack_into(buf, at + HEADER_SIZE + MAIN_HEADER_SIZE, info.restartInterval, 0xFFFF)
+
+        return RtpPacketBatch(self.headerView[:count * headerSize], memoryview(payload), count,
+                              maxPayload, headerSize)
+
+
+def parsePayload(payload):
+    """
+    (offset, type, q, width, height, restartInterval, qtables or None, dataStart) of an
+    RFC 2435 payload. Raises JpegFormatError.
+    """
+    if len(payload) < MAIN_HEADER_SIZE:
+        raise JpegFormatError("short RTP/JPEG payload")
+    word, jpegType, q, widthBlocks, heightBlocks = _MAIN_HEADER.unpack_from(payload, 0)
+    offset = word & 0xFFFFFF
+    at = MAIN_HEADER_SIZE
+    restartInterval = 0
+    if jpegType & RESTART_TYPE_FLAG:
+        if len(payload) < at + RESTART_HEADER_SIZE:
+            raise JpegFormatError("short restart header")
+        restartInterval, _ = _RESTART_HEADER.unpack_from(payload, at)
+        at += RESTART_HEADER_SIZE
+    if jpegType & 0x3F > 1:
+        raise JpegFormatError(f"unsupported RTP/JPEG type {jpegType}")
+    qtables = None
+    if q >= 128 and offset == 0:
+        if len(payload) < at + QTABLE_HEADER_SIZE:
+            raise JpegFormatError("short quantization table header")
+        _, precision, length = _QTABLE_HEADER.unpack_from(payload, at)
+        at += QTABLE_HEADER_SIZE
+        if precision != 0 or len(payload) < at + length:
+            raise JpegFormatError("unsupported quantization tables")
+        qtables = bytes(payload[at: at + length])
+        at += length
+    return offset, jpegType, q, widthBlocks * 8, heightBlocks * 8, restartInterval, qtables, at
+
+
+class _JpegPendingFrame:
+    __slots__ = ('timestamp', 'buf', 'end', 'received', 'offsets', 'startSeq', 'highSeq',
+                 'markerSeq', 'packets', 'header')
+
+    def __init__(self, timestamp, capacity):
+        self.timestamp = timestamp
+        self.buf = bytearray(capacity)
+        self.end = None          # kích thước scan (biết khi có packet marker)
+        self.received = 0        # số byte scan đã nhận
+        self.offsets = set()     # fragment offset đã nhận (lọc trùng)
+        self.startSeq = None     # seq của packet offset 0
+        self.highSeq = None
+        self.markerSeq = None
+        self.packets = 0
+        self.header = None       # (type, Q, width, height, DRI, bảng lượng tử)
+
+    def isComplete(self):
+        return self.header is not None and self.end is not None and self.received == self.end
+
+
+class JpegAssembler(FrameAssembler):
+    """
+    FrameAssembler for RFC 2435 payloads: fragments are placed by fragment offset (order of
+    arrival does not matter) and complete frames are handed out as full JFIF files.
+    """
+
+    def reset(self):
+        super().reset()
+        self.headerCache = {}
+        self.packetsMalformed = 0
+
+    def frameFor(self, timestamp):
+        pending = self.pending
+        for i in range(len(pending) - 1, -1, -1):
+            diff = ((timestamp - pending[i].timestamp + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            if diff == 0:
+                return pending[i]
+            if diff > 0:
+                frame = _JpegPendingFrame(timestamp, self.capacity)
+                pending.insert(i + 1, frame)
+                return frame
+        frame = _JpegPendingFrame(timestamp, self.capacity)
+        pending.insert(0, frame)
+        return frame
+
+    def addFragment(self, frame, seq, marker, payload):
+        if frame.highSeq is None or seq > frame.highSeq:
+            frame.highSeq = seq
+        try:
+            offset, jpegType, q, width, height, restartInterval, qtables, dataStart = parsePayload(payload)
+        except JpegFormatError:
+            self.packetsMalformed += 1
+            return
+        if offset in frame.offsets:
+            self.packetsDuplicate += 1
+            return
+        frame.offsets.add(offset)
+
+        data = memoryview(payload)[dataStart:]
+        end = offset + len(data)
+        if end > len(frame.buf):
+            frame.buf.extend(bytes(max(len(frame.buf), end - len(frame.buf))))
+        frame.buf[offset:end] = data
+        frame.received += len(data)
+        frame.packets += 1
+
+        if offset == 0:
+            frame.startSeq = seq
+            if qtables is None:
+                qtables = makeQuantTables(q) if q < 128 else b''
+            frame.header = (jpegType, q, width, height, restartInterval, qtables)
+        if marker:
+            frame.end = end
+            frame.markerSeq = seq
+            self.recentMarkers.append(seq)
+
+    def headersFor(self, header):
+        cached = self.headerCache.get(header)
+        if cached is None:
+            jpegType, _, width, height, restartInterval, qtables = header
+            cached = bytes(makeHeaders(jpegType, width, height, qtables, restartInterval))
+            if len(self.headerCache) > 16:
+                self.headerCache.clear()
+            self.headerCache[header] = cached
+        return cached
+
+    def finish(self, frame, complete):
+        self.lastEmittedTs = frame.timestamp
+        self.lastEmittedEnd = frame.markerSeq if frame.markerSeq is not None else frame.highSeq
+        if complete and not frame.header[5]:
+            complete = False  # Q >= 128 nhưng không có bảng (bảng tĩnh chưa từng nhận)
+        if complete:
+            self.framesComplete += 1
+            missing = 0
+            scan = memoryview(frame.buf)[:frame.end]
+            data = bytearray(self.headersFor(frame.header))
+            data += scan
+            if bytes(scan[-2:]) != EOI:
+                data += EOI
+            self.capacity = max(self.initialCapacity, frame.end + frame.end // 4)
+        else:
+            self.framesPartial += 1
+            if frame.startSeq is not None and frame.markerSeq is not None:
+                missing = max(1, frame.markerSeq - frame.startSeq + 1 - frame.packets)
+            else:
+                missing = 1
+            self.packetsMissing += missing
+            data = b''
+        return AssembledFrame(frame.timestamp, data, complete, frame.packets, missing, frame.highSeq & 0xFFFF)
+
+    def stats(self):
+        stats = super().stats()
+        stats['packetsMalformed'] = self.packetsMalformed
+        return stats
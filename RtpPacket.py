@@ -1,79 +1,210 @@
-# -*- coding: utf-8 -*-
-import sys
-from time import time
-
-HEADER_SIZE = 12
-
-class RtpPacket:
-    header = bytearray(HEADER_SIZE)
-
-    def __init__(self):
-        pass
-
-    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
-        """Encode the RTP packet with header fields and payload."""
-        timestamp = int(time())
-
-        # Byte 0: V (2 bits), P (1 bit), X (1 bit), CC (4 bits)
-        self.header[0] = (version << 6) | (padding << 5) | (extension << 4) | (cc & 0x0F)
-
-        # Byte 1: M (1 bit), PT (7 bits)
-        # marker nằm ở bit 7 (MSB)
-        self.header[1] = ((marker & 0x01) << 7) | (pt & 0x7F)
-
-        # Bytes 2-3: Sequence Number
-        self.header[2] = (seqnum >> 8) & 0xFF
-        self.header[3] = seqnum & 0xFF
-
-        # Bytes 4-7: Timestamp
-        self.header[4] = (timestamp >> 24) & 0xFF
-        self.header[5] = (timestamp >> 16) & 0xFF
-        self.header[6] = (timestamp >> 8) & 0xFF
-        self.header[7] = timestamp & 0xFF
-
-        # Bytes 8-11: SSRC
-        self.header[8] = (ssrc >> 24) & 0xFF
-        self.header[9] = (ssrc >> 16) & 0xFF
-        self.header[10] = (ssrc >> 8) & 0xFF
-        self.header[11] = ssrc & 0xFF
-
-        # Store payload
-        self.payload = payload
-
-    def decode(self, byteStream):
-        """Decode the RTP packet."""
-        self.header = bytearray(byteStream[:HEADER_SIZE])
-        self.payload = byteStream[HEADER_SIZE:]
-
-    def version(self):
-        """Return RTP version."""
-        return int(self.header[0] >> 6)
-
-    def seqNum(self):
-        """Return sequence (packet) number."""
-        seqNum = self.header[2] << 8 | self.header[3]
-        return int(seqNum)
-
-    def timestamp(self):
-        """Return timestamp."""
-        timestamp = (self.header[4] << 24) | (self.header[5] << 16) | \
-                    (self.header[6] << 8) | self.header[7]
-        return int(timestamp)
-
-    def payloadType(self):
-        """Return payload type."""
-        pt = self.header[1] & 0x7F
-        return int(pt)
-
-    def getMarker(self):
-        """Return marker bit (0 or 1)."""
-        # marker chính là bit 7 của header[1]
-        return (self.header[1] >> 7) & 0x01
-
-    def getPayload(self):
-        """Return payload."""
-        return self.payload
-
-    def getPacket(self):
-        """Return RTP packet."""
-        return self.header + self.payload
\ No newline at end of file
+# -*- coding: utf-8 -*-
+import sys
+import socket
+import struct
+from time import time
+
+HEADER_SIZE = 12
+HEADER_FORMAT = '!BBHII'
+# Đồng hồ media cho video (RFC 3551): timestamp tăng 90000 mỗi giây media
+RTP_CLOCK_RATE = 90000
+
+# MTU mặc định (Ethernet) và phần header IPv4 + UDP nằm trong MTU
+DEFAULT_MTU = 1500
+IP_UDP_HEADER_SIZE = 28
+MIN_MTU = 576
+# Trần cho MTU dò được (loopback báo 65536): chừa chỗ cho header RTP/JPEG/FEC trong datagram 64 KB
+MAX_MTU = 64000
+# Linux: IP_MTU_DISCOVER / IP_PMTUDISC_DO / IP_MTU (không có tên trong module socket)
+_IP_MTU_DISCOVER = 10
+_IP_PMTUDISC_DO = 2
+_IP_MTU = 14
+
+def timestampDiff(a, b):
+    """a - b for 32-bit RTP timestamps (wrap-aware, signed)."""
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def payloadSizeForMtu(mtu, headerSize=HEADER_SIZE):
+    """Largest RTP payload whose datagram (IP + UDP + headerSize + payload) fits in mtu."""
+    mtu = max(MIN_MTU, min(MAX_MTU, mtu))
+    return mtu - IP_UDP_HEADER_SIZE - headerSize
+
+
+def probePathMtu(host, port=9):
+    """
+    Path MTU towards host as known by the kernel (Linux, route MTU or a learned PMTU);
+    None if it cannot be queried. Nothing is sent.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+        sock.connect((host, port))
+        return sock.getsockopt(socket.IPPROTO_IP, _IP_MTU)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+class RtpPacket:
+    def __init__(self):
+        # Header riêng cho từng packet (trước đây là bytearray dùng chung ở mức class)
+        self.header = bytearray(HEADER_SIZE)
+
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None):
+        """Encode the RTP packet with header fields and payload (timestamp in RTP_CLOCK_RATE units)."""
+        if timestamp is None:
+            timestamp = int(time() * RTP_CLOCK_RATE)
+        timestamp &= 0xFFFFFFFF
+
+        # Byte 0: V (2 bits), P (1 bit), X (1 bit), CC (4 bits)
+        self.header[0] = (version << 6) | (padding << 5) | (extension << 4) | (cc & 0x0F)
+
+        # Byte 1: M (1 bit), PT (7 bits)
+        # marker nằm ở bit 7 (MSB)
+        self.header[1] = ((marker & 0x01) << 7) | (pt & 0x7F)
+
+        # Bytes 2-3: Sequence Number
+        self.header[2] = (seqnum >> 8) & 0xFF
+        self.header[3] = seqnum & 0xFF
+
+        # Bytes 4-7: Timestamp
+        self.header[4] = (timestamp >> 24) & 0xFF
+        self.header[5] = (timestamp >> 16) & 0xFF
+        self.header[6] = (timestamp >> 8) & 0xFF
+        self.header[7] = timestamp & 0xFF
+
+        # Bytes 8-11: SSRC
+        self.header[8] = (ssrc >> 24) & 0xFF
+        self.header[9] = (ssrc >> 16) & 0xFF
+        self.header[10] = (ssrc >> 8) & 0xFF
+        self.header[11] = ssrc & 0xFF
+
+        # Store payload
+        self.payload = payload
+
+    def decode(self, byteStream):
+        """Decode the RTP packet."""
+        self.header = bytearray(byteStream[:HEADER_SIZE])
+        self.payload = byteStream[HEADER_SIZE:]
+
+    def version(self):
+        """Return RTP version."""
+        return int(self.header[0] >> 6)
+
+    def seqNum(self):
+        """Return sequence (packet) number."""
+        seqNum = self.header[2] << 8 | self.header[3]
+        return int(seqNum)
+
+    def timestamp(self):
+        """Return timestamp."""
+        timestamp = (self.header[4] << 24) | (self.header[5] << 16) | \
+                    (self.header[6] << 8) | self.header[7]
+        return int(timestamp)
+
+    def ssrc(self):
+        """Return SSRC."""
+        return int.from_bytes(self.header[8:12], 'big')
+
+    def payloadType(self):
+        """Return payload type."""
+        pt = self.header[1] & 0x7F
+        return int(pt)
+
+    def getMarker(self):
+        """Return marker bit (0 or 1)."""
+        # marker chính là bit 7 của header[1]
+        return (self.header[1] >> 7) & 0x01
+
+    def getPayload(self):
+        """Return payload."""
+        return self.payload
+
+    def getPacket(self):
+        """Return RTP packet."""
+        return self.header + self.payload
+
+
+class RtpPacketBatch:
+    """
+    All RTP packets of one frame, without copying the payload.
+    Packet i = headers[i*h:(i+1)*h] + payload[i*maxPayload:(i+1)*maxPayload], h = headerSize
+    (12, or more when a payload header such as RFC 2435's follows the RTP header).
+    The header buffer belongs to the packetizer and is overwritten by the next packetize().
+    """
+    __slots__ = ('headers', 'payload', 'count', 'maxPayload', 'headerSize')
+
+    def __init__(self, headers, payload, count, maxPayload, headerSize=HEADER_SIZE):
+        self.headers = headers
+        self.payload = payload
+        self.count = count
+        self.maxPayload = maxPayload
+        self.headerSize = headerSize
+
+    def __len__(self):
+        return self.count
+
+    def totalBytes(self):
+        return self.count * self.headerSize + len(self.payload)
+
+    def payloadBytes(self, start, end):
+        """Payload bytes carried by packets [start, end)."""
+        return max(0, min(len(self.payload), end * self.maxPayload) - start * self.maxPayload)
+
+    def header(self, i):
+        size = self.headerSize
+        return self.headers[i * size: (i + 1) * size]
+
+    def payloadOf(self, i):
+        offset = i * self.maxPayload
+        return self.payload[offset: offset + self.maxPayload]
+
+    def packet(self, i):
+        """Packet i as one bytes object (copies; for fallbacks and debugging)."""
+        return bytes(self.header(i)) + bytes(self.payloadOf(i))
+
+
+class RtpPacketizer:
+    """
+    Fragments frames into RTP packets with no per-packet allocation or copy:
+    headers are written with struct.pack_into into one reusable buffer and
+    payloads are memoryview slices of the frame.
+    """
+
+    def __init__(self, ssrc, pt=26, maxPayload=1400, version=2):
+        self.ssrc = ssrc
+        self.pt = pt
+        self.maxPayload = maxPayload
+        self.maxPacketSize = HEADER_SIZE + maxPayload
+        self.byte0 = version << 6
+        self.headerBuf = bytearray(HEADER_SIZE * 64)
+        self.headerView = memoryview(self.headerBuf)
+
+    def packetize(self, data, firstSeq, timestamp):
+        """Return an RtpPacketBatch for frame `data`; sequence numbers start at firstSeq (mod 2^16)."""
+        payload = data if isinstance(data, memoryview) else memoryview(data)
+        size = len(payload)
+        maxPayload = self.maxPayload
+        count = max(1, -(-size // maxPayload))
+
+        if count * HEADER_SIZE > len(self.headerBuf):
+            # Không resize được bytearray đang có memoryview -> tạo buffer mới lớn hơn
+            self.headerView.release()
+            self.headerBuf = bytearray(count * HEADER_SIZE * 2)
+            self.headerView = memoryview(self.headerBuf)
+
+        buf = self.headerBuf
+        byte0 = self.byte0
+        pt = self.pt
+        ssrc = self.ssrc
+        timestamp &= 0xFFFFFFFF
+        pack = struct.pack_into
+        last = count - 1
+        for i in range(count):
+            # marker = 1 ở fragment cuối của frame
+            pack(HEADER_FORMAT, buf, i * HEADER_SIZE, byte0, pt | 0x80 if i == last else pt,
+                 (firstSeq + i) & 0xFFFF, timestamp, ssrc)
+
+        return RtpPacketBatch(self.headerView[:count * HEADER_SIZE], payload, count, maxPayload)
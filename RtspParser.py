@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Parser RTSP tăng dần (streaming) cho cả hai phía của kết nối RTSP.
+
+Byte đến theo từng lần recv() tùy ý: một request có thể bị cắt ở giữa, nhiều request
+(pipelining) hoặc packet RTP/RTCP $-framed (interleaved, RFC 2326 mục 10.12) có thể nằm
+chung một lần đọc. RtspParser giữ phần dở trong một bytearray, chỉ tìm dòng trống kết
+thúc header ở phần mới nhận, đọc body theo Content-Length và trả về từng message hoàn chỉnh.
+
+Message gửi đi dùng CRLF, kết thúc header bằng dòng trống và có Content-Length khi có body.
+Bên nhận chấp nhận cả LF đơn (client cũ).
+"""
+import struct
+
+from Interleaved import INTERLEAVED_MAGIC, PREFIX_SIZE
+
+RTSP_VERSION = 'RTSP/1.0'
+
+# Giới hạn để một kết nối hỏng / xấu không làm buffer phình mãi
+MAX_HEADER_BYTES = 8192
+MAX_BODY_BYTES = 64 * 1024
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    451: 'Parameter Not Understood',
+    455: 'Method Not Valid in This State',
+    457: 'Invalid Range',
+    461: 'Unsupported Transport',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+}
+
+_PREFIX = struct.Struct('!BBH')
+_CR = 0x0D
+_LF = 0x0A
+
+
+class RtspParseError(ValueError):
+    """The stream is not RTSP (or breaks a limit); the connection cannot be resynchronized."""
+
+
+class RtspMessage:
+    """
+    One request (method, uri) or reply (status, reason). headers: lower-case name -> value;
+    lines: start line, header lines, then '' and the body lines if there is a body.
+    """
+    __slots__ = ('method', 'uri', 'status', 'reason', 'headers', 'lines', 'body')
+
+    def __init__(self, lines, headers, method=None, uri=None, status=None, reason=None, body=b''):
+        self.lines = lines
+        self.headers = headers
+        self.method = method
+        self.uri = uri
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    @property
+    def isReply(self):
+        return self.status is not None
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    @property
+    def cseq(self):
+        return self.headers.get('cseq', '0')
+
+    @property
+    def session(self):
+        """Session id without its parameters ('123;timeout=60' -> '123'), or None."""
+        value = self.headers.get('session')
+        if value is None:
+            return None
+        return value.split(';', 1)[0].strip() or None
+
+    @property
+    def sessionTimeout(self):
+        """Seconds from 'Session: <id>;timeout=<s>', or None."""
+        for param in self.headers.get('session', '').split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'timeout':
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+def parseHead(head):
+    """RtspMessage (without body) from the bytes of a start line + headers."""
+    lines = head.decode('utf-8', errors='replace').split('\n')
+    lines = [line[:-1] if line.endswith('\r') else line for line in lines]
+    startLine = lines[0]
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise RtspParseError(f"malformed header line {line!r}")
+        headers[name.strip().lower()] = value.strip()
+
+    if startLine.startswith('RTSP/'):
+        parts = startLine.split(' ', 2)
+        try:
+            status = int(parts[1])
+        except (IndexError, ValueError):
+            raise RtspParseError(f"malformed status line {startLine!r}") from None
+        return RtspMessage(lines, headers, status=status, reason=parts[2] if len(parts) > 2 else '')
+
+    parts = startLine.split()
+    if len(parts) != 3 or not parts[2].startswith('RTSP/'):
+        raise RtspParseError(f"malformed request line {startLine!r}")
+    return RtspMessage(lines, headers, method=parts[0].upper(), uri=parts[1])
+
+
+class RtspParser:
+    """
+    Splits the byte stream of an RTSP connection into messages and $-framed packets.
+    feed() returns (None, RtspMessage) or (channel, packet bytes) items in arrival order;
+    raises RtspParseError on garbage.
+    """
+
+    def __init__(self, maxHeaderBytes=MAX_HEADER_BYTES, maxBodyBytes=MAX_BODY_BYTES):
+        self.maxHeaderBytes = maxHeaderBytes
+        self.maxBodyBytes = maxBodyBytes
+        self.buffer = bytearray()
+        self.scanned = 0  # số byte đầu của header đang chờ đã tìm dòng trống (không tìm lại)
+        self.pending = None  # (message, độ dài body) khi header xong mà body chưa đủ
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        items = []
+        pos = 0
+        try:
+            while pos < len(buffer):
+                if self.pending is not None:
+                    message, length = self.pending
+                    if len(buffer) - pos < length:
+                        break
+                    message.body = bytes(buffer[pos:pos + length])
+                    pos += length
+                    message.lines.append('')
+                    message.lines.extend(line.rstrip('\r') for line in
+                                         message.body.decode('utf-8', errors='replace').split('\n'))
+                    self.pending = None
+                    items.append((None, message))
+                    continue
+
+                first = buffer[pos]
+                if first == INTERLEAVED_MAGIC:
+                    if len(buffer) - pos < PREFIX_SIZE:
+                        break
+                    _, channel, length = _PREFIX.unpack_from(buffer, pos)
+                    end = pos + PREFIX_SIZE + length
+                    if len(buffer) < end:
+                        break
+                    items.append((channel, bytes(buffer[pos + PREFIX_SIZE:end])))
+                    pos = end
+                    continue
+                if first == _CR or first == _LF:
+                    pos += 1  # dòng trống thừa giữa các message
+                    continue
+
+                end = self.headerEnd(buffer, pos)
+                if end is None:
+                    if len(buffer) - pos > self.maxHeaderBytes:
+                        raise RtspParseError(f"header longer than {self.maxHeaderBytes} bytes")
+                    break
+                headEnd, bodyStart = end
+                if headEnd - pos > self.maxHeaderBytes:
+                    raise RtspParseError(f"header longer than {self.maxHeaderBytes} bytes")
+                message = parseHead(bytes(buffer[pos:headEnd]))
+                pos = bodyStart
+                self.scanned = 0
+
+                length = message.headers.get('content-length', '0')
+                try:
+                    length = int(length)
+                except ValueError:
+                    raise RtspParseError(f"bad Content-Length {length!r}") from None
+                if length < 0 or length > self.maxBodyBytes:
+                    raise RtspParseError(f"Content-Length {length} out of range")
+                if length:
+                    self.pending = (message, length)
+                else:
+                    items.append((None, message))
+        finally:
+            # Bỏ phần đã xử lý một lần mỗi feed(); phần dở nằm lại đầu buffer
+            del buffer[:pos]
+        return items
+
+    def headerEnd(self, buffer, start):
+        """(end of the header lines, start of the body) or None if the blank line has not arrived."""
+        searchFrom = start + max(self.scanned - 2, 0)
+        crlf = buffer.find(b'\n\r\n', searchFrom)
+        lf = buffer.find(b'\n\n', searchFrom)
+        if crlf == -1 and lf == -1:
+            self.scanned = len(buffer) - start
+            return None
+        if lf == -1 or (crlf != -1 and crlf < lf):
+            return crlf, crlf + 3
+        return lf, lf + 2
+
+
+def formatMessage(startLine, headers=(), body=b''):
+    """One RTSP message: CRLF line endings, Content-Length if there is a body, blank line after the headers."""
+    if isinstance(body, str):
+        body = body.encode()
+    lines = [startLine]
+    lines.extend(header for header in headers if header)
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+def formatRequest(method, uri, cseq, headers=(), body=b''):
+    return formatMessage(f"{method} {uri} {RTSP_VERSION}", [f"CSeq: {cseq}", *headers], body)
+
+
+def formatReply(status, cseq, headers=(), body=b''):
+    return formatMessage(f"{RTSP_VERSION} {status} {REASONS.get(status, 'Unknown')}", [f"CSeq: {cseq}", *headers], body)
@@ -1,30 +1,163 @@
-import sys, socket
-
-from ServerWorker import ServerWorker
-
-class Server:	
-	
-	def main(self):
-		try:
-			SERVER_PORT = int(sys.argv[1])
-		except:
-			print("[Usage: Server.py Server_port]\n")
-		rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		rtspSocket.bind(('', SERVER_PORT))
-		rtspSocket.listen(5)        
-
-		# Receive client info (address,port) through RTSP/TCP session
-		while True:
-			clientInfo = {}
-			clientInfo['rtspSocket'] = rtspSocket.accept()
-			ServerWorker(clientInfo).run()		
-		
-   
-   
-
-if __name__ == "__main__":
-	(Server()).main()
- 
- 
-
-
+import sys, socket, argparse, threading
+
+from ServerWorker import ServerWorker
+from FrameCache import FrameCache, DEFAULT_CACHE_BYTES
+import FramePipeline
+from BroadcastChannel import BroadcastChannel, DEFAULT_MULTICAST_PORT, DEFAULT_MULTICAST_TTL
+from Fec import parseFecSetting
+from RtpJpeg import PAYLOAD_FORMATS
+from VideoStream import VideoStream
+from Encoders import makeEncoder, EncoderError, ENCODER_NAMES, SUBSAMPLINGS
+import Metrics
+import StageTimer
+
+class Server:	
+	
+	def main(self):
+		parser = argparse.ArgumentParser(usage="Server.py Server_port [options]")
+		parser.add_argument('port', type=int)
+		parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+			help="size of the shared encoded-frame cache in MB (0 disables it)")
+		parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded',
+			help="threaded: 2 threads per client; async: one event loop for all sessions")
+		parser.add_argument('--workers', type=int, default=1,
+			help="number of server processes sharing the RTSP port (SO_REUSEPORT)")
+		parser.add_argument('--stats-interval', type=float, default=10.0,
+			help="seconds between per-worker stats printouts with --workers")
+		parser.add_argument('--no-batch', action='store_true',
+			help="send one sendto() per RTP packet instead of one sendmmsg() per frame")
+		parser.add_argument('--spread', type=float, default=0.0,
+			help="spread each frame's fragments over this fraction of the frame interval (0 = one burst)")
+		parser.add_argument('--pipeline-depth', type=int, default=FramePipeline.DEFAULT_DEPTH,
+			help="frames decoded/encoded ahead of the sender per session (0 disables the pipeline)")
+		parser.add_argument('--encode-threads', type=int, default=FramePipeline.DEFAULT_ENCODE_THREADS,
+			help="size of the shared JPEG encode thread pool")
+		parser.add_argument('--encoder', choices=ENCODER_NAMES, default='opencv',
+			help="JPEG encoder backend; passthrough sends MJPEG sources as stored, auto prefers turbojpeg")
+		parser.add_argument('--subsampling', choices=SUBSAMPLINGS, default=None,
+			help="chroma subsampling of encoded frames (default: opencv's default, 420 for turbojpeg)")
+		parser.add_argument('--accurate-dct', action='store_true',
+			help="turbojpeg: use the accurate integer DCT instead of the fast one")
+		parser.add_argument('--turbojpeg-lib', default=None,
+			help="path of libturbojpeg if it is not on the library path")
+		parser.add_argument('--no-abr', action='store_true',
+			help="ignore client loss/jitter feedback and always stream at source quality")
+		parser.add_argument('--fec', type=parseFecSetting, default=0,
+			help="XOR parity packets per frame (0 = off) or 'auto' to follow receiver loss; clients may override")
+		parser.add_argument('--nack-history', type=int, default=ServerWorker.nackHistory,
+			help="packets kept per session for NACK retransmission (0 ignores NACK requests)")
+		parser.add_argument('--mtu', type=self.parseMtu, default=ServerWorker.mtu,
+			help="path MTU in bytes used to size RTP packets, or 'auto' to ask the kernel per client")
+		parser.add_argument('--payload-format', choices=PAYLOAD_FORMATS, default=ServerWorker.payloadFormat,
+			help="default RTP payload: raw JPEG fragments or RFC 2435 (clients may override)")
+		parser.add_argument('--broadcast', action='store_true',
+			help="live mode: sessions of the same file share one stream, encoded and packetized once")
+		parser.add_argument('--multicast-group', default=None,
+			help="with --broadcast: first IPv4 multicast group (one per channel) for clients asking for multicast")
+		parser.add_argument('--multicast-port', type=int, default=DEFAULT_MULTICAST_PORT,
+			help="RTP port of the multicast groups (RTCP on port + 1)")
+		parser.add_argument('--multicast-ttl', type=int, default=DEFAULT_MULTICAST_TTL)
+		parser.add_argument('--metrics-port', type=int, default=None,
+			help="serve Prometheus metrics on this HTTP port (worker i of --workers uses port + i)")
+		parser.add_argument('--metrics-host', default='127.0.0.1',
+			help="address the metrics endpoint listens on")
+		parser.add_argument('--session-timeout', type=int, default=ServerWorker.sessionTimeout,
+			help="close sessions with no RTSP request or RTCP for this many seconds (0 = never)")
+		parser.add_argument('--profile-stages', action='store_true',
+			help="time the read/encode/packetize/send stages (printed per session, exported with --metrics-port)")
+		args = parser.parse_args()
+		ServerWorker.batchSend = not args.no_batch
+		ServerWorker.spreadFraction = min(max(args.spread, 0.0), 1.0)
+		ServerWorker.pipelineDepth = max(args.pipeline_depth, 0)
+		ServerWorker.abrEnabled = not args.no_abr
+		FramePipeline.encodeThreads = max(args.encode_threads, 1)
+		try:
+			VideoStream.encoder = makeEncoder(args.encoder, args.subsampling, not args.accurate_dct, args.turbojpeg_lib)
+		except EncoderError as e:
+			print(f"[SERVER] {e}")
+			sys.exit(1)
+		print(f"[SERVER] JPEG encoder: {VideoStream.encoder.describe()}")
+		if args.profile_stages:
+			StageTimer.enable(StageTimer.SERVER_STAGES)
+		ServerWorker.broadcast = args.broadcast
+		ServerWorker.sessionTimeout = max(args.session_timeout, 0)
+		ServerWorker.fecSetting = args.fec
+		ServerWorker.nackHistory = max(args.nack_history, 0)
+		ServerWorker.mtu = args.mtu
+		ServerWorker.payloadFormat = args.payload_format
+		BroadcastChannel.fecSetting = args.fec
+		BroadcastChannel.mtu = args.mtu
+		BroadcastChannel.payloadFormat = args.payload_format
+		BroadcastChannel.multicastGroup = args.multicast_group
+		BroadcastChannel.multicastPort = args.multicast_port
+		BroadcastChannel.multicastTtl = args.multicast_ttl
+
+		if args.workers > 1:
+			from WorkerPool import WorkerPool
+			pool = WorkerPool(args.workers, args.stats_interval)
+			# Mỗi process có cache và socket listen riêng
+			pool.start(lambda: self.serve(args, reusePort=True))
+			pool.supervise()
+			return
+
+		self.serve(args)
+
+	@staticmethod
+	def parseMtu(value):
+		if value.strip().lower() == 'auto':
+			return 'auto'
+		return int(value)
+
+	@staticmethod
+	def startMetrics(args):
+		# Với --workers mỗi process có registry riêng -> mỗi worker một cổng, gắn nhãn worker
+		if ServerWorker.workerCount > 1:
+			Metrics.REGISTRY.constLabels = {'worker': str(ServerWorker.workerIndex)}
+		Metrics.REGISTRY.collector(ServerWorker.collectMetrics)
+		try:
+			Metrics.startMetricsServer(args.metrics_port + ServerWorker.workerIndex, args.metrics_host)
+		except OSError as e:
+			print(f"[SERVER] Metrics endpoint not started: {e}")
+
+	def serve(self, args, reusePort=False):
+		SERVER_PORT = args.port
+
+		# Cache frame JPEG dùng chung cho mọi client xem cùng file
+		frameCache = FrameCache(args.cache_mb * 1024 * 1024) if args.cache_mb > 0 else None
+
+		if args.metrics_port is not None:
+			self.startMetrics(args)
+
+		if args.mode == 'async':
+			from AsyncServer import runAsyncServer
+			runAsyncServer(SERVER_PORT, frameCache, reusePort)
+			return
+
+		rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		# Session hết hạn / request hỏng: server đóng trước -> TIME_WAIT không được chặn lần chạy sau
+		rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		if reusePort:
+			rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		rtspSocket.bind(('', SERVER_PORT))
+		rtspSocket.listen(socket.SOMAXCONN)
+
+		# Đóng session không còn gửi request / RTCP (client treo, mất mạng)
+		if ServerWorker.sessionTimeout:
+			threading.Thread(target=ServerWorker.reapIdleSessions, name='session-reaper', daemon=True).start()
+
+		# Receive client info (address,port) through RTSP/TCP session
+		while True:
+			clientInfo = {}
+			clientInfo['rtspSocket'] = rtspSocket.accept()
+			clientInfo['frameCache'] = frameCache
+			ServerWorker(clientInfo).run()		
+		
+   
+   
+
+if __name__ == "__main__":
+	(Server()).main()
+ 
+ 
+
+
@@ -1,265 +1,884 @@
-# -*- coding: utf-8 -*-
-from random import randint
-import threading, socket, traceback
-from time import time, sleep
-
-from VideoStream import VideoStream
-from RtpPacket import RtpPacket
-
-MAX_PAYLOAD = 1400
-TARGET_FPS = 20.0
-FRAME_INTERVAL = 1.0 / TARGET_FPS
-
-
-class ServerWorker:
-    SETUP = 'SETUP'
-    PLAY = 'PLAY'
-    PAUSE = 'PAUSE'
-    TEARDOWN = 'TEARDOWN'
-
-    INIT = 0
-    READY = 1
-    PLAYING = 2
-
-    OK_200 = 0
-    FILE_NOT_FOUND_404 = 1
-    CON_ERR_500 = 2
-
-    def __init__(self, clientInfo):
-        self.clientInfo = clientInfo
-        self.state = self.INIT
-
-        # RTP sequence number (per packet)
-        self.rtpSeqNum = 0
-
-        # Thread control
-        self.stopEvent = threading.Event()
-        self.pauseEvent = threading.Event()
-        self.worker = None
-
-        # Stats for "current play segment"
-        self.resetStats()
-
-    def resetStats(self):
-        self.bytes_sent = 0
-        self.packets_sent = 0
-        self.frames_sent = 0
-        self.totalFragments = 0
-        self.maxFragmentsPerFrame = 0
-        self.firstSendTime = None  # set when PLAY starts
-
-    def run(self):
-        threading.Thread(target=self.recvRtspRequest, daemon=True).start()
-
-    def recvRtspRequest(self):
-        connSocket = self.clientInfo['rtspSocket'][0]
-        while True:
-            try:
-                data = connSocket.recv(256)
-                if data:
-                    print("Data received:\n" + data.decode("utf-8"))
-                    self.processRtspRequest(data.decode("utf-8"))
-            except:
-                break
-
-    def processRtspRequest(self, data):
-        request = data.split('\n')
-        line1 = request[0].split(' ')
-        requestType = line1[0]
-        filename = line1[1]
-        seq = request[1].split(' ')
-        cseq = seq[1] if len(seq) > 1 else "0"
-
-        if requestType == self.SETUP:
-            if self.state == self.INIT:
-                print("processing SETUP\n")
-                try:
-                    self.clientInfo['videoStream'] = VideoStream(filename)
-                    self.state = self.READY
-                except IOError:
-                    self.replyRtsp(self.FILE_NOT_FOUND_404, cseq)
-                    return
-
-                self.clientInfo['session'] = randint(100000, 999999)
-
-                # Parse RTP port safely
-                try:
-                    lineWithPort = [l for l in request if 'client_port' in l][0]
-                    partAfterEq = lineWithPort.split('client_port=')[1]
-                    portStr = partAfterEq.split('-')[0].split(';')[0].strip()
-                    self.clientInfo['rtpPort'] = portStr
-                    print(f"Client RTP Port: {self.clientInfo['rtpPort']}")
-                except:
-                    print("Error parsing RTP Port, defaulting to 25000")
-                    self.clientInfo['rtpPort'] = "25000"
-
-                # Create RTP socket once
-                if 'rtpSocket' not in self.clientInfo:
-                    self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-                self.replyRtsp(self.OK_200, cseq)
-
-        elif requestType == self.PLAY:
-            if self.state == self.READY:
-                print("processing PLAY\n")
-                self.state = self.PLAYING
-
-                # Reset stats for this play segment
-                self.resetStats()
-                self.firstSendTime = time()
-
-                # Resume
-                self.pauseEvent.clear()
-                self.stopEvent.clear()
-
-                self.replyRtsp(self.OK_200, cseq)
-
-                # Start send thread only once
-                if self.worker is None or not self.worker.is_alive():
-                    self.worker = threading.Thread(target=self.sendRtp, daemon=True)
-                    self.worker.start()
-                    print("[SERVER] sendRtp thread started")
-                else:
-                    print("[SERVER] sendRtp thread already running (resume only)")
-
-        elif requestType == self.PAUSE:
-            if self.state == self.PLAYING:
-                print("processing PAUSE\n")
-                self.state = self.READY
-
-                # Pause only (do NOT kill thread)
-                self.pauseEvent.set()
-
-                self.printServerStats()
-                self.replyRtsp(self.OK_200, cseq)
-
-        elif requestType == self.TEARDOWN:
-            print("processing TEARDOWN\n")
-
-            # Stop thread
-            self.stopEvent.set()
-            self.pauseEvent.set()
-
-            self.replyRtsp(self.OK_200, cseq)
-
-            # Close RTP socket
-            try:
-                if 'rtpSocket' in self.clientInfo:
-                    self.clientInfo['rtpSocket'].close()
-            except:
-                pass
-
-    def sendRtp(self):
-        print("[SERVER] sendRtp running - target 20 fps")
-
-        while not self.stopEvent.is_set():
-
-            # pause: wait until resumed
-            if self.pauseEvent.is_set():
-                sleep(0.01)
-                continue
-
-            # fixed pacing
-            sleep(FRAME_INTERVAL)
-
-            # read next frame
-            data = self.clientInfo['videoStream'].nextFrame()
-            if not data:
-                print("[SERVER] End of video")
-                break
-
-            frameSize = len(data)
-            frameNumber = self.clientInfo['videoStream'].frameNbr()
-
-            if frameNumber % 50 == 0:
-                print(f"[SERVER] Frame {frameNumber} - {frameSize} bytes")
-
-            try:
-                address = self.clientInfo['rtspSocket'][1][0]
-                port = int(self.clientInfo['rtpPort'])
-                rtpSocket = self.clientInfo['rtpSocket']
-
-                fragmentsForThisFrame = 0
-                offset = 0
-
-                # IMPORTANT: do not check pause mid-frame; finish sending this frame
-                while offset < frameSize:
-                    chunk = data[offset: offset + MAX_PAYLOAD]
-                    offset += MAX_PAYLOAD
-                    marker = 1 if offset >= frameSize else 0
-
-                    # seq increases ONCE per packet
-                    self.rtpSeqNum = (self.rtpSeqNum + 1) % 65536
-                    packet = self.makeRtp(chunk, self.rtpSeqNum, marker)
-
-                    rtpSocket.sendto(packet, (address, port))
-
-                    self.packets_sent += 1
-                    self.bytes_sent += len(packet)
-                    fragmentsForThisFrame += 1
-
-                self.frames_sent += 1
-                self.totalFragments += fragmentsForThisFrame
-                if fragmentsForThisFrame > self.maxFragmentsPerFrame:
-                    self.maxFragmentsPerFrame = fragmentsForThisFrame
-
-            except Exception as e:
-                print(f"[SERVER] Send error: {e}")
-                traceback.print_exc()
-                break
-
-        print("[SERVER] sendRtp exiting")
-        self.printServerStats()
-
-    def makeRtp(self, payload, seqnum, marker=0):
-        version = 2
-        padding = 0
-        extension = 0
-        cc = 0
-        pt = 26  # MJPEG
-        ssrc = 123456
-
-        rtpPacket = RtpPacket()
-        rtpPacket.encode(
-            version, padding, extension, cc,
-            seqnum, marker, pt, ssrc,
-            payload
-        )
-        return rtpPacket.getPacket()
-
-    def replyRtsp(self, code, seq):
-        if code == self.OK_200:
-            reply = f'RTSP/1.0 200 OK\nCSeq: {seq}\nSession: {self.clientInfo["session"]}'
-            connSocket = self.clientInfo['rtspSocket'][0]
-            connSocket.send(reply.encode())
-        elif code == self.FILE_NOT_FOUND_404:
-            print("404 NOT FOUND")
-        elif code == self.CON_ERR_500:
-            print("500 CONNECTION ERROR")
-
-    def printServerStats(self):
-        if self.firstSendTime is None:
-            return
-
-        duration = max(time() - self.firstSendTime, 1e-6)
-
-        framesSent = self.frames_sent
-        packetsSent = self.packets_sent
-        bytesSent = self.bytes_sent
-
-        avgPacketSize = (bytesSent / packetsSent) if packetsSent > 0 else 0
-        avgBitrateMbps = (bytesSent * 8) / duration / 1_000_000
-        avgFragmentsPerFrame = (self.totalFragments / framesSent) if framesSent > 0 else 0
-        frameRateSent = framesSent / duration if framesSent > 0 else 0
-
-        print("\n[SERVER STATS]")
-        print(f"  Streaming duration  : {duration:.2f} s")
-        print(f"  Frames sent         : {framesSent}")
-        print(f"  Packets sent        : {packetsSent}")
-        print(f"  Bytes sent          : {bytesSent}")
-        print(f"  Avg packet size     : {avgPacketSize:.2f} bytes")
-        print(f"  Avg bitrate         : {avgBitrateMbps:.2f} Mbps")
-        print(f"  Avg fragments/frame : {avgFragmentsPerFrame:.2f}")
-        print(f"  Max fragments/frame : {self.maxFragmentsPerFrame}")
-        print(f"  Frame rate sent     : {frameRateSent:.2f} fps")
-        print(f"  Target FPS          : {TARGET_FPS:.2f} fps\n")
\ No newline at end of file
+# -*- coding: utf-8 -*-
+from random import randint
+import threading, socket, traceback
+from time import time, sleep, monotonic, perf_counter
+
+from VideoStream import VideoStream
+from RtpPacket import HEADER_SIZE, RTP_CLOCK_RATE, DEFAULT_MTU, payloadSizeForMtu, probePathMtu
+from RtpJpeg import makePacketizer, PAYLOAD_RAW, PAYLOAD_RFC2435
+from UdpBatch import BatchSender
+from Pacer import FramePacer
+from FramePipeline import FramePipeline, DEFAULT_DEPTH
+from AbrController import AbrController
+from Rtcp import SenderRtcpStats, ReceiverReport, Nack, bindPortPair, buildSenderReport, parseRtcp
+from BroadcastChannel import BroadcastChannel
+from Fec import FecEncoder, parseFecSetting, FEC_HEADER_SIZE
+from Nack import PacketHistory, DEFAULT_HISTORY_PACKETS
+from Interleaved import InterleavedWriter, isInterleavedTransport, INTERLEAVED_TRANSPORT, RTCP_CHANNEL
+from RtspParser import RtspParser, RtspParseError, formatReply, REASONS
+import Metrics
+import StageTimer
+
+# Payload RTP mặc định: vừa MTU Ethernet (1500 - IP/UDP - RTP)
+MAX_PAYLOAD = payloadSizeForMtu(DEFAULT_MTU)
+SSRC = 123456
+# Session không có request RTSP / RTCP trong chừng này giây thì bị đóng (0 = không bao giờ)
+DEFAULT_SESSION_TIMEOUT = 60
+RECV_SIZE = 4096
+
+
+class ServerWorker:
+    SETUP = 'SETUP'
+    PLAY = 'PLAY'
+    PAUSE = 'PAUSE'
+    TEARDOWN = 'TEARDOWN'
+    SET_PARAMETER = 'SET_PARAMETER'
+    GET_PARAMETER = 'GET_PARAMETER'
+    OPTIONS = 'OPTIONS'
+    METHODS = (OPTIONS, SETUP, PLAY, PAUSE, TEARDOWN, GET_PARAMETER, SET_PARAMETER)
+
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+
+    OK_200 = 0
+    FILE_NOT_FOUND_404 = 1
+    CON_ERR_500 = 2
+    INVALID_RANGE_457 = 3
+    UNSUPPORTED_TRANSPORT_461 = 4
+    BAD_REQUEST_400 = 5
+    METHOD_NOT_VALID_455 = 6
+    NOT_IMPLEMENTED_501 = 7
+    STATUS = {OK_200: 200, FILE_NOT_FOUND_404: 404, CON_ERR_500: 500, INVALID_RANGE_457: 457,
+              UNSUPPORTED_TRANSPORT_461: 461, BAD_REQUEST_400: 400, METHOD_NOT_VALID_455: 455,
+              NOT_IMPLEMENTED_501: 501}
+
+    # Multi-process mode (--workers N): process này là worker thứ workerIndex / workerCount
+    workerIndex = 0
+    workerCount = 1
+
+    # Gửi cả frame bằng sendmmsg (Linux); False -> sendto từng packet
+    batchSend = True
+
+    # Phần của khoảng cách giữa 2 frame dùng để dàn đều các fragment (0 = gửi một lèo)
+    spreadFraction = 0.0
+
+    # Số frame decode/encode trước sender (0 = encode ngay trong thread gửi)
+    pipelineDepth = DEFAULT_DEPTH
+
+    # Adaptive bitrate theo feedback loss/jitter của client
+    abrEnabled = True
+
+    # FEC: số packet parity XOR mỗi frame (0 = tắt) hoặc 'auto' theo loss; client ghi đè bằng header FEC:
+    fecSetting = 0
+
+    # Số packet giữ lại để gửi lại khi client NACK (client xin bằng RTCP-FB: nack); 0 = không hỗ trợ
+    nackHistory = DEFAULT_HISTORY_PACKETS
+
+    # MTU của đường tới client (byte, gồm header IP/UDP) hoặc 'auto' = hỏi kernel (path MTU)
+    mtu = DEFAULT_MTU
+
+    # Payload RTP: 'raw' (JPEG nguyên file) hoặc 'rfc2435'; client xin bằng header Payload-Format:
+    payloadFormat = PAYLOAD_RAW
+
+    # Live mode: mọi session cùng file dùng chung một BroadcastChannel (encode/packetize một lần)
+    broadcast = False
+
+    # Giây không có request RTSP (keep-alive GET_PARAMETER/OPTIONS) hay RTCP trước khi đóng session
+    sessionTimeout = DEFAULT_SESSION_TIMEOUT
+
+    # Registry các session của process này (để xuất stats)
+    liveWorkers = set()
+    retiredTotals = {'closed': 0, 'frames': 0, 'packets': 0, 'bytes': 0}
+    registryLock = threading.Lock()
+
+    def __init__(self, clientInfo):
+        self.clientInfo = clientInfo
+        self.state = self.INIT
+
+        # Lifetime counters (không reset theo PLAY segment)
+        self.lifetimeFrames = 0
+        self.lifetimePackets = 0
+        self.lifetimeBytes = 0
+        self.closed = False
+        self.lastActivity = monotonic()  # request RTSP hoặc RTCP gần nhất (session timeout)
+        with self.registryLock:
+            self.liveWorkers.add(self)
+
+        # RTP sequence number (per packet)
+        self.rtpSeqNum = 0
+        self.packetizer = makePacketizer(PAYLOAD_RAW, SSRC, DEFAULT_MTU)  # MJPEG, tạo lại ở SETUP
+        # RTP timestamp = offset ngẫu nhiên (RFC 3550) + vị trí media của frame ở 90 kHz
+        self.timestampBase = randint(0, 0xFFFFFFFF)
+        self.segmentStartFrame = 0  # frame đầu tiên của PLAY segment hiện tại
+        self.pacer = None  # tạo ở SETUP theo FPS thật của nguồn
+        self.frameSource = None  # VideoStream hoặc FramePipeline bọc nó
+        # Seek (PLAY có Range) đổi vị trí nguồn từ thread RTSP trong khi sender đang đọc
+        self.sourceLock = threading.Lock()
+        self.seekCount = 0  # tăng mỗi lần seek -> sender bỏ frame đọc từ vị trí cũ
+        self.heldFrame = None  # frame đã đọc nhưng PAUSE tới trước deadline -> gửi khi PLAY lại
+        self.abr = None
+        self.rtcpStats = SenderRtcpStats()
+        self.channel = None  # BroadcastChannel nếu session xem live
+        self.multicast = False
+        self.fec = None  # FecEncoder nếu session có FEC
+        self.history = None  # PacketHistory nếu client dùng NACK
+        # RTP/RTCP $-framed trên kết nối RTSP (Transport: RTP/AVP/TCP;interleaved=0-1)
+        self.interleaved = False
+        self.interleavedWriter = None
+        self.rtspWriteLock = threading.Lock()  # reply RTSP không được chen vào giữa packet RTP
+
+        # Thread control
+        self.stopEvent = threading.Event()
+        self.pauseEvent = threading.Event()
+        self.worker = None
+
+        # Stats for "current play segment"
+        self.resetStats()
+
+    def resetStats(self):
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self.frameBytesSent = 0
+        self.frames_sent = 0
+        self.totalFragments = 0
+        self.maxFragmentsPerFrame = 0
+        self.firstSendTime = None  # set when PLAY starts
+        self.frameSendStart = 0.0
+        self.framePacketized = 0.0
+
+    def run(self):
+        threading.Thread(target=self.recvRtspRequest, daemon=True).start()
+
+    def startStreaming(self):
+        # Start send thread only once
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.sendRtp, daemon=True)
+            self.worker.start()
+            print("[SERVER] sendRtp thread started")
+        else:
+            print("[SERVER] sendRtp thread already running (resume only)")
+
+    def stopStreaming(self):
+        self.stopEvent.set()
+        self.pauseEvent.set()
+
+    def recvRtspRequest(self):
+        connSocket = self.clientInfo['rtspSocket'][0]
+        parser = RtspParser()
+        while True:
+            try:
+                data = connSocket.recv(RECV_SIZE)
+                if not data:
+                    break  # client đóng kết nối (hoặc session hết hạn: dropConnection)
+                # Request RTSP (có thể cắt dở hoặc nhiều request một lần đọc) và RTCP RR $-framed
+                for channel, item in parser.feed(data):
+                    if channel is None:
+                        print("Data received:\n" + item.text())
+                        self.processRtspRequest(item)
+                    elif channel == RTCP_CHANNEL:
+                        self.processRtcp(item)
+            except RtspParseError as e:
+                print(f"[SERVER] Bad RTSP request: {e}")
+                try:
+                    self.replyRtsp(self.BAD_REQUEST_400, 0)
+                except OSError:
+                    pass
+                break
+            except:
+                break
+        self.closeSession()
+        try:
+            connSocket.close()
+        except OSError:
+            pass
+
+    def processRtspRequest(self, message):
+        """Handle one parsed RTSP request (RtspMessage); every request gets a reply."""
+        self.lastActivity = monotonic()
+        request = message.lines
+        requestType = message.method
+        filename = message.uri
+        cseq = message.cseq
+
+        if requestType == self.OPTIONS:
+            self.replyRtsp(self.OK_200, cseq, f"Public: {', '.join(self.METHODS)}")
+
+        elif requestType == self.GET_PARAMETER:
+            # Keep-alive (body rỗng): lastActivity đã được làm mới ở trên
+            self.replyRtsp(self.OK_200, cseq)
+
+        elif requestType == self.SETUP:
+            if self.state == self.INIT:
+                print("processing SETUP\n")
+                transport = [l for l in request if l.lower().startswith('transport')]
+                self.interleaved = bool(transport) and isInterleavedTransport(transport[0])
+                if self.interleaved and self.broadcast:
+                    # Live channel gửi một bản cho mọi người qua UDP, không ghi vào từng kết nối TCP
+                    self.replyRtsp(self.UNSUPPORTED_TRANSPORT_461, cseq)
+                    return
+                try:
+                    if self.broadcast:
+                        self.channel = BroadcastChannel.join(
+                            filename, self, self.clientInfo.get('frameCache'),
+                            self.batchSend, self.pipelineDepth)
+                        self.state = self.READY
+                    else:
+                        self.setupStream(filename)
+                except IOError:
+                    self.replyRtsp(self.FILE_NOT_FOUND_404, cseq)
+                    return
+
+                self.clientInfo['session'] = self.newSessionId()
+                if self.channel is None:
+                    payloadFormat = self.parsePayloadFormat(request)
+                    setting = self.parseFecRequest(request)
+                    # Packet parity dài hơn packet media một header FEC: chừa chỗ để cả hai vừa MTU
+                    self.packetizer = makePacketizer(payloadFormat, SSRC, self.sessionMtu(),
+                                                     FEC_HEADER_SIZE if setting and not self.interleaved else 0)
+                    formatHeader = f"\nPayload-Format: {payloadFormat}" if payloadFormat != PAYLOAD_RAW else ""
+                if self.interleaved:
+                    # Không mở UDP: RTP/RTCP đi trên kết nối RTSP (blocking -> backpressure)
+                    self.interleavedWriter = InterleavedWriter(self.clientInfo['rtspSocket'][0], self.rtspWriteLock)
+                    # Bên nhận chậm làm sender bị chặn: phát chậm lại thay vì bỏ frame để đuổi đồng hồ
+                    self.pacer.dropLateFrames = False
+                    self.replyRtsp(self.OK_200, cseq, f"Transport: {INTERLEAVED_TRANSPORT}" + formatHeader)
+                    return
+                self.parseClientPort(request)
+
+                if self.channel is not None:
+                    self.multicast = self.channel.isMulticast(bool(transport) and 'multicast' in transport[0])
+                    headers = self.channel.transport(self, self.multicast)
+                    if self.channel.fec is not None:
+                        headers += f"\nFEC: {self.channel.fec.describe()}"
+                    if self.channel.payloadFormat != PAYLOAD_RAW:
+                        headers += f"\nPayload-Format: {self.channel.payloadFormat}"
+                    self.replyRtsp(self.OK_200, cseq, headers)
+                    return
+
+                headers = formatHeader
+                if setting:
+                    # Stream parity riêng: SSRC khác stream media
+                    self.fec = FecEncoder((self.packetizer.ssrc + 1) & 0xFFFFFFFF, setting)
+                    headers += f"\nFEC: {self.fec.describe()}"
+                if self.nackHistory > 0 and any(l.lower().startswith('rtcp-fb:') and 'nack' in l.lower() for l in request):
+                    self.history = PacketHistory(self.nackHistory, self.packetizer.maxPacketSize)
+                    headers += "\nRTCP-FB: nack"
+
+                # Create RTP/RTCP socket pair once (RTP port chẵn n, RTCP n + 1)
+                if 'rtpSocket' not in self.clientInfo:
+                    self.clientInfo["rtpSocket"], self.clientInfo["rtcpSocket"] = bindPortPair()
+                    self.rtpSender = BatchSender(self.clientInfo["rtpSocket"], useSendmmsg=self.batchSend)
+                    self.startRtcp()
+
+                rtpPort = int(self.clientInfo['rtpPort'])
+                serverPort = self.clientInfo["rtpSocket"].getsockname()[1]
+                self.replyRtsp(self.OK_200, cseq,
+                               f"Transport: RTP/UDP;client_port={rtpPort}-{rtpPort + 1};"
+                               f"server_port={serverPort}-{serverPort + 1}" + headers)
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, cseq)
+
+        elif requestType == self.PLAY:
+            if self.state == self.READY and self.channel is not None:
+                print("processing PLAY (live)\n")
+                self.state = self.PLAYING
+                self.resetStats()
+                self.firstSendTime = time()
+                # Live: không seek được, luôn xem từ vị trí hiện tại của channel
+                self.channel.play(self, self.multicast)
+                self.replyRtsp(self.OK_200, cseq, "Range: npt=now-")
+
+            elif self.state == self.READY:
+                print("processing PLAY\n")
+                try:
+                    start = self.parseRange(request)
+                except ValueError:
+                    self.replyRtsp(self.INVALID_RANGE_457, cseq)
+                    return
+                if start is not None and not self.seek(start):
+                    self.replyRtsp(self.INVALID_RANGE_457, cseq)
+                    return
+                self.state = self.PLAYING
+
+                # Reset stats for this play segment
+                self.resetStats()
+                self.firstSendTime = time()
+                self.segmentStartFrame = self.frameSource.frameNbr()
+                self.pacer.reset()
+
+                # Resume
+                self.pauseEvent.clear()
+                self.stopEvent.clear()
+
+                # Vị trí thật sau seek (làm tròn theo frame)
+                self.replyRtsp(self.OK_200, cseq, f"Range: npt={self.segmentStartFrame / self.pacer.fps:.3f}-")
+                self.startStreaming()
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, cseq)
+
+        elif requestType == self.PAUSE:
+            if self.state == self.PLAYING:
+                print("processing PAUSE\n")
+                self.state = self.READY
+
+                # Pause only (do NOT kill thread)
+                self.pauseEvent.set()
+                if self.channel is not None:
+                    self.channel.pause(self)
+
+                self.printServerStats()
+                self.replyRtsp(self.OK_200, cseq)
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, cseq)
+
+        elif requestType == self.TEARDOWN:
+            print("processing TEARDOWN\n")
+
+            # Stop thread
+            self.stopStreaming()
+
+            self.replyRtsp(self.OK_200, cseq)
+            self.closeSession()
+
+        elif requestType == self.SET_PARAMETER:
+            if self.state != self.INIT:
+                # Client báo loss/jitter định kỳ (text/parameters)
+                params = self.parseParameters(request)
+                try:
+                    self.onReceiverFeedback(float(params.get('loss', 0.0)), float(params.get('jitter', 0.0)))
+                except ValueError:
+                    print("Bad feedback parameters, ignored")
+                self.replyRtsp(self.OK_200, cseq)
+            else:
+                self.replyRtsp(self.METHOD_NOT_VALID_455, cseq)
+
+        else:
+            self.replyRtsp(self.NOT_IMPLEMENTED_501, cseq)
+
+    def addSentStats(self, frames, packets, octets, maxFragments):
+        """Count what a BroadcastChannel sent to this session."""
+        self.frames_sent += frames
+        self.packets_sent += packets
+        self.bytes_sent += octets
+        self.totalFragments += packets
+        self.maxFragmentsPerFrame = max(self.maxFragmentsPerFrame, maxFragments)
+        self.lifetimeFrames += frames
+        self.lifetimePackets += packets
+        self.lifetimeBytes += octets
+
+    def setupStream(self, filename):
+        """Per-session source: own VideoStream, pacer, ABR and encode pipeline. Raises IOError."""
+        videoStream = VideoStream(filename, cache=self.clientInfo.get('frameCache'))
+        self.clientInfo['videoStream'] = videoStream
+        self.pacer = FramePacer(videoStream.fps(), spreadFraction=self.spreadFraction)
+        if self.abrEnabled:
+            self.abr = AbrController(videoStream.fps())
+        if self.pipelineDepth > 0 and videoStream.needsEncoding():
+            self.frameSource = FramePipeline(videoStream, self.pipelineDepth)
+        else:
+            self.frameSource = videoStream
+        self.state = self.READY
+
+    def parseClientPort(self, request):
+        # Parse RTP port safely
+        try:
+            lineWithPort = [l for l in request if 'client_port' in l][0]
+            partAfterEq = lineWithPort.split('client_port=')[1]
+            portStr = partAfterEq.split('-')[0].split(';')[0].strip()
+            self.clientInfo['rtpPort'] = portStr
+            print(f"Client RTP Port: {self.clientInfo['rtpPort']}")
+        except:
+            print("Error parsing RTP Port, defaulting to 25000")
+            self.clientInfo['rtpPort'] = "25000"
+        # RTCP của client luôn ở cổng RTP + 1
+        self.clientInfo['rtcpPort'] = int(self.clientInfo['rtpPort']) + 1
+
+    def parsePayloadFormat(self, request):
+        """Payload format asked for by the client ('Payload-Format: raw|rfc2435'), else the server default."""
+        for line in request:
+            if line.lower().startswith('payload-format:'):
+                value = line.split(':', 1)[1].strip().lower()
+                if value in (PAYLOAD_RAW, PAYLOAD_RFC2435):
+                    return value
+                print("Unknown payload format, using server default")
+        return self.payloadFormat
+
+    def sessionMtu(self):
+        """MTU used to size RTP packets: the configured one, or the kernel's path MTU towards the client."""
+        if self.mtu != 'auto':
+            return self.mtu
+        mtu = probePathMtu(self.clientInfo['rtspSocket'][1][0])
+        if mtu is None:
+            print(f"[SERVER] Path MTU unknown, using {DEFAULT_MTU}")
+            return DEFAULT_MTU
+        print(f"[SERVER] Path MTU to {self.clientInfo['rtspSocket'][1][0]}: {mtu}")
+        return mtu
+
+    def parseFecRequest(self, request):
+        """FEC setting asked for by the client ('FEC: <k>|auto'), else the server default."""
+        for line in request:
+            if line.lower().startswith('fec:'):
+                try:
+                    return parseFecSetting(line.split(':', 1)[1])
+                except ValueError:
+                    print("Bad FEC header, using server default")
+        return self.fecSetting
+
+    @staticmethod
+    def parseRange(request):
+        """
+        Start time (seconds) of 'Range: npt=<start>-' or None if absent / 'now-'.
+        Raises ValueError if malformed; only open-ended ranges are supported.
+        """
+        for line in request:
+            name, _, value = line.partition(':')
+            if name.strip().lower() != 'range':
+                continue
+            value = value.strip()
+            if not value.startswith('npt='):
+                raise ValueError(value)
+            start, dash, end = value[4:].partition('-')
+            start = start.strip()
+            if not dash or end.strip():
+                raise ValueError(value)
+            if start == 'now':
+                return None
+            # npt-sec hoặc npt-hhmmss (h:mm:ss.fff)
+            seconds = 0.0
+            for part in start.split(':'):
+                seconds = seconds * 60 + float(part)
+            if seconds < 0:
+                raise ValueError(value)
+            return seconds
+        return None
+
+    def seek(self, seconds):
+        """Move the source to the frame at `seconds` (READY state only). False if past the end."""
+        with self.sourceLock:
+            if not self.frameSource.seek(round(seconds * self.pacer.fps)):
+                return False
+            self.seekCount += 1
+        print(f"[SERVER] Seek to {seconds:.3f}s (frame {self.frameSource.frameNbr()})")
+        return True
+
+    def readFrame(self, behind=0):
+        """(seekCount, data, frameIndex) of the next frame after dropping `behind` frames."""
+        with self.sourceLock:
+            held, self.heldFrame = self.heldFrame, None
+            if held is not None and held[0] == self.seekCount:
+                return held  # PLAY vừa reset pacer nên behind = 0
+            if behind:
+                self.frameSource.skipFrames(behind)
+            data = self.frameSource.nextFrame()
+            return self.seekCount, data, self.frameSource.frameNbr() - 1
+
+    @staticmethod
+    def parseParameters(request):
+        """'name: value' lines of the request body (after the first empty line)."""
+        params = {}
+        if '' not in request:
+            return params
+        for line in request[request.index('') + 1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                params[name.strip().lower()] = value.strip()
+        return params
+
+    def startRtcp(self):
+        threading.Thread(target=self.recvRtcp, daemon=True).start()
+
+    def recvRtcp(self):
+        rtcpSocket = self.clientInfo['rtcpSocket']
+        rtcpSocket.settimeout(0.5)  # close() không đánh thức recv đang block -> kiểm tra closed định kỳ
+        while not self.closed:
+            try:
+                data = rtcpSocket.recv(1500)
+            except socket.timeout:
+                continue
+            except OSError:
+                break  # socket đã đóng ở closeSession
+            self.processRtcp(data)
+
+    def processRtcp(self, data):
+        """Handle a compound RTCP packet from the client (receiver reports about our stream)."""
+        arrival = time()
+        self.lastActivity = monotonic()
+        for report in parseRtcp(data):
+            if isinstance(report, Nack):
+                if self.history is not None and report.mediaSsrc == self.packetizer.ssrc:
+                    self.retransmit(report.seqs)
+                continue
+            if not isinstance(report, ReceiverReport):
+                continue
+            for block in report.blocks:
+                if block.sourceSsrc != self.packetizer.ssrc:
+                    continue
+                self.rtcpStats.onReportBlock(block, arrival)
+                self.onReceiverFeedback(self.rtcpStats.fractionLost, self.rtcpStats.jitterMs)
+
+    def retransmit(self, seqs):
+        """Resend NACKed packets from the history (same seq, rate limited)."""
+        address = (self.clientInfo['rtspSocket'][1][0], int(self.clientInfo['rtpPort']))
+        rtpSocket = self.clientInfo['rtpSocket']
+        self.history.retransmit(seqs, lambda packet: rtpSocket.sendto(packet, address), monotonic())
+
+    def sendSenderReport(self):
+        """RTCP SR: maps our RTP clock to wall-clock time and carries packet/octet counts."""
+        payloadOctets = self.lifetimeBytes - self.lifetimePackets * HEADER_SIZE
+        report = buildSenderReport(self.packetizer.ssrc, self.mediaTimestampNow(),
+                                   self.lifetimePackets, payloadOctets)
+        try:
+            if self.interleaved:
+                self.sendInterleaved(RTCP_CHANNEL, report)
+            else:
+                address = (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtcpPort'])
+                self.clientInfo['rtcpSocket'].sendto(report, address)
+            self.rtcpStats.srSent += 1
+        except OSError:
+            pass  # SR bị mất thì chu kỳ sau gửi lại
+
+    def sendInterleaved(self, channel, data):
+        self.interleavedWriter.sendPacket(channel, data)
+
+    def frameTimestamp(self, frameIndex):
+        """RTP timestamp of source frame frameIndex (shared by all its fragments)."""
+        return (self.timestampBase + round(frameIndex * RTP_CLOCK_RATE / self.pacer.fps)) & 0xFFFFFFFF
+
+    def mediaTimestampNow(self):
+        """RTP timestamp that the pacing clock says is due right now (for SR)."""
+        elapsed = monotonic() - self.pacer.startTime
+        position = self.segmentStartFrame / self.pacer.fps + elapsed
+        return (self.timestampBase + round(position * RTP_CLOCK_RATE)) & 0xFFFFFFFF
+
+    def onReceiverFeedback(self, lossFraction, jitterMs):
+        """Loss (0..1) and jitter (ms) measured by the client since its last report."""
+        if self.fec is not None:
+            self.fec.onLoss(lossFraction)
+        if self.abr is None:
+            return
+        variant = self.abr.onFeedback(lossFraction, jitterMs)
+        if variant is not None:
+            quality, scale = variant
+            self.clientInfo['videoStream'].setVariant(quality, scale)
+            print(f"[ABR] session {self.clientInfo['session']} -> quality {quality}, scale {scale} "
+                  f"(loss {lossFraction * 100:.1f}%, jitter {jitterMs:.1f} ms)")
+
+    @classmethod
+    def newSessionId(cls):
+        """
+        Session ID ngẫu nhiên 6 chữ số với session % workerCount == workerIndex,
+        nên không trùng giữa các process và biết được process nào sở hữu session.
+        """
+        low = -(-100000 // cls.workerCount)
+        high = 999999 // cls.workerCount
+        with cls.registryLock:
+            used = {w.clientInfo.get('session') for w in cls.liveWorkers}
+        while True:
+            session = randint(low, high) * cls.workerCount + cls.workerIndex
+            if session <= 999999 and session not in used:
+                return session
+
+    def closeSession(self):
+        """Stop streaming, close the RTP socket and retire this session from the registry."""
+        if self.closed:
+            return
+        self.closed = True
+        self.stopStreaming()
+        if isinstance(self.frameSource, FramePipeline):
+            self.frameSource.stop()
+        if self.channel is not None:
+            self.channel.leave(self)
+
+        # Close RTP/RTCP sockets
+        for name in ('rtpSocket', 'rtcpSocket'):
+            try:
+                if name in self.clientInfo:
+                    self.clientInfo[name].close()
+            except:
+                pass
+
+        with self.registryLock:
+            self.liveWorkers.discard(self)
+            totals = self.retiredTotals
+            totals['closed'] += 1
+            totals['frames'] += self.lifetimeFrames
+            totals['packets'] += self.lifetimePackets
+            totals['bytes'] += self.lifetimeBytes
+
+    @classmethod
+    def processStats(cls):
+        """Snapshot of this process' sessions and cumulative counters."""
+        with cls.registryLock:
+            workers = list(cls.liveWorkers)
+            stats = dict(cls.retiredTotals)
+        stats['active'] = len(workers)
+        stats['playing'] = sum(1 for w in workers if w.state == cls.PLAYING)
+        for w in workers:
+            if w.channel is not None:
+                w.channel.collect(w)
+            stats['frames'] += w.lifetimeFrames
+            stats['packets'] += w.lifetimePackets
+            stats['bytes'] += w.lifetimeBytes
+        return stats
+
+    @classmethod
+    def collectMetrics(cls):
+        """Per-session metrics for the /metrics endpoint, read from the session counters at scrape time."""
+        with cls.registryLock:
+            workers = list(cls.liveWorkers)
+        yield ('rtp_server_sessions_active', 'gauge', "Open RTSP sessions", [({}, len(workers))])
+        yield ('rtp_server_sessions_playing', 'gauge', "Sessions currently playing",
+               [({}, sum(1 for w in workers if w.state == cls.PLAYING))])
+
+        rows = []
+        for w in workers:
+            if w.channel is not None:
+                w.channel.collect(w)
+            labels = {'session': w.clientInfo.get('session', ''), 'client': w.clientInfo['rtspSocket'][1][0]}
+            rows.append((labels, w))
+        perSession = (
+            ('rtp_session_frames_sent_total', 'counter', "Frames sent to the session", lambda w: w.lifetimeFrames),
+            ('rtp_session_packets_sent_total', 'counter', "RTP packets sent to the session", lambda w: w.lifetimePackets),
+            ('rtp_session_bytes_sent_total', 'counter', "RTP bytes sent to the session", lambda w: w.lifetimeBytes),
+            ('rtp_session_fraction_lost', 'gauge', "Loss fraction from the latest receiver report",
+             lambda w: w.rtcpStats.fractionLost),
+            ('rtp_session_jitter_seconds', 'gauge', "Interarrival jitter from the latest receiver report",
+             lambda w: w.rtcpStats.jitterMs / 1000.0),
+        )
+        for name, kind, help, value in perSession:
+            yield name, kind, help, [(labels, value(w)) for labels, w in rows]
+
+    def sendRtp(self):
+        pacer = self.pacer
+        print(f"[SERVER] sendRtp running - target {pacer.fps:.2f} fps")
+
+        while not self.stopEvent.is_set():
+
+            # pause: wait until resumed (PLAY resets the pacer clock)
+            if self.pauseEvent.is_set():
+                sleep(0.01)
+                continue
+
+            # Trễ quá xa so với đồng hồ -> bỏ frame (không encode) để bắt kịp
+            behind = pacer.framesToDrop()
+            if behind:
+                pacer.skip(behind)
+
+            # read next frame (trước deadline, để thời gian encode không cộng vào chu kỳ)
+            generation, data, frameIndex = self.readFrame(behind)
+            if not data:
+                print("[SERVER] End of video")
+                break
+
+            frameSize = len(data)
+            frameNumber = frameIndex + 1
+
+            if frameNumber % 50 == 0:
+                print(f"[SERVER] Frame {frameNumber} - {frameSize} bytes")
+
+            # deadline-based pacing: ngủ tới deadline của frame (không ngủ nếu đã trễ)
+            pacer.wait()
+            if self.pauseEvent.is_set():
+                # PAUSE tới trong lúc chờ: không gửi sau reply PAUSE (client có thể seek rồi PLAY)
+                self.heldFrame = (generation, data, frameIndex)
+                continue
+            if generation != self.seekCount:
+                continue  # PAUSE + seek + PLAY trong lúc chờ: frame thuộc vị trí cũ
+            pacer.advance()
+
+            try:
+                self.sendFrame(data, frameIndex)
+            except Exception as e:
+                print(f"[SERVER] Send error: {e}")
+                traceback.print_exc()
+                break
+
+        print("[SERVER] sendRtp exiting")
+        self.printServerStats()
+
+    def sendFrame(self, data, frameIndex):
+        """Fragment one encoded frame into RTP packets and send them (spread over the frame interval if enabled)."""
+        batch = self.packetizeFrame(data, frameIndex)
+
+        # IMPORTANT: do not check pause mid-frame; finish sending this frame
+        perBurst, gap = self.pacer.spreadPlan(batch.count)
+        if gap == 0:
+            sent = self.sendPackets(batch)
+        else:
+            sent = 0
+            burstStart = monotonic()
+            for i, start in enumerate(range(0, batch.count, perBurst)):
+                remaining = burstStart + i * gap - monotonic()
+                if remaining > 0:
+                    sleep(remaining)
+                sent += self.sendPackets(batch, start, start + perBurst)
+
+        self.sendParity(batch)
+        self.finishFrame(sent)
+
+    def packetizeFrame(self, data, frameIndex):
+        self.frameSendStart = perf_counter()
+        # Header ghi vào buffer dùng lại, payload là memoryview của frame -> không copy.
+        # Mọi fragment của frame dùng chung một timestamp (theo vị trí frame); seq tăng 1 mỗi packet.
+        batch = self.packetizer.packetize(data, self.rtpSeqNum + 1, self.frameTimestamp(frameIndex))
+        self.rtpSeqNum = (self.rtpSeqNum + batch.count) % 65536
+        if StageTimer.enabled:
+            StageTimer.record('packetize', self.frameSendStart)
+            self.framePacketized = StageTimer.now()
+        return batch
+
+    def sendPackets(self, batch, start=0, end=None):
+        """Send packets [start, end) of batch; returns how many went out."""
+        end = batch.count if end is None else min(end, batch.count)
+        if self.history is not None:
+            # Lưu trước khi gửi: NACK cho packet của chính batch này có thể về trước khi gửi xong
+            self.history.store(batch, start, end, monotonic())
+        sent = self.transmit(batch, start, end)
+        if sent < end - start:
+            # Socket non-blocking (event-loop mode) và buffer gửi đầy -> bỏ phần còn lại
+            self.packets_dropped += end - start - sent
+            Metrics.PACKETS_DROPPED.inc(end - start - sent)
+
+        self.frameBytesSent += sent * batch.headerSize + batch.payloadBytes(start, start + sent)
+        return sent
+
+    def transmit(self, batch, start, end):
+        if self.interleaved:
+            # Cả đoạn trong một sendmsg trên kết nối RTSP; block tới khi TCP nhận hết
+            return self.interleavedWriter.sendBatch(batch, start, end)
+
+        address = self.clientInfo['rtspSocket'][1][0]
+        port = int(self.clientInfo['rtpPort'])
+
+        # Cả đoạn gửi bằng một lần sendmmsg (hoặc sendmsg từng packet nếu không hỗ trợ)
+        return self.rtpSender.sendBatch(batch, (address, port), start, end)
+
+    def sendParity(self, batch):
+        """FEC packets of the frame just sent (not counted in the media stats)."""
+        if self.fec is None:
+            return
+        parityBatch = self.fec.protect(batch)
+        if parityBatch is not None:
+            self.transmit(parityBatch, 0, parityBatch.count)
+
+    def finishFrame(self, fragmentsForThisFrame):
+        bytesForThisFrame = self.frameBytesSent
+        self.frameBytesSent = 0
+
+        self.packets_sent += fragmentsForThisFrame
+        self.bytes_sent += bytesForThisFrame
+        self.frames_sent += 1
+        self.lifetimeFrames += 1
+        self.lifetimePackets += fragmentsForThisFrame
+        self.lifetimeBytes += bytesForThisFrame
+        self.totalFragments += fragmentsForThisFrame
+        if fragmentsForThisFrame > self.maxFragmentsPerFrame:
+            self.maxFragmentsPerFrame = fragmentsForThisFrame
+
+        Metrics.SEND_SECONDS.observe(perf_counter() - self.frameSendStart)
+        if StageTimer.enabled:
+            StageTimer.record('send', self.framePacketized)
+        Metrics.FRAMES_SENT.inc()
+        Metrics.PACKETS_SENT.inc(fragmentsForThisFrame)
+        Metrics.BYTES_SENT.inc(bytesForThisFrame)
+        Metrics.FRAGMENTS_PER_FRAME.observe(fragmentsForThisFrame)
+        Metrics.FRAME_BYTES.observe(bytesForThisFrame)
+
+        if self.rtcpStats.srDue(monotonic()):
+            self.rtcpStats.lastSrTime = monotonic()
+            self.sendSenderReport()
+
+    def replyRtsp(self, code, seq, extraHeaders=None):
+        status = self.STATUS[code]
+        if code != self.OK_200:
+            print(f"{status} {REASONS[status].upper()}")
+        headers = []
+        session = self.clientInfo.get('session')
+        if session is not None:
+            # Client phải gửi request (vd. GET_PARAMETER) trước khi hết timeout
+            headers.append(f"Session: {session};timeout={self.sessionTimeout}" if self.sessionTimeout
+                           else f"Session: {session}")
+        if extraHeaders:
+            headers.extend(extraHeaders.split('\n'))
+        self.sendRtspReply(formatReply(status, seq, headers))
+
+    def sendRtspReply(self, reply):
+        connSocket = self.clientInfo['rtspSocket'][0]
+        with self.rtspWriteLock:
+            connSocket.sendall(reply)
+
+    def dropConnection(self):
+        """Shut the RTSP connection down (wakes the recv thread, which then closes the socket)."""
+        try:
+            self.clientInfo['rtspSocket'][0].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    @classmethod
+    def expireIdleSessions(cls, now=None):
+        """Close sessions with no RTSP request or RTCP for sessionTimeout seconds; returns how many."""
+        if not cls.sessionTimeout:
+            return 0
+        now = monotonic() if now is None else now
+        with cls.registryLock:
+            idle = [w for w in cls.liveWorkers if now - w.lastActivity > cls.sessionTimeout]
+        for worker in idle:
+            print(f"[SERVER] Session {worker.clientInfo.get('session')} timed out "
+                  f"({now - worker.lastActivity:.0f}s idle)")
+            worker.closeSession()
+            worker.dropConnection()
+        return len(idle)
+
+    @classmethod
+    def reapIdleSessions(cls):
+        """Thread body: expire idle sessions a few times per timeout period."""
+        while True:
+            sleep(max(cls.sessionTimeout / 4, 1.0))
+            cls.expireIdleSessions()
+
+    def printServerStats(self):
+        if self.firstSendTime is None:
+            return
+
+        duration = max(time() - self.firstSendTime, 1e-6)
+
+        framesSent = self.frames_sent
+        packetsSent = self.packets_sent
+        bytesSent = self.bytes_sent
+
+        avgPacketSize = (bytesSent / packetsSent) if packetsSent > 0 else 0
+        avgBitrateMbps = (bytesSent * 8) / duration / 1_000_000
+        avgFragmentsPerFrame = (self.totalFragments / framesSent) if framesSent > 0 else 0
+        frameRateSent = framesSent / duration if framesSent > 0 else 0
+
+        print("\n[SERVER STATS]")
+        print(f"  Streaming duration  : {duration:.2f} s")
+        print(f"  Frames sent         : {framesSent}")
+        print(f"  Packets sent        : {packetsSent}")
+        if self.packets_dropped > 0:
+            print(f"  Packets dropped     : {self.packets_dropped}")
+        print(f"  Bytes sent          : {bytesSent}")
+        print(f"  Avg packet size     : {avgPacketSize:.2f} bytes")
+        print(f"  Avg bitrate         : {avgBitrateMbps:.2f} Mbps")
+        print(f"  Avg fragments/frame : {avgFragmentsPerFrame:.2f}")
+        print(f"  Max fragments/frame : {self.maxFragmentsPerFrame}")
+        print(f"  Frame rate sent     : {frameRateSent:.2f} fps")
+        if self.pacer is not None:
+            self.pacer.printStats()
+        if isinstance(self.frameSource, FramePipeline):
+            self.frameSource.printStats()
+        if self.abr is not None:
+            self.abr.printStats()
+        if self.fec is not None:
+            self.fec.printStats(self.lifetimePackets)
+        if self.history is not None:
+            self.history.printStats()
+        self.rtcpStats.printStats()
+        StageTimer.printStats()
+        print()
+
+        frameCache = self.clientInfo.get('frameCache')
+        if frameCache is not None:
+            frameCache.printStats()
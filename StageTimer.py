@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Đo thời gian từng chặng trên đường đi của frame, để biết thời gian đi vào đâu:
+
+    server: read (lấy frame từ nguồn / pipeline), encode, packetize, send
+    client: reassemble (xử lý một packet RTP), decode, display
+
+Tắt mặc định: hook chỉ kiểm tra StageTimer.enabled (không gọi đồng hồ). Khi bật
+(Server.py / ClientLauncher.py --profile-stages), mỗi chặng là một histogram
+rtp_stage_<chặng>_seconds trong registry Metrics của process -> xem qua --metrics-port.
+"""
+from time import perf_counter
+
+import Metrics
+
+SERVER_STAGES = ('read', 'encode', 'packetize', 'send')
+CLIENT_STAGES = ('reassemble', 'decode', 'display')
+STAGES = SERVER_STAGES + CLIENT_STAGES
+
+# Bucket mịn hơn TIME_BUCKETS: packetize/reassemble chỉ vài chục µs
+STAGE_BUCKETS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002,
+                 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0)
+
+enabled = False
+histograms = {}
+
+now = perf_counter
+
+
+def enable(stages=STAGES, registry=Metrics.REGISTRY):
+    """Start timing `stages` into histograms of registry (idempotent)."""
+    global enabled
+    for stage in stages:
+        if stage not in histograms:
+            histograms[stage] = registry.histogram(f'rtp_stage_{stage}_seconds',
+                                                   f"Time spent in the {stage} stage", STAGE_BUCKETS)
+    enabled = True
+
+
+def record(stage, start):
+    """Add perf_counter() - start to stage (no-op for stages that were not enabled)."""
+    histogram = histograms.get(stage)
+    if histogram is not None:
+        histogram.observe(perf_counter() - start)
+
+
+def summary():
+    """{stage: {'count', 'meanMs', 'p50Ms', 'p99Ms'}} of the stages timed in this process."""
+    out = {}
+    for stage, histogram in histograms.items():
+        stats = histogram.summary()
+        if stats['count']:
+            out[stage] = stats
+    return out
+
+
+def printStats():
+    """Per-stage timing lines (process-wide, since the start), if stage timing is on."""
+    for stage, stats in summary().items():
+        print(f"  Stage {stage:<13}: {stats['meanMs']:.3f} ms mean, {stats['p50Ms']:.3f} ms p50, "
+              f"{stats['p99Ms']:.3f} ms p99 ({stats['count']} samples)")
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Gửi nhiều UDP datagram trong một syscall.
+
+Linux: sendmmsg(2) qua ctypes -> toàn bộ fragment của một frame = 1 syscall.
+Nơi khác (hoặc khi libc không có sendmmsg): fallback về vòng lặp sendto như cũ.
+"""
+import ctypes
+import ctypes.util
+import errno
+import socket
+import struct
+import sys
+import threading
+
+from RtpPacket import HEADER_SIZE
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IoVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+class _PyBuffer(ctypes.Structure):
+    _fields_ = [('buf', ctypes.c_void_p),
+                ('obj', ctypes.c_void_p),
+                ('len', ctypes.c_ssize_t),
+                ('itemsize', ctypes.c_ssize_t),
+                ('readonly', ctypes.c_int),
+                ('ndim', ctypes.c_int),
+                ('format', ctypes.c_char_p),
+                ('shape', ctypes.c_void_p),
+                ('strides', ctypes.c_void_p),
+                ('suboffsets', ctypes.c_void_p),
+                ('internal', ctypes.c_void_p)]
+
+
+def _loadSendmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fn = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+_sendmmsg = _loadSendmmsg()
+
+_getBuffer = ctypes.pythonapi.PyObject_GetBuffer
+_getBuffer.argtypes = [ctypes.py_object, ctypes.POINTER(_PyBuffer), ctypes.c_int]
+_getBuffer.restype = ctypes.c_int
+_releaseBuffer = ctypes.pythonapi.PyBuffer_Release
+_releaseBuffer.argtypes = [ctypes.POINTER(_PyBuffer)]
+_releaseBuffer.restype = None
+
+PYBUF_SIMPLE = 0
+# iov_base và iov_len cùng kích thước con trỏ (void *, size_t)
+_IOV_FIELD = 'Q' if ctypes.sizeof(ctypes.c_void_p) == 8 else 'I'
+MAX_BATCH = 256
+
+
+def hasSendmmsg():
+    return _sendmmsg is not None
+
+
+def _sockaddrIn(address):
+    """Pack (host, port) into a struct sockaddr_in."""
+    host, port = address
+    return struct.pack('=HH4s8x', socket.AF_INET, socket.htons(port), socket.inet_aton(socket.gethostbyname(host)))
+
+
+class BatchSender:
+    """
+    Sends a list of datagrams to one address with as few syscalls as possible.
+    Accepts any bytes-like packets (bytes, bytearray, memoryview).
+    """
+
+    def __init__(self, sock, maxBatch=MAX_BATCH, useSendmmsg=True):
+        self.sock = sock
+        self.maxBatch = maxBatch
+        self.batched = useSendmmsg and _sendmmsg is not None and sock.family == socket.AF_INET
+
+        self.address = None
+        self.sockaddr = None
+        self.syscalls = 0
+
+        if self.batched:
+            # Cấp phát sẵn, dùng lại cho mọi frame. Mảng iovec nằm trên một bytearray
+            # để ghi toàn bộ (base, len) bằng một lần struct.pack_into.
+            self.iovRaw = bytearray(ctypes.sizeof(_IoVec) * maxBatch)
+            self.iovecs = (_IoVec * maxBatch).from_buffer(self.iovRaw)
+            self.msgs = (_MMsgHdr * maxBatch)()
+            self.pybuf = _PyBuffer()
+            for i in range(maxBatch):
+                hdr = self.msgs[i].msg_hdr
+                hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                hdr.msg_iovlen = 1
+
+            # Scatter-gather: mỗi message = 2 iovec (RTP header, payload) -> không ghép packet
+            self.gatherIovRaw = bytearray(ctypes.sizeof(_IoVec) * 2 * maxBatch)
+            self.gatherIovecs = (_IoVec * (2 * maxBatch)).from_buffer(self.gatherIovRaw)
+            self.gatherMsgs = (_MMsgHdr * maxBatch)()
+            self.headerPybuf = _PyBuffer()
+            for i in range(maxBatch):
+                hdr = self.gatherMsgs[i].msg_hdr
+                hdr.msg_iov = ctypes.pointer(self.gatherIovecs[2 * i])
+                hdr.msg_iovlen = 2
+
+    def setAddress(self, address):
+        if address == self.address:
+            return
+        self.address = address
+        if self.batched:
+            raw = _sockaddrIn(address)
+            self.sockaddr = (ctypes.c_char * len(raw)).from_buffer_copy(raw)
+            for msgs in (self.msgs, self.gatherMsgs):
+                for i in range(self.maxBatch):
+                    hdr = msgs[i].msg_hdr
+                    hdr.msg_name = ctypes.addressof(self.sockaddr)
+                    hdr.msg_namelen = ctypes.sizeof(self.sockaddr)
+
+    def send(self, packets, address):
+        """Send every packet to address. Returns how many were sent (fewer only if a non-blocking socket is full)."""
+        if not self.batched:
+            return self.sendEach(packets, address)
+
+        self.setAddress(address)
+        total = len(packets)
+        sent = 0
+        while sent < total:
+            count = min(total - sent, self.maxBatch)
+            n = self.sendChunk(packets, sent, count)
+            if n < count:
+                return sent + n
+            sent += n
+        return sent
+
+    def sendBatch(self, batch, address, start=0, end=None):
+        """
+        Send packets [start, end) of an RtpPacketBatch with zero copies: each datagram
+        is gathered from the shared header buffer and a slice of the frame.
+        Returns packets sent.
+        """
+        end = batch.count if end is None else min(end, batch.count)
+        if not self.batched:
+            return self.sendBatchEach(batch, address, start, end)
+
+        self.setAddress(address)
+        headerPybuf = self.headerPybuf
+        payloadPybuf = self.pybuf
+        _getBuffer(batch.headers, ctypes.byref(headerPybuf), PYBUF_SIMPLE)
+        try:
+            _getBuffer(batch.payload, ctypes.byref(payloadPybuf), PYBUF_SIMPLE)
+            try:
+                return self.sendGathered(headerPybuf.buf, payloadPybuf.buf, payloadPybuf.len,
+                                         start, end, batch.maxPayload, batch.headerSize)
+            finally:
+                _releaseBuffer(ctypes.byref(payloadPybuf))
+        finally:
+            _releaseBuffer(ctypes.byref(headerPybuf))
+
+    def sendGathered(self, headerAddr, payloadAddr, payloadSize, start, end, maxPayload, headerSize=HEADER_SIZE):
+        sent = 0
+        total = end - start
+        fd = self.sock.fileno()
+        while sent < total:
+            count = min(total - sent, self.maxBatch)
+            iov = []
+            for i in range(start + sent, start + sent + count):
+                offset = i * maxPayload
+                iov.append(headerAddr + i * headerSize)
+                iov.append(headerSize)
+                iov.append(payloadAddr + offset)
+                iov.append(min(maxPayload, payloadSize - offset))
+            struct.pack_into(f'{4 * count}{_IOV_FIELD}', self.gatherIovRaw, 0, *iov)
+
+            n = _sendmmsg(fd, self.gatherMsgs, count, 0)
+            self.syscalls += 1
+            if n < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return sent
+                raise OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")
+            sent += n
+            if n < count:
+                break
+        return sent
+
+    def sendBatchEach(self, batch, address, start, end):
+        """Fallback: one sendmsg per packet, still gathering header + payload without concatenating."""
+        sent = 0
+        useSendmsg = hasattr(self.sock, 'sendmsg')
+        for i in range(start, end):
+            try:
+                if useSendmsg:
+                    self.sock.sendmsg([batch.header(i), batch.payloadOf(i)], [], 0, address)
+                else:
+                    self.sock.sendto(batch.packet(i), address)
+            except BlockingIOError:
+                break
+            self.syscalls += 1
+            sent += 1
+        return sent
+
+    def sendChunk(self, packets, start, count):
+        chunk = packets[start: start + count]
+        # Gom các packet vào một buffer liên tục (một memcpy) rồi trỏ iovec vào từng đoạn:
+        # rẻ hơn nhiều so với lấy địa chỉ từng packet qua ctypes
+        blob = b''.join(chunk)
+        pybuf = self.pybuf
+        _getBuffer(blob, ctypes.byref(pybuf), PYBUF_SIMPLE)
+        try:
+            addr = pybuf.buf
+            iov = []
+            for packet in chunk:
+                size = len(packet)
+                iov.append(addr)
+                iov.append(size)
+                addr += size
+            struct.pack_into(f'{2 * count}{_IOV_FIELD}', self.iovRaw, 0, *iov)
+
+            fd = self.sock.fileno()
+            n = _sendmmsg(fd, self.msgs, count, 0)
+            self.syscalls += 1
+            if n < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return 0
+                raise OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")
+            return n
+        finally:
+            _releaseBuffer(ctypes.byref(pybuf))
+
+    def sendEach(self, packets, address):
+        """Fallback: one sendto per packet (the original path)."""
+        sent = 0
+        for packet in packets:
+            try:
+                self.sock.sendto(packet, address)
+            except BlockingIOError:
+                break
+            self.syscalls += 1
+            sent += 1
+        return sent
+
+
+class FanoutTarget:
+    """One subscriber of a FanoutSender: its address and prebuilt sendmmsg messages."""
+    __slots__ = ('address', 'sockaddr', 'msgs')
+
+    def __init__(self, address):
+        self.address = address
+        self.sockaddr = None
+        self.msgs = None
+
+
+class FanoutSender:
+    """
+    Sends every packet of an RtpPacketBatch to many addresses from one socket (unicast fan-out).
+
+    The (header, payload) iovecs of a frame are written once into a shared array. Each target
+    owns an mmsghdr array that points at those iovecs and only differs in msg_name, so a
+    subscriber costs one sendmmsg per frame and no per-packet Python work.
+    """
+
+    def __init__(self, sock, maxBatch=MAX_BATCH, useSendmmsg=True, stride=64):
+        self.sock = sock
+        self.maxBatch = maxBatch
+        self.batched = useSendmmsg and _sendmmsg is not None and sock.family == socket.AF_INET
+        self.targets = ()  # copy-on-write: sender duyệt snapshot, add/remove thay tuple mới
+        self.lock = threading.Lock()
+        self.syscalls = 0
+        if self.batched:
+            self.headerPybuf = _PyBuffer()
+            self.payloadPybuf = _PyBuffer()
+            self.allocate(stride)
+
+    def allocate(self, stride):
+        """(Re)build the shared iovec array for `stride` packets and every target's messages."""
+        self.stride = stride
+        self.iovRaw = bytearray(ctypes.sizeof(_IoVec) * 2 * stride)
+        self.iovecs = (_IoVec * (2 * stride)).from_buffer(self.iovRaw)
+        for target in self.targets:
+            self.buildMessages(target)
+
+    def buildMessages(self, target):
+        msgs = (_MMsgHdr * self.stride)()
+        nameAddr = ctypes.addressof(target.sockaddr)
+        nameLen = ctypes.sizeof(target.sockaddr)
+        iovBase = ctypes.addressof(self.iovecs)
+        iovSize = ctypes.sizeof(_IoVec)
+        for i in range(self.stride):
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = nameAddr
+            hdr.msg_namelen = nameLen
+            hdr.msg_iov = ctypes.cast(iovBase + 2 * i * iovSize, ctypes.POINTER(_IoVec))
+            hdr.msg_iovlen = 2
+        target.msgs = msgs
+
+    def add(self, address):
+        target = FanoutTarget(address)
+        with self.lock:
+            if self.batched:
+                raw = _sockaddrIn(address)
+                target.sockaddr = (ctypes.c_char * len(raw)).from_buffer_copy(raw)
+                self.buildMessages(target)
+            self.targets = self.targets + (target,)
+        return target
+
+    def remove(self, target):
+        with self.lock:
+            self.targets = tuple(t for t in self.targets if t is not target)
+
+    def sendBatch(self, batch):
+        """Send the whole batch to every target. Returns (targets reached, packets dropped)."""
+        targets = self.targets
+        if not targets:
+            return 0, 0
+        if not self.batched:
+            return self.sendBatchEach(batch, targets)
+
+        with self.lock:
+            count = batch.count
+            if count > self.stride:
+                stride = self.stride
+                while stride < count:
+                    stride *= 2
+                self.allocate(stride)
+            targets = self.targets
+
+            headerPybuf = self.headerPybuf
+            payloadPybuf = self.payloadPybuf
+            _getBuffer(batch.headers, ctypes.byref(headerPybuf), PYBUF_SIMPLE)
+            try:
+                _getBuffer(batch.payload, ctypes.byref(payloadPybuf), PYBUF_SIMPLE)
+                try:
+                    # iovec của frame: ghi một lần cho mọi subscriber
+                    headerAddr = headerPybuf.buf
+                    payloadAddr = payloadPybuf.buf
+                    payloadSize = payloadPybuf.len
+                    maxPayload = batch.maxPayload
+                    headerSize = batch.headerSize
+                    iov = []
+                    for i in range(count):
+                        offset = i * maxPayload
+                        iov.append(headerAddr + i * headerSize)
+                        iov.append(headerSize)
+                        iov.append(payloadAddr + offset)
+                        iov.append(min(maxPayload, payloadSize - offset))
+                    struct.pack_into(f'{4 * count}{_IOV_FIELD}', self.iovRaw, 0, *iov)
+                    return self.sendToTargets(targets, count)
+                finally:
+                    _releaseBuffer(ctypes.byref(payloadPybuf))
+            finally:
+                _releaseBuffer(ctypes.byref(headerPybuf))
+
+    def sendToTargets(self, targets, count):
+        fd = self.sock.fileno()
+        msgSize = ctypes.sizeof(_MMsgHdr)
+        msgPointer = ctypes.POINTER(_MMsgHdr)
+        reached = 0
+        dropped = 0
+        for target in targets:
+            sent = 0
+            while sent < count:
+                chunk = min(count - sent, self.maxBatch)
+                msgs = target.msgs if sent == 0 else ctypes.cast(ctypes.addressof(target.msgs) + sent * msgSize, msgPointer)
+                n = _sendmmsg(fd, msgs, chunk, 0)
+                self.syscalls += 1
+                if n < 0:
+                    err = ctypes.get_errno()
+                    if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED):
+                        raise OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")
+                    break
+                sent += n
+                if n < chunk:
+                    break
+            dropped += count - sent
+            if sent:
+                reached += 1
+        return reached, dropped
+
+    def sendBatchEach(self, batch, targets):
+        """Fallback: one sendmsg per packet and target."""
+        reached = 0
+        dropped = 0
+        useSendmsg = hasattr(self.sock, 'sendmsg')
+        for target in targets:
+            sent = 0
+            for i in range(batch.count):
+                try:
+                    if useSendmsg:
+                        self.sock.sendmsg([batch.header(i), batch.payloadOf(i)], [], 0, target.address)
+                    else:
+                        self.sock.sendto(batch.packet(i), target.address)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                self.syscalls += 1
+                sent += 1
+            dropped += batch.count - sent
+            if sent:
+                reached += 1
+        return reached, dropped
@@ -1,40 +1,227 @@
-import cv2
-
-
-class VideoStream:
-    def __init__(self, filename):
-        self.filename = filename
-        self.cap = cv2.VideoCapture(self.filename)
-
-        if not self.cap.isOpened():
-            raise IOError(f"Cannot open video file: {self.filename}")
-
-        self.frameNum = 0
-
-    def nextFrame(self):
-        """
-        Đọc frame tiếp theo từ video, nén JPEG, trả về bytes.
-        Nếu hết video -> trả về None.
-        """
-        if not self.cap.isOpened():
-            return None
-
-        ret, frame = self.cap.read()
-        if not ret:
-            return None  # Hết video
-
-        # JPEG quality cao cho HD
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 98]
-        success, jpeg = cv2.imencode(".jpg", frame, encode_param)
-        if not success:
-            return None
-
-        self.frameNum += 1
-        return jpeg.tobytes()
-
-    def frameNbr(self):
-        return self.frameNum
-
-    def __del__(self):
-        if hasattr(self, "cap") and self.cap.isOpened():
-            self.cap.release()
\ No newline at end of file
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from FrameStore import openFrameFile, DEFAULT_FPS
+from Encoders import OpenCvEncoder, ensureHuffmanTables
+import Metrics
+import StageTimer
+
+JPEG_QUALITY = 98
+
+
+class RawFrame:
+    """
+    A frame waiting for JPEG encoding with the given settings (key = frame cache key or None).
+    image là frame đã decode; với file encode sẵn thì image = None và jpeg là frame gốc cần transcode.
+    """
+    __slots__ = ('image', 'key', 'quality', 'scale', 'jpeg')
+
+    def __init__(self, image, key, quality, scale, jpeg=None):
+        self.image = image
+        self.key = key
+        self.quality = quality
+        self.scale = scale
+        self.jpeg = jpeg
+
+
+class VideoStream:
+    # Backend encode dùng chung cho mọi stream của process (Server.py --encoder)
+    encoder = OpenCvEncoder()
+
+    def __init__(self, filename, cache=None, quality=JPEG_QUALITY):
+        self.filename = filename
+        self.cache = cache
+        self.quality = quality
+        self.sourceQuality = quality
+        self.scale = 1.0
+        self.frameNum = 0
+        # Passthrough + video codec MJPG: đọc thẳng packet JPEG của container, không decode
+        self.rawPackets = False
+
+        # File JPEG encode sẵn (.mjpx / movie.Mjpeg) -> mmap, không cần OpenCV
+        self.frameFile = openFrameFile(self.filename)
+        if self.frameFile is not None:
+            return
+
+        self.cap = cv2.VideoCapture(self.filename)
+
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video file: {self.filename}")
+
+        # Vị trí thực của decoder (tụt lại sau frameNum khi frame lấy từ cache)
+        self.capPos = 0
+
+        if self.encoder.passthrough:
+            fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, 'little')
+            if fourcc.upper() == b'MJPG' and self.cap.set(cv2.CAP_PROP_FORMAT, -1):
+                self.rawPackets = True
+            else:
+                print(f"[VIDEO] {self.filename} is not MJPEG, encoding with {self.encoder.describe()}")
+
+    def encodeSettings(self):
+        return ('jpg', self.encoder.name, self.quality, self.scale)
+
+    def setVariant(self, quality, scale):
+        """Switch to another quality/scale variant (ABR); applies to frames read from now on."""
+        self.quality = quality
+        self.scale = scale
+
+    def isPassthrough(self):
+        """Pre-encoded source at full quality (or any quality with the passthrough encoder): frames are sent as stored."""
+        if self.frameFile is None:
+            return self.rawPackets
+        return self.encoder.passthrough or (self.quality >= self.sourceQuality and self.scale >= 1.0)
+
+    def nextFrame(self):
+        """
+        Đọc frame tiếp theo từ video, nén JPEG, trả về bytes.
+        Nếu frame đã có trong cache dùng chung -> không decode/encode lại.
+        Với file encode sẵn: trả về memoryview trỏ thẳng vào file đã mmap.
+        Nếu hết video -> trả về None.
+        """
+        start = StageTimer.now() if StageTimer.enabled else None
+        item = self.readNext()
+        if start is not None:
+            StageTimer.record('read', start)
+        if isinstance(item, RawFrame):
+            return self.encode(item)
+        return item
+
+    def readNext(self):
+        """
+        Bước tuần tự của nextFrame(): trả về frame đã encode (bytes/memoryview) nếu có sẵn,
+        hoặc RawFrame cần encode() (có thể encode ở thread khác). None nếu hết video.
+        """
+        if self.rawPackets:
+            packet = self.readRaw()
+            if packet is None:
+                return None
+            self.frameNum += 1
+            return ensureHuffmanTables(packet.tobytes())
+
+        if self.isPassthrough():
+            data = self.frameFile.frame(self.frameNum)
+            if data is None:
+                return None
+            self.frameNum += 1
+            return data
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.makeKey(self.filename, self.frameNum, self.encodeSettings())
+            data = self.cache.get(key)
+            if data is not None:
+                self.frameNum += 1
+                return data
+
+        if self.frameFile is not None:
+            # Bậc ABR thấp hơn nguồn encode sẵn -> transcode frame gốc
+            jpeg = self.frameFile.frame(self.frameNum)
+            if jpeg is None:
+                return None
+            self.frameNum += 1
+            return RawFrame(None, key, self.quality, self.scale, jpeg=jpeg)
+
+        image = self.readRaw()
+        if image is None:
+            return None
+
+        self.frameNum += 1
+        return RawFrame(image, key, self.quality, self.scale)
+
+    def readRaw(self):
+        if not self.cap.isOpened():
+            return None
+
+        # Decoder đang ở sau vị trí cần đọc (do cache hit) -> seek tới frame cần
+        if self.capPos != self.frameNum:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frameNum)
+            self.capPos = self.frameNum
+
+        ret, frame = self.cap.read()
+        if not ret:
+            return None  # Hết video
+        self.capPos += 1
+        return frame
+
+    def encode(self, raw):
+        """JPEG-encode a RawFrame with the stream's encoder backend (thread-safe, releases the GIL)."""
+        image = raw.image
+        if image is None:
+            image = cv2.imdecode(np.frombuffer(raw.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return None
+
+        if raw.scale < 1.0:
+            image = cv2.resize(image, None, fx=raw.scale, fy=raw.scale, interpolation=cv2.INTER_AREA)
+
+        # JPEG quality cao cho HD (ABR có thể hạ xuống)
+        start = perf_counter()
+        data = self.encoder.encode(image, raw.quality)
+        Metrics.ENCODE_SECONDS.observe(perf_counter() - start)
+        if StageTimer.enabled:
+            StageTimer.record('encode', start)
+        if data is None:
+            return None
+
+        if raw.key is not None:
+            self.cache.put(raw.key, data)
+        return data
+
+    def needsEncoding(self):
+        return not self.isPassthrough()
+
+    def skipFrames(self, count):
+        """Advance count frames without encoding them (pacer dropping frames to catch up)."""
+        if self.frameFile is not None:
+            for _ in range(count):
+                if self.frameFile.frame(self.frameNum) is None:
+                    break
+                self.frameNum += 1
+            return
+
+        # Chỉ grab (không retrieve/encode); nếu decoder đang lệch do cache thì seek sau
+        for _ in range(count):
+            if self.capPos == self.frameNum:
+                if not self.cap.grab():
+                    break
+                self.capPos += 1
+            self.frameNum += 1
+
+    def fps(self):
+        """Frame rate of the source (falls back to DEFAULT_FPS when unknown)."""
+        if self.frameFile is not None:
+            return self.frameFile.fps or DEFAULT_FPS
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps != fps or fps > 1000:
+            return DEFAULT_FPS
+        return fps
+
+    def frameNbr(self):
+        return self.frameNum
+
+    def frameCount(self):
+        """Number of frames in the source, or None if unknown."""
+        if self.frameFile is not None:
+            return self.frameFile.countFrames()
+        count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return count if count > 0 else None
+
+    def seek(self, frameIndex):
+        """
+        Jump to frameIndex (next frame read is that one). False if out of range.
+        File encode sẵn: O(1) qua frame index; OpenCV: seek lười ở readRaw (cap.set dùng index keyframe của container).
+        """
+        count = self.frameCount()
+        if frameIndex < 0 or (count is not None and frameIndex >= count):
+            return False
+        self.frameNum = frameIndex
+        return True
+
+    def __del__(self):
+        if getattr(self, "frameFile", None) is not None:
+            self.frameFile.close()
+        if hasattr(self, "cap") and self.cap.isOpened():
+            self.cap.release()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-core server (--workers N): fork N process cùng listen một cổng RTSP bằng SO_REUSEPORT.
+
+Kernel chia các kết nối TCP mới cho các process; mọi request của một session đi trên
+cùng kết nối RTSP nên session luôn nằm trong process đã accept nó.
+Session ID mang chỉ số worker (session % N == index) nên không trùng giữa các process.
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from ServerWorker import ServerWorker
+
+STAT_FIELDS = ('active', 'playing', 'closed', 'frames', 'packets', 'bytes')
+PUBLISH_INTERVAL = 1.0
+
+
+class WorkerPool:
+    def __init__(self, count, statsInterval=10.0):
+        if not hasattr(os, 'fork') or not hasattr(socket, 'SO_REUSEPORT'):
+            raise OSError("--workers needs fork() and SO_REUSEPORT (Linux/BSD)")
+        self.count = count
+        self.statsInterval = statsInterval
+        # Mỗi worker ghi vào slot riêng của mình -> không cần lock
+        self.stats = multiprocessing.Array('q', count * len(STAT_FIELDS), lock=False)
+        self.pids = {}
+        self.workerPids = [0] * count
+
+    def start(self, serveForever):
+        """Fork the workers; each one calls serveForever() with its own listening socket."""
+        for index in range(self.count):
+            pid = os.fork()
+            if pid == 0:
+                self.runChild(index, serveForever)
+            self.pids[pid] = index
+            self.workerPids[index] = pid
+            print(f"[SERVER] worker {index} started (pid {pid})")
+
+    def runChild(self, index, serveForever):
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        ServerWorker.workerIndex = index
+        ServerWorker.workerCount = self.count
+        threading.Thread(target=self.publishStats, args=(index,), daemon=True).start()
+        code = 0
+        try:
+            serveForever()
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+
+    def publishStats(self, index):
+        base = index * len(STAT_FIELDS)
+        while True:
+            stats = ServerWorker.processStats()
+            for i, field in enumerate(STAT_FIELDS):
+                self.stats[base + i] = stats[field]
+            time.sleep(PUBLISH_INTERVAL)
+
+    def workerStats(self, index):
+        base = index * len(STAT_FIELDS)
+        return {field: self.stats[base + i] for i, field in enumerate(STAT_FIELDS)}
+
+    def printStats(self):
+        print("\n[SERVER WORKERS]")
+        print(f"  {'worker':>6} {'pid':>8} {'active':>7} {'playing':>8} {'closed':>7} "
+              f"{'frames':>10} {'packets':>11} {'MB sent':>10}")
+        totals = dict.fromkeys(STAT_FIELDS, 0)
+        for index, pid in enumerate(self.workerPids):
+            s = self.workerStats(index)
+            for field in STAT_FIELDS:
+                totals[field] += s[field]
+            print(f"  {index:>6} {pid:>8} {s['active']:>7} {s['playing']:>8} {s['closed']:>7} "
+                  f"{s['frames']:>10} {s['packets']:>11} {s['bytes'] / 1_000_000:>10.2f}")
+        print(f"  {'total':>6} {'':>8} {totals['active']:>7} {totals['playing']:>8} {totals['closed']:>7} "
+              f"{totals['frames']:>10} {totals['packets']:>11} {totals['bytes'] / 1_000_000:>10.2f}\n")
+
+    def supervise(self):
+        """Parent loop: print per-worker stats, stop all workers on Ctrl+C/SIGTERM or when one dies."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while self.pids:
+                deadline = time.time() + self.statsInterval
+                while time.time() < deadline:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                    if pid != 0:
+                        index = self.pids.pop(pid, None)
+                        print(f"[SERVER] worker {index} (pid {pid}) exited with status {status}")
+                        raise KeyboardInterrupt
+                    time.sleep(0.2)
+                self.printStats()
+        except KeyboardInterrupt:
+            pass
+        except ChildProcessError:
+            pass
+        finally:
+            for pid in self.pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in list(self.pids):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            self.printStats()
+            sys.stdout.flush()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+FPS hiển thị tối đa của client: đường cũ (ghi cache-*.jpg, Image.open(path), os.remove)
+vs đường mới (bytes trong RAM -> Image.open(BytesIO)).
+
+Mỗi frame đi qua đúng các bước của Client.listenRtp + consumeBuffer/updateMovie.
+Có $DISPLAY thì tạo cả ImageTk.PhotoImage và gắn vào Label như Client; không có thì
+chỉ đo decode (in ra cảnh báo).
+
+    python3 benchmarks/ClientDisplayBenchmark.py [--video movie.Mjpeg] [--frames 300]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from FrameStore import openFrameFile
+
+
+def loadFrames(path, count, width, height):
+    """JPEG frames from a frame file, or synthetic ones if no file is given."""
+    if path:
+        frameFile = openFrameFile(path)
+        frames = []
+        while len(frames) < count:
+            data = frameFile.frame(len(frames))
+            if data is None:
+                break
+            frames.append(bytes(data))
+            data.release()
+        frameFile.close()
+        if frames:
+            return frames
+
+    frames = []
+    for i in range(min(count, 30)):
+        image = Image.effect_mandelbrot((width, height), (-2 + i * 0.01, -1.2, 1, 1.2), 100).convert('RGB')
+        buf = io.BytesIO()
+        image.save(buf, 'JPEG', quality=90)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def makeDisplay():
+    """(show(image) callable, description); decode-only if Tk cannot open a display."""
+    try:
+        from tkinter import Tk, Label
+        from PIL import ImageTk
+        root = Tk()
+    except Exception as e:
+        print(f"[WARN] No Tk display ({e}); measuring decode only")
+        return (lambda image: image.load()), "decode only", None
+
+    label = Label(root)
+    label.pack()
+
+    def show(image):
+        photo = ImageTk.PhotoImage(image)
+        label.configure(image=photo)
+        label.image = photo
+        root.update_idletasks()
+
+    return show, "decode + PhotoImage", root
+
+
+def runFileCache(frames, count, show, directory):
+    """Old path: write cache-<session>_<seq>.jpg, reopen it for display, delete it."""
+    start = time.perf_counter()
+    for i in range(count):
+        data = frames[i % len(frames)]
+        path = os.path.join(directory, f"cache-0_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(data)
+        show(Image.open(path))
+        os.remove(path)
+    return count / (time.perf_counter() - start)
+
+
+def runInMemory(frames, count, show):
+    """New path: the frame bytes go straight from the buffer to the decoder."""
+    start = time.perf_counter()
+    for i in range(count):
+        show(Image.open(io.BytesIO(frames[i % len(frames)])))
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Max sustainable client display FPS")
+    parser.add_argument('--video', default=None, help="movie.Mjpeg / .mjpx file (default: synthetic frames)")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--rounds', type=int, default=3, help="runs per path (best is reported)")
+    parser.add_argument('--dir', default='.', help="where the old path writes its cache files (Client uses the cwd)")
+    args = parser.parse_args()
+    if args.video:
+        frameFile = openFrameFile(args.video)
+        if frameFile is None:
+            parser.error("--video must be a .mjpx / .Mjpeg frame file (convert other videos with Ingest.py)")
+        frameFile.close()
+
+    frames = loadFrames(args.video, args.frames, args.width, args.height)
+    avgSize = sum(len(f) for f in frames) / len(frames)
+    show, what, root = makeDisplay()
+    print(f"{len(frames)} distinct frames, avg {avgSize / 1000:.1f} kB, {args.frames} displayed per run ({what})")
+
+    # Xen kẽ 2 đường qua nhiều vòng, lấy vòng tốt nhất của mỗi đường
+    fileFps = memoryFps = 0.0
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        runInMemory(frames, min(20, args.frames), show)  # warm-up (decoder init)
+        for _ in range(args.rounds):
+            fileFps = max(fileFps, runFileCache(frames, args.frames, show, directory))
+            memoryFps = max(memoryFps, runInMemory(frames, args.frames, show))
+
+    print(f"{'path':<22}{'max fps':>10}{'ms/frame':>12}")
+    for name, fps in (("cache-*.jpg files", fileFps), ("in-memory bytes", memoryFps)):
+        print(f"{name:<22}{fps:>10.1f}{1000 / fps:>12.2f}")
+    print(f"speedup: {memoryFps / fileFps:.2f}x")
+
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh các backend encode JPEG trên cùng một clip: thời gian encode mỗi frame (CPU time
+của thread), số byte mỗi frame và PSNR so với frame gốc. Frame được decode trước một lần,
+nên chỉ đo phần encode. Với nguồn MJPEG, dòng passthrough là chi phí đọc frame gốc
+(không decode/encode).
+
+    python3 benchmarks/EncoderBenchmark.py movie.avi --frames 200 --quality 80 98
+    python3 benchmarks/EncoderBenchmark.py movie.avi --turbojpeg-lib /opt/libjpeg-turbo/lib64/libturbojpeg.so
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+from Encoders import OpenCvEncoder, PassthroughEncoder, TurboJpegEncoder, EncoderError
+from VideoStream import VideoStream
+
+
+def loadFrames(source, count):
+    """First `count` frames of source, decoded (BGR)."""
+    stream = VideoStream(source)
+    frames = []
+    while len(frames) < count:
+        data = stream.nextFrame()
+        if data is None:
+            break
+        frames.append(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR))
+    return frames
+
+
+def backends(args):
+    """(label, encoder) pairs to compare; TurboJPEG variants only if the library loads."""
+    out = [("opencv", OpenCvEncoder())]
+    for subsampling in ('420', '444'):
+        out.append((f"opencv {subsampling}", OpenCvEncoder(subsampling)))
+    try:
+        for subsampling in ('420', '422', '444'):
+            out.append((f"turbojpeg {subsampling} fast", TurboJpegEncoder(subsampling, True, args.turbojpeg_lib)))
+        out.append(("turbojpeg 420 accurate", TurboJpegEncoder('420', False, args.turbojpeg_lib)))
+    except EncoderError as e:
+        print(f"(turbojpeg skipped: {e})")
+    return out
+
+
+def measure(encoder, frames, quality):
+    sizes = 0
+    psnr = 0.0
+    cpu = 0.0
+    for image in frames:
+        start = time.thread_time()
+        data = encoder.encode(image, quality)
+        cpu += time.thread_time() - start
+        sizes += len(data)
+        psnr += cv2.PSNR(image, cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR))
+    n = len(frames)
+    return cpu * 1000 / n, sizes / n, psnr / n
+
+
+def measurePassthrough(source, count):
+    """ms/frame and bytes/frame of sending the source's own JPEG frames; None if not MJPEG."""
+    previous = VideoStream.encoder
+    VideoStream.encoder = PassthroughEncoder()
+    try:
+        stream = VideoStream(source)
+        if not stream.isPassthrough():
+            return None
+        sizes = frames = 0
+        start = time.thread_time()
+        while frames < count:
+            data = stream.nextFrame()
+            if data is None:
+                break
+            sizes += len(data)
+            frames += 1
+        return (time.thread_time() - start) * 1000 / frames, sizes / frames
+    finally:
+        VideoStream.encoder = previous
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help="video file or pre-encoded .mjpx / .Mjpeg")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--quality', type=int, nargs='+', default=[80, 98])
+    parser.add_argument('--turbojpeg-lib', default=None)
+    args = parser.parse_args()
+
+    frames = loadFrames(args.source, args.frames)
+    if not frames:
+        print("no frames")
+        return
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames {width}x{height} from {args.source}")
+    print(f"{'backend':<26}{'quality':>8}{'ms/frame':>10}{'bytes/frame':>13}{'PSNR dB':>9}")
+    for label, encoder in backends(args):
+        for quality in args.quality:
+            ms, size, psnr = measure(encoder, frames, quality)
+            print(f"{label:<26}{quality:>8}{ms:>10.2f}{size:>13.0f}{psnr:>9.2f}")
+
+    result = measurePassthrough(args.source, args.frames)
+    if result is not None:
+        print(f"{'passthrough':<26}{'source':>8}{result[0]:>10.2f}{result[1]:>13.0f}{'-':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Mô phỏng đường truyền mất packet (cục bộ, không cần socket): frame được packetize, thêm
+parity FEC, bỏ packet theo mô hình Gilbert-Elliott (--burst 1 = mất ngẫu nhiên độc lập),
+rồi đi qua FecDecoder + FrameAssembler như trong Client. Báo cáo tỉ lệ frame nhận nguyên
+vẹn theo overhead của từng mức k.
+
+    python3 benchmarks/FecSimulation.py --loss 0.01 0.02 0.05 --fec 0 1 2 4 auto --burst 2
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Fec import FecDecoder, FecEncoder, parseFecSetting, FEC_PT
+from FrameAssembler import FrameAssembler, jpegStart
+from RtpPacket import RtpPacket, RtpPacketizer
+from ServerWorker import MAX_PAYLOAD
+
+
+class LossyLink:
+    """Gilbert-Elliott: in the bad state every packet is lost; mean bad run = burst packets."""
+
+    def __init__(self, loss, burst, rng):
+        self.rng = rng
+        self.leaveBad = 1.0 / max(burst, 1.0)
+        self.enterBad = loss * self.leaveBad / (1.0 - loss) if loss < 1.0 else 1.0
+        self.bad = False
+
+    def drops(self):
+        if self.bad:
+            self.bad = self.rng.random() >= self.leaveBad
+        else:
+            self.bad = self.rng.random() < self.enterBad
+        return self.bad
+
+
+def makeFrames(count, meanSize, rng):
+    """JPEG-like frames (SOI first) with sizes spread ±50% around meanSize."""
+    frames = []
+    for _ in range(count):
+        size = max(100, int(rng.uniform(0.5, 1.5) * meanSize))
+        frames.append(b'\xff\xd8' + rng.randbytes(size - 2))
+    return frames
+
+
+def simulate(frames, setting, loss, burst, seed):
+    rng = random.Random(seed)
+    link = LossyLink(loss, burst, rng)
+    packetizer = RtpPacketizer(ssrc=1, maxPayload=MAX_PAYLOAD)
+    encoder = FecEncoder(2, setting) if setting else None
+    if encoder is not None and encoder.adaptive:
+        encoder.onLoss(loss)  # trạng thái ổn định: RR báo đúng loss của đường truyền
+    decoder = FecDecoder()
+    decoder.active = encoder is not None  # như SETUP reply có header FEC:
+    assembler = FrameAssembler(isFrameStart=jpegStart)
+
+    seq = 0
+    mediaPackets = parityPackets = mediaBytes = parityBytes = 0
+    delivered = []
+    for index, data in enumerate(frames):
+        batch = packetizer.packetize(data, seq + 1, index * 3600)
+        seq = (seq + batch.count) % 65536
+        packets = [batch.packet(i) for i in range(batch.count)]
+        mediaPackets += batch.count
+        mediaBytes += batch.totalBytes()
+        if encoder is not None:
+            parityBatch = encoder.protect(batch)
+            if parityBatch is not None:
+                packets += [parityBatch.packet(i) for i in range(parityBatch.count)]
+                parityPackets += parityBatch.count
+                parityBytes += parityBatch.totalBytes()
+
+        for raw in packets:
+            if link.drops():
+                continue
+            packet = RtpPacket()
+            packet.decode(raw)
+            timestamp = packet.timestamp()
+            if packet.payloadType() == FEC_PT:
+                fragments = decoder.onParity(timestamp, packet.getPayload())
+            else:
+                fragments = decoder.onMedia(packet.seqNum(), timestamp, packet.getPayload())
+                fragments.insert(0, (packet.seqNum(), timestamp, packet.getMarker(), packet.getPayload()))
+            for fragment in fragments:
+                delivered += assembler.push(*fragment)
+    delivered += assembler.flush()
+
+    intact = sum(1 for f in delivered if f.complete and bytes(f.data) == frames[f.timestamp // 3600])
+    return {
+        'intact': intact,
+        'packetOverhead': parityPackets / mediaPackets,
+        'byteOverhead': parityBytes / mediaBytes,
+        'recovered': decoder.packetsRecovered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--frame-size', type=int, default=30000,
+                        help="mean encoded frame size in bytes")
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.005, 0.01, 0.02, 0.05, 0.10])
+    parser.add_argument('--fec', type=parseFecSetting, nargs='+', default=[0, 1, 2, 4, 8, 'auto'],
+                        help="parity packets per frame to compare ('auto' = adaptive)")
+    parser.add_argument('--burst', type=float, default=1.0,
+                        help="mean number of consecutive lost packets (1 = independent losses)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    frames = makeFrames(args.frames, args.frame_size, rng)
+    meanPackets = sum(-(-len(f) // MAX_PAYLOAD) for f in frames) / len(frames)
+
+    print(f"{args.frames} frames, mean {args.frame_size} bytes ({meanPackets:.1f} packets), "
+          f"payload {MAX_PAYLOAD}, mean burst {args.burst}")
+    print(f"{'loss':>6}{'fec':>6}{'overhead':>10}{'frames ok':>11}{'recovered':>11}")
+    for loss in args.loss:
+        for setting in args.fec:
+            result = simulate(frames, setting, loss, args.burst, args.seed)
+            print(f"{loss * 100:>5.1f}%{str(setting):>6}{result['byteOverhead'] * 100:>9.1f}%"
+                  f"{result['intact'] * 100.0 / len(frames):>10.1f}%{result['recovered']:>11}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Load test: N session RTSP/RTP trên loopback, so sánh CPU của server
+giữa chế độ threaded (thread-per-client) và async (một event loop).
+--broadcast: mọi session xem chung một BroadcastChannel (unicast fan-out).
+
+    python3 benchmarks/LoadTest.py --sessions 200 --duration 10
+    python3 benchmarks/LoadTest.py --sessions 1 10 100 500 --broadcast
+"""
+import argparse
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from FrameStore import PackedFrameWriter
+from RtspParser import formatRequest
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def makeSyntheticVideo(path, frameSize, frameCount, fps=20.0):
+    """Packed file chứa các frame giả (không cần JPEG hợp lệ vì server chỉ chuyển tiếp)."""
+    block = os.urandom(frameSize)
+    with PackedFrameWriter(path, fps) as writer:
+        for _ in range(frameCount):
+            writer.addFrame(block)
+
+
+def processTree(pid):
+    """pid và các process con (server chạy --workers N)."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            for child in f.read().split():
+                pids.extend(processTree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def processCpuSeconds(pid):
+    total = 0
+    for p in processTree(pid):
+        with open(f"/proc/{p}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime, stime là field 14, 15 (tính từ 1)
+        total += int(fields[11]) + int(fields[12])
+    return total / CLOCK_TICKS
+
+
+def processThreads(pid):
+    threads = 0
+    for p in processTree(pid):
+        with open(f"/proc/{p}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    threads += int(line.split()[1])
+    return threads
+
+
+def waitForPort(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def rtspRequest(sock, method, uri, cseq, headers=()):
+    sock.sendall(formatRequest(method, uri, cseq, headers))
+    return sock.recv(1024).decode()
+
+
+def runMode(mode, args, videoPath, sessionCount):
+    serverPort = args.port
+    command = [sys.executable, os.path.join(ROOT, 'Server.py'), str(serverPort), '--mode', mode,
+               '--workers', str(args.workers)]
+    if args.broadcast:
+        command.append('--broadcast')
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+    sessions = []
+    sel = selectors.DefaultSelector()
+
+    try:
+        waitForPort(serverPort)
+
+        for i in range(sessionCount):
+            rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            rtp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+            rtp.bind(('127.0.0.1', 0))
+            rtp.setblocking(False)
+            rtsp = socket.create_connection(('127.0.0.1', serverPort))
+            reply = rtspRequest(rtsp, 'SETUP', videoPath, 1,
+                                [f"Transport: RTP/UDP; client_port={rtp.getsockname()[1]}"])
+            sessionId = reply.split('Session:')[1].split()[0].split(';')[0]
+            stats = {'packets': 0, 'bytes': 0, 'frames': 0}
+            sessions.append((rtsp, rtp, sessionId, stats))
+            sel.register(rtp, selectors.EVENT_READ, stats)
+
+        cpuStart = processCpuSeconds(server.pid)
+        wallStart = time.time()
+        for rtsp, _, sessionId, _ in sessions:
+            rtspRequest(rtsp, 'PLAY', videoPath, 2, [f"Session: {sessionId}"])
+
+        deadline = wallStart + args.duration
+        while time.time() < deadline:
+            for key, _ in sel.select(timeout=0.1):
+                stats = key.data
+                while True:
+                    try:
+                        data = key.fileobj.recv(65536)
+                    except BlockingIOError:
+                        break
+                    stats['packets'] += 1
+                    stats['bytes'] += len(data)
+                    if data[1] & 0x80:
+                        stats['frames'] += 1
+
+        wall = time.time() - wallStart
+        cpu = processCpuSeconds(server.pid) - cpuStart
+        threads = processThreads(server.pid)
+
+        for rtsp, _, sessionId, _ in sessions:
+            try:
+                rtsp.sendall(formatRequest('TEARDOWN', videoPath, 3, [f"Session: {sessionId}"]))
+            except OSError:
+                pass
+    finally:
+        for rtsp, rtp, _, _ in sessions:
+            rtsp.close()
+            rtp.close()
+        server.terminate()
+        server.wait()
+
+    frames = sum(s[3]['frames'] for s in sessions)
+    packets = sum(s[3]['packets'] for s in sessions)
+    sessionSeconds = sessionCount * wall
+    name = mode if args.workers == 1 else f"{mode}x{args.workers}"
+    return {
+        'mode': name + '+bc' if args.broadcast else name,
+        'sessions': sessionCount,
+        'serverThreads': threads,
+        'cpuPercent': cpu / wall * 100,
+        'cpuMsPerSessionSecond': cpu * 1000 / sessionSeconds,
+        'fpsPerSession': frames / sessionSeconds,
+        'packetsPerSecond': packets / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, nargs='+', default=[100])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--frame-size', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=18554)
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'async'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--broadcast', action='store_true', help="run the server with --broadcast")
+    args = parser.parse_args()
+
+    # Mỗi session dùng 2 socket ở client và 2 socket ở server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        videoPath = os.path.join(tmp, 'synthetic.mjpx')
+        makeSyntheticVideo(videoPath, args.frame_size, int(20 * (args.duration + 5)))
+
+        print(f"{'mode':<10}{'sessions':>10}{'threads':>9}{'CPU %':>9}"
+              f"{'CPU ms/session·s':>18}{'fps/session':>13}{'pkt/s':>10}")
+        for mode in args.modes:
+            for sessionCount in args.sessions:
+                r = runMode(mode, args, videoPath, sessionCount)
+                print(f"{r['mode']:<10}{r['sessions']:>10}{r['serverThreads']:>9}{r['cpuPercent']:>9.1f}"
+                      f"{r['cpuMsPerSessionSecond']:>18.3f}{r['fpsPerSession']:>13.2f}{r['packetsPerSecond']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark packetization RTP: trước (RtpPacket mới + copy payload mỗi fragment)
+và sau (RtpPacketizer: pack_into vào buffer dùng lại + memoryview payload).
+Báo cáo packets/s trên một core (CPU time của thread).
+
+    python3 benchmarks/PacketizeBenchmark.py --frame-size 100000
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from RtpPacket import RtpPacket, RtpPacketizer
+from ServerWorker import MAX_PAYLOAD
+from UdpBatch import BatchSender
+
+
+def packetizeCopy(data, seq):
+    """Đường cũ: mỗi fragment một RtpPacket, slice copy payload, header + payload copy lần nữa."""
+    packets = []
+    offset = 0
+    frameSize = len(data)
+    while offset < frameSize:
+        chunk = data[offset: offset + MAX_PAYLOAD]
+        offset += MAX_PAYLOAD
+        marker = 1 if offset >= frameSize else 0
+        seq = (seq + 1) % 65536
+        rtpPacket = RtpPacket()
+        rtpPacket.encode(2, 0, 0, 0, seq, marker, 26, 123456, chunk)
+        packets.append(rtpPacket.getPacket())
+    return packets
+
+
+def measure(fn, duration):
+    frames = 0
+    packets = 0
+    cpuStart = time.thread_time()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        packets += fn()
+        frames += 1
+    cpu = time.thread_time() - cpuStart
+    return packets / cpu, frames / cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frame-size', type=int, default=100000)
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--send', action='store_true',
+                        help="also send every frame to a loopback port with sendmmsg")
+    args = parser.parse_args()
+
+    data = os.urandom(args.frame_size)
+    packetizer = RtpPacketizer(123456, maxPayload=MAX_PAYLOAD)
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    address = sink.getsockname()
+    sender = BatchSender(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+
+    if args.send:
+        def before():
+            return sender.send(packetizeCopy(data, 0), address)
+
+        def after():
+            return sender.sendBatch(packetizer.packetize(data, 1, 0), address)
+    else:
+        def before():
+            return len(packetizeCopy(data, 0))
+
+        def after():
+            return packetizer.packetize(data, 1, 0).count
+
+    print(f"frame {args.frame_size} bytes, payload {MAX_PAYLOAD}, send={args.send}")
+    print(f"{'path':<28}{'packets/s/core':>16}{'frames/s/core':>15}")
+    for name, fn in (("before (copy per packet)", before), ("after (zero-copy)", after)):
+        pps, fps = measure(fn, args.duration)
+        print(f"{name:<28}{pps:>16.0f}{fps:>15.0f}")
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
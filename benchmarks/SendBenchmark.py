@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+So sánh đường gửi RTP: sendto từng fragment vs sendmmsg cả frame, trên loopback.
+Báo cáo packets/s và CPU (ms) trên mỗi Mbps của thread gửi.
+
+    python3 benchmarks/SendBenchmark.py --frame-size 60000 --duration 5
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from UdpBatch import BatchSender, hasSendmmsg
+from ServerWorker import MAX_PAYLOAD
+from RtpPacket import RtpPacket
+
+
+def drain(port, ready, stop):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('127.0.0.1', port))
+    sock.settimeout(0.2)
+    ready.set()
+    while not stop.is_set():
+        try:
+            sock.recv(65536)
+        except socket.timeout:
+            pass
+
+
+def makePackets(frameSize):
+    data = os.urandom(frameSize)
+    packets = []
+    seq = 0
+    for offset in range(0, frameSize, MAX_PAYLOAD):
+        seq += 1
+        rtp = RtpPacket()
+        marker = 1 if offset + MAX_PAYLOAD >= frameSize else 0
+        rtp.encode(2, 0, 0, 0, seq, marker, 26, 123456, data[offset: offset + MAX_PAYLOAD])
+        packets.append(rtp.getPacket())
+    return packets
+
+
+def run(useSendmmsg, packets, address, duration):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, useSendmmsg=useSendmmsg)
+    frameBytes = sum(len(p) for p in packets)
+
+    frames = 0
+    cpuStart = time.thread_time()
+    wallStart = time.perf_counter()
+    deadline = wallStart + duration
+    while time.perf_counter() < deadline:
+        sender.send(packets, address)
+        frames += 1
+    wall = time.perf_counter() - wallStart
+    cpu = time.thread_time() - cpuStart
+    sock.close()
+
+    mbps = frames * frameBytes * 8 / wall / 1_000_000
+    return {
+        'path': 'sendmmsg' if sender.batched else 'sendto',
+        'packetsPerSecond': frames * len(packets) / wall,
+        'mbps': mbps,
+        'cpuMsPerMbps': cpu * 1000 / (mbps * wall) if mbps > 0 else 0.0,
+        'syscallsPerFrame': sender.syscalls / frames if frames else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frame-size', type=int, default=60000)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=29000)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    receiver = multiprocessing.Process(target=drain, args=(args.port, ready, stop), daemon=True)
+    receiver.start()
+    ready.wait()
+
+    packets = makePackets(args.frame_size)
+    address = ('127.0.0.1', args.port)
+    print(f"frame {args.frame_size} bytes = {len(packets)} packets of <= {MAX_PAYLOAD} bytes; "
+          f"sendmmsg available: {hasSendmmsg()}")
+    print(f"{'path':<10}{'packets/s':>12}{'Mbps':>10}{'CPU ms/Mbps':>14}{'syscalls/frame':>16}")
+    try:
+        for useSendmmsg in (False, True):
+            r = run(useSendmmsg, packets, address, args.duration)
+            print(f"{r['path']:<10}{r['packetsPerSecond']:>12.0f}{r['mbps']:>10.1f}"
+                  f"{r['cpuMsPerMbps']:>14.4f}{r['syscallsPerFrame']:>16.1f}")
+    finally:
+        stop.set()
+        receiver.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark đầu-cuối không cần GUI: sinh một clip JPEG tổng hợp, chạy Server.py và N client
+headless trên loopback, đo theo ma trận (số client x kích thước frame x MAX_PAYLOAD):
+
+- server: CPU %, frame/s và packet/s đã gửi, thời gian từng chặng (read, encode,
+  packetize, send) lấy từ --metrics-port của server chạy --profile-stages
+- client: fps mỗi client, loss, jitter RFC 3550, trễ đầu-cuối (từ deadline gửi của frame
+  theo đồng hồ server trong RTCP SR tới lúc ghép xong / decode xong frame), thời gian
+  reassemble và decode (--decode)
+
+Chặng display chỉ có ở client Tk (ClientLauncher.py --profile-stages). Kết quả ghi ra JSON;
+--compare so với một lần chạy trước (cùng ô ma trận) để thấy regression.
+
+    python3 benchmarks/StreamBenchmark.py --clients 1 10 50 --sizes 640x360 1280x720 --payloads 1400 8000
+    python3 benchmarks/StreamBenchmark.py --clients 20 --decode --output new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+import Metrics
+import StageTimer
+from FrameAssembler import FrameAssembler, jpegStart
+from FrameStore import PackedFrameWriter
+from Rtcp import ReceptionStats, SenderReport, bindPortPair, parseRtcp
+from RtpPacket import RtpPacket, IP_UDP_HEADER_SIZE, HEADER_SIZE
+from RtspParser import formatRequest
+from LoadTest import processCpuSeconds, waitForPort
+
+# Các giá trị so sánh khi --compare (cao hơn là tốt hơn?)
+COMPARED = (('fpsPerClient', True), ('serverCpuPercent', False), ('lossPercent', False),
+            ('latencyP50Ms', False), ('latencyP99Ms', False))
+
+
+def makeSyntheticClip(path, width, height, frameCount, fps, quality=85):
+    """Packed .mjpx clip of real JPEG frames: gradient, a moving box and noise (so frames differ in size)."""
+    rng = np.random.default_rng(1)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.dstack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.full((height, width), 128, np.float32)]).astype(np.uint8)
+    noise = rng.integers(0, 24, (height, width, 3), dtype=np.uint8)
+    box = max(8, height // 6)
+    sizes = 0
+    with PackedFrameWriter(path, fps) as writer:
+        for i in range(frameCount):
+            image = base.copy()
+            image[:] += np.roll(noise, i * 7, axis=1)
+            left = (i * 9) % max(1, width - box)
+            top = (i * 5) % max(1, height - box)
+            image[top:top + box, left:left + box] = (255 - 3 * i % 256, 40, 200)
+            cv2.putText(image, str(i), (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, height / 360, (255, 255, 255), 2)
+            data = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+            writer.addFrame(data)
+            sizes += len(data)
+    return sizes / frameCount
+
+
+class HeadlessReceiver:
+    """One RTSP session receiving RTP (+ RTCP SR) on a UDP port pair, driven by the benchmark's selector."""
+
+    def __init__(self, serverPort, videoPath, decode, stages):
+        self.videoPath = videoPath
+        self.decode = decode
+        self.stages = stages
+        self.rtpSocket, self.rtcpSocket = bindPortPair('127.0.0.1')
+        self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        for sock in (self.rtpSocket, self.rtcpSocket):
+            sock.setblocking(False)
+        self.rtsp = socket.create_connection(('127.0.0.1', serverPort))
+        self.assembler = FrameAssembler(isFrameStart=jpegStart)
+        self.reception = ReceptionStats()
+        self.packets = 0
+        self.bytes = 0
+        self.frames = 0
+        self.undecodable = 0
+        self.sessionId = None
+
+    def request(self, method, cseq, extra=()):
+        session = [f"Session: {self.sessionId}"] if self.sessionId else []
+        self.rtsp.sendall(formatRequest(method, self.videoPath, cseq, session + list(extra)))
+        return self.rtsp.recv(4096).decode(errors='replace')
+
+    def setup(self):
+        port = self.rtpSocket.getsockname()[1]
+        reply = self.request('SETUP', 1, [f"Transport: RTP/UDP; client_port={port}-{port + 1}"])
+        self.sessionId = reply.split('Session:')[1].split()[0].split(';')[0]
+
+    def play(self):
+        self.request('PLAY', 2)
+
+    def teardown(self):
+        try:
+            self.rtsp.sendall(formatRequest('TEARDOWN', self.videoPath, 3, [f"Session: {self.sessionId}"]))
+        except OSError:
+            pass
+
+    def close(self):
+        for sock in (self.rtsp, self.rtpSocket, self.rtcpSocket):
+            sock.close()
+
+    def onReadable(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                return
+            if sock is self.rtcpSocket:
+                for report in parseRtcp(data):
+                    if isinstance(report, SenderReport):
+                        self.reception.onSenderReport(report)
+            else:
+                self.onRtp(data)
+
+    def onRtp(self, data):
+        start = time.perf_counter()
+        now = time.time()
+        self.packets += 1
+        self.bytes += len(data)
+        packet = RtpPacket()
+        packet.decode(data)
+        timestamp = packet.timestamp()
+        self.reception.onPacket(packet.ssrc(), packet.seqNum(), timestamp, now)
+        frames = self.assembler.push(packet.seqNum(), timestamp, packet.getMarker(), packet.getPayload())
+        self.stages['reassemble'].observe(time.perf_counter() - start)
+        for frame in frames:
+            if frame.complete:
+                self.onFrame(frame)
+
+    def onFrame(self, frame):
+        if self.decode:
+            start = time.perf_counter()
+            image = cv2.imdecode(np.frombuffer(frame.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.stages['decode'].observe(time.perf_counter() - start)
+            if image is None:
+                self.undecodable += 1
+                return
+        self.frames += 1
+        sentAt = self.reception.wallClock(frame.timestamp)
+        if sentAt is not None:
+            self.stages['latency'].observe(max(0.0, time.time() - sentAt))
+
+
+def scrapeHistograms(text):
+    """{name: {'bounds', 'cumulative', 'sum', 'count'}} of the histograms in a /metrics page."""
+    histograms = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        if name.endswith('}') and '_bucket{' in name:
+            base = name[:name.index('_bucket{')]
+            bound = name.split('le="')[1].split('"')[0]
+            entry = histograms.setdefault(base, {'bounds': [], 'cumulative': [], 'sum': 0.0, 'count': 0})
+            if bound != '+Inf':
+                entry['bounds'].append(float(bound))
+            entry['cumulative'].append(float(value))
+        elif name.endswith('_sum') and name[:-4] in histograms:
+            histograms[name[:-4]]['sum'] = float(value)
+        elif name.endswith('_count') and name[:-6] in histograms:
+            histograms[name[:-6]]['count'] = int(float(value))
+    return histograms
+
+
+def serverStages(metricsPort):
+    """Stage timing of the server process (empty if the page cannot be read)."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{metricsPort}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return {}
+    out = {}
+    for name, h in scrapeHistograms(text).items():
+        if not (name.startswith('rtp_stage_') and h['count']):
+            continue
+        cumulative = h['cumulative']
+        counts = [cumulative[0]] + [b - a for a, b in zip(cumulative, cumulative[1:])]
+        out[name[len('rtp_stage_'):-len('_seconds')]] = Metrics.histogramSummary(h['bounds'], counts, h['sum'], h['count'])
+    return out
+
+
+def runCell(args, videoPath, clients, payload):
+    mtu = payload + IP_UDP_HEADER_SIZE + HEADER_SIZE
+    metricsPort = args.port + 1
+    command = [sys.executable, os.path.join(ROOT, 'Server.py'), str(args.port), '--mode', args.mode,
+               '--mtu', str(mtu), '--metrics-port', str(metricsPort), '--profile-stages']
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+    stages = {name: Metrics.Histogram(name, '', StageTimer.STAGE_BUCKETS) for name in ('reassemble', 'decode')}
+    stages['latency'] = Metrics.Histogram('latency', '', Metrics.TIME_BUCKETS)
+    receivers = []
+    sel = selectors.DefaultSelector()
+    try:
+        waitForPort(args.port)
+        for _ in range(clients):
+            receiver = HeadlessReceiver(args.port, videoPath, args.decode, stages)
+            receiver.setup()
+            receivers.append(receiver)
+            sel.register(receiver.rtpSocket, selectors.EVENT_READ, receiver)
+            sel.register(receiver.rtcpSocket, selectors.EVENT_READ, receiver)
+
+        cpuStart = processCpuSeconds(server.pid)
+        clientCpuStart = time.process_time()
+        wallStart = time.time()
+        for receiver in receivers:
+            receiver.play()
+
+        deadline = wallStart + args.duration
+        while time.time() < deadline:
+            for key, _ in sel.select(timeout=0.1):
+                key.data.onReadable(key.fileobj)
+
+        wall = time.time() - wallStart
+        cpu = processCpuSeconds(server.pid) - cpuStart
+        clientCpu = time.process_time() - clientCpuStart
+        serverStageStats = serverStages(metricsPort)
+        for receiver in receivers:
+            receiver.teardown()
+    finally:
+        for receiver in receivers:
+            receiver.close()
+        server.terminate()
+        server.wait()
+
+    expected = sum(r.reception.expected() for r in receivers)
+    lost = sum(max(0, r.reception.cumulativeLost()) for r in receivers)
+    latency = stages['latency'].summary()
+    clientStages = {name: stages[name].summary() for name in ('reassemble', 'decode') if stages[name].summary()['count']}
+    return {
+        'clients': clients,
+        'maxPayload': payload,
+        'serverCpuPercent': cpu / wall * 100,
+        'clientCpuPercent': clientCpu / wall * 100,
+        'fpsPerClient': sum(r.frames for r in receivers) / wall / clients,
+        'packetsPerSecond': sum(r.packets for r in receivers) / wall,
+        'mbps': sum(r.bytes for r in receivers) * 8 / wall / 1e6,
+        'lossPercent': lost * 100.0 / expected if expected else 0.0,
+        'jitterMs': sum(r.reception.jitterMs() for r in receivers) / clients,
+        'latencyMeanMs': latency['meanMs'],
+        'latencyP50Ms': latency['p50Ms'],
+        'latencyP99Ms': latency['p99Ms'],
+        'undecodable': sum(r.undecodable for r in receivers),
+        'stages': {**serverStageStats, **clientStages},
+    }
+
+
+def cellKey(row):
+    return (row['clients'], row['frameSize'], row['maxPayload'])
+
+
+def printComparison(results, previousPath, threshold):
+    with open(previousPath) as f:
+        previous = {cellKey(row): row for row in json.load(f)['results']}
+    print(f"\nvs {previousPath}:")
+    for row in results:
+        old = previous.get(cellKey(row))
+        if old is None:
+            continue
+        changes = []
+        for field, higherIsBetter in COMPARED:
+            if old[field]:
+                delta = (row[field] - old[field]) * 100.0 / old[field]
+                worse = delta < 0 if higherIsBetter else delta > 0
+                changes.append(f"{field} {delta:+.1f}%{' !' if worse and abs(delta) >= threshold else ''}")
+        print(f"  {row['clients']:>4} x {row['frameSize']:<10} payload {row['maxPayload']:<6} " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--sizes', nargs='+', default=['640x360'], help="synthetic frame sizes as WIDTHxHEIGHT")
+    parser.add_argument('--payloads', type=int, nargs='+', default=[1432], help="MAX_PAYLOAD values (bytes of RTP payload)")
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded')
+    parser.add_argument('--decode', action='store_true', help="JPEG-decode every complete frame on the clients")
+    parser.add_argument('--port', type=int, default=18654, help="RTSP port (metrics on port + 1)")
+    parser.add_argument('--output', default='stream_benchmark.json')
+    parser.add_argument('--compare', default=None, help="earlier JSON output to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="%% change flagged as a regression")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    results = []
+    print(f"{'clients':>8}{'size':>11}{'payload':>9}{'frame B':>9}{'srv CPU%':>10}{'fps/cl':>8}{'pkt/s':>9}"
+          f"{'loss%':>7}{'jit ms':>8}{'lat p50':>9}{'lat p99':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            width, height = (int(v) for v in size.lower().split('x'))
+            videoPath = os.path.join(tmp, f'synthetic-{width}x{height}.mjpx')
+            frameBytes = makeSyntheticClip(videoPath, width, height, int(args.fps * (args.duration + 5)), args.fps)
+            for payload in args.payloads:
+                for clients in args.clients:
+                    row = runCell(args, videoPath, clients, payload)
+                    row['frameSize'] = size
+                    row['frameBytes'] = frameBytes
+                    results.append(row)
+                    print(f"{clients:>8}{size:>11}{payload:>9}{frameBytes:>9.0f}{row['serverCpuPercent']:>10.1f}"
+                          f"{row['fpsPerClient']:>8.2f}{row['packetsPerSecond']:>9.0f}{row['lossPercent']:>7.2f}"
+                          f"{row['jitterMs']:>8.2f}{row['latencyP50Ms']:>9.1f}{row['latencyP99Ms']:>9.1f}")
+
+    for row in results:
+        print(f"\n{row['clients']} clients, {row['frameSize']}, payload {row['maxPayload']}:")
+        for stage in StageTimer.STAGES:
+            stats = row['stages'].get(stage)
+            if stats:
+                print(f"  {stage:<11}{stats['meanMs']:>9.3f} ms mean{stats['p50Ms']:>9.3f} p50{stats['p99Ms']:>9.3f} p99")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        printComparison(results, args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()